@@ -0,0 +1,91 @@
+"""
+Process-wide pools of long-lived smolagents agents.
+
+Building a CodeAgent (tools, system prompt, executor) is a fixed cost we used
+to pay for every transaction. A pool builds each agent once, hands it to one
+caller at a time, and resets its memory between runs, so agents are reused
+safely across threads.
+"""
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from llm_usage import record_steps
+
+
+class AgentPool:
+    """
+    A bounded, thread-safe pool of agents built lazily by `factory`
+    """
+
+    def __init__(self, factory, size=None):
+        self.factory = factory
+        self.size = max(1, int(size or os.environ.get("AGENT_POOL_SIZE", 4)))
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                build = True
+            else:
+                build = False
+        if build:
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        # Every agent is busy; wait for one to be returned
+        return self._idle.get()
+
+    @contextmanager
+    def acquire(self):
+        """
+        Borrow an agent for one run; it goes back to the pool with its memory cleared
+        """
+        agent = self._checkout()
+        try:
+            yield agent
+        finally:
+            reset_agent(agent)
+            self._idle.put(agent)
+
+    def run(self, task, **kwargs):
+        """
+        Run `task` on a pooled agent, starting from a fresh memory
+        """
+        with self.acquire() as agent:
+            try:
+                return agent.run(task, reset=True, **kwargs)
+            finally:
+                record_steps(count_steps(agent))
+
+
+def count_steps(agent):
+    """
+    Number of action steps in an agent's current run
+    """
+    memory = getattr(agent, "memory", None)
+    if memory is not None:
+        return sum(1 for step in getattr(memory, "steps", []) if type(step).__name__ == "ActionStep")
+    return len(getattr(agent, "logs", []))
+
+
+def reset_agent(agent):
+    """
+    Clear an agent's conversation state so the next run starts clean
+    """
+    memory = getattr(agent, "memory", None)
+    if memory is not None and hasattr(memory, "reset"):
+        memory.reset()
+    elif hasattr(agent, "logs"):
+        agent.logs = []
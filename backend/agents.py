@@ -14,24 +14,45 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 import os
 
-from smolagents import CodeAgent, LiteLLMModel, tool
+from smolagents import CodeAgent, tool
 
 # Import ExpensAI modules
 from config.base import config
 from parser_tools.statement_parser_tools import parse_amex_statement, parse_zolve_statement, parse_freedom_statement
 from analysis.anomaly_detector import analyze_transaction, get_human_feedback
+from llm_provider import create_model
+from prompt_caching import register_static_prefix
 # from storage.vector import upsert_transactions, store_monthly_summary, search_historical_summaries
 # from storage.sheets import update_expense_sheet, get_monthly_transactions
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+ANALYSIS_INSTRUCTIONS = register_static_prefix(
+    "Analyze the transaction given below.\n\n"
+    "Based on the analysis, either ask the human to provide feedback or clarification "
+    "on the transaction for future use (only if needed).\n\n"
+    "Craft a concise description to include with the transaction JSON object for future reference.\n\n"
+    "Also include the category of the transaction from [Housing, Grocery, Fun, Investment, Miscellaneous].\n\n"
+    "The output must strictly be a Python dictionary object, not a string representation, "
+    "and follow this structure:\n"
+    "{\n"
+    '    "amount": <<amount>>,\n'
+    '    "merchant": <<merchant>>,\n'
+    '    "date": <<date>>,\n'
+    '    "type": <<type_of_transaction>>,\n'
+    '    "description": <<description>>,\n'
+    '    "category": <<transaction_category>>,\n'
+    '    "card": <<card>>,\n'
+    "}\n"
+)
+
 class ExpenseAI:
     """Main ExpenseAI application class."""
 
     def __init__(self):
         """Initialize ExpenseAI with necessary components."""
-        self.model = LiteLLMModel(
+        self.model = create_model(
             model_id=config.llm.model,
             api_key=config.api.anthropic_api_key
         )
@@ -143,25 +164,8 @@ class ExpenseAI:
             analyzed_transactions = []
             
             for transaction in transactions:
-                # Define the transaction analysis prompt
-                analysis_prompt = (
-                    f"Can you analyze this transaction: {transaction}?\n\n"
-                    "Based on the analysis, either ask the human to provide feedback or clarification "
-                    "on the transaction for future use (only if needed).\n\n"
-                    "Craft a concise description to include with the transaction JSON object for future reference.\n\n"
-                    "Also include the category of the transaction from [Housing, Grocery, Fun, Investment, Miscellaneous].\n\n"
-                    "The output must strictly be a Python dictionary object, not a string representation, "
-                    "and follow this structure:\n"
-                    "{\n"
-                    '    "amount": <<amount>>,\n'
-                    '    "merchant": <<merchant>>,\n'
-                    '    "date": <<date>>,\n'
-                    '    "type": <<type_of_transaction>>,\n'
-                    '    "description": <<description>>,\n'
-                    '    "category": <<transaction_category>>,\n'
-                    '    "card": <<card>>,\n'
-                    "}"
-                )
+                # Static instructions first, transaction last, so the provider can cache the prefix
+                analysis_prompt = f"{ANALYSIS_INSTRUCTIONS}\nTransaction: {transaction}"
                 
                 transaction_analysis = self.analysis_agent.run(analysis_prompt)
                 if transaction_analysis:
@@ -10,11 +10,19 @@ from pydantic import BaseModel
 import asyncio
 from typing import Optional, Dict
 
-from pdf_handler import process_pdf_and_store
+from pdf_handler import (
+    process_pdf_and_store, learn_category_correction, embedding_cache,
+    start_background_job, sweep_provisional_periodically, prune_embedding_vectors_periodically
+)
+from deadline import Deadline
+from llm_usage import collect_stats, process_stats
+from llm_cache import shared_cache
+from similarity_cache import similarity_cache
 from database import (
     get_user_transactions, 
     get_monthly_summary,
-    update_transaction_category
+    update_transaction_category,
+    get_transaction_embedding
 )
 
 router = APIRouter()
@@ -98,6 +106,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_maintenance_jobs():
+    """Finish provisional rows whose background job did not survive a restart, and prune unused vectors"""
+    start_background_job(sweep_provisional_periodically())
+    start_background_job(prune_embedding_vectors_periodically())
+
 # JWT secret from Supabase (should match your Supabase JWT secret)
 JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
 
@@ -124,41 +138,47 @@ async def get_current_user(authorization: str = Header(None)):
 async def upload_files(
     files: List[UploadFile] = File(...),
     authorization: str = Header(None),
+    deadline: Optional[float] = None,
 ):
     """
-    Upload and process PDF files
+    Upload and process PDF files.
+    `deadline` is a time budget in seconds for the whole request (defaults to
+    UPLOAD_DEADLINE_SECONDS); rows not categorized in time are returned as
+    provisional and finished in the background.
     """
     user_id = await get_current_user(authorization)
 
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
+    budget = Deadline(deadline)
     results = []
-    
-    for file in files:
-        if file.content_type != "application/pdf":
-            results.append({
-                "filename": file.filename,
-                "error": "Not a PDF file"
-            })
-            continue
+    # LLM calls, agent steps, tokens and time per pipeline stage for this request
+    with collect_stats() as stats:
+        for file in files:
+            if file.content_type != "application/pdf":
+                results.append({
+                    "filename": file.filename,
+                    "error": "Not a PDF file"
+                })
+                continue
         
-        try:
-            # Process the PDF and store transactions
-            result = await process_pdf_and_store(file, user_id)
-            results.append({
-                "filename": file.filename,
-                "result": result
-            })
-        except Exception as e:
-            results.append({
-                "filename": file.filename,
-                "error": str(e)
-            })
-        finally:
-            await file.close()
+            try:
+                # Process the PDF and store transactions
+                result = await process_pdf_and_store(file, user_id, budget)
+                results.append({
+                    "filename": file.filename,
+                    "result": result
+                })
+            except Exception as e:
+                results.append({
+                    "filename": file.filename,
+                    "error": str(e)
+                })
+            finally:
+                await file.close()
     
-    return {"results": results}
+    return {"results": results, "stats": stats.as_dict()}
 
 @app.get("/transactions/{year}/{month}")
 async def get_transactions(
@@ -214,11 +234,28 @@ async def update_category(
     """
     Update transaction category and note
     """
+    # The label before the edit, for the classifiers to unlearn
+    previous = await get_transaction_embedding(transaction_id)
     try:
         result = await update_transaction_category(transaction_id, table_name, category, note)
-        return {"success": True, "transaction": result}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if result:
+        start_background_job(learn_category_correction(user_id, previous, category))
+    return {"success": True, "transaction": result}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    LLM calls, agent steps, tokens and time per pipeline stage since the process started,
+    plus LLM response, embedding and similarity search cache hit rates
+    """
+    return {
+        "stages": process_stats.as_dict(),
+        "llm_cache": shared_cache().stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "similarity_cache": similarity_cache.stats()
+    }
 
 @app.get("/")
 async def root():
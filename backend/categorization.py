@@ -0,0 +1,215 @@
+"""
+Prompt building and response validation for LLM transaction categorization.
+
+Batch mode sends many transactions in one call. Rows are packed into chunks
+under a token budget, and the model answers with a JSON list of
+{index, category, note} objects, one per row. Every object is validated
+against the category set. Rows that are missing, malformed or left
+undecided are returned to the caller for a per-row retry.
+"""
+import ast
+import json
+import os
+import re
+
+from prompt_caching import estimate_tokens, register_static_prefix
+
+CATEGORIES = ['Housing', 'Grocery', 'Fun', 'Investment', 'Utilities', 'Payments', 'Miscellaneous']
+
+_CATEGORY_LOOKUP = {c.lower(): c for c in CATEGORIES}
+
+BATCH_TOKEN_BUDGET = int(os.environ.get("CATEGORIZATION_BATCH_TOKENS", 2000))
+BATCH_MAX_ROWS = int(os.environ.get("CATEGORIZATION_BATCH_MAX_ROWS", 40))
+
+# The instruction blocks are static prompt prefixes marked for provider caching (see prompt_caching.py).
+# All three are shorter than MIN_CACHEABLE_TOKENS, so the provider does not cache them yet.
+BATCH_INSTRUCTIONS = register_static_prefix(f"""You are a financial analyst categorizing credit card transactions.
+
+For every numbered transaction below, choose exactly one category from {CATEGORIES}
+and write a concise note describing the charge for future reference.
+If a transaction is too ambiguous to categorize confidently, set its category to null.
+
+Output Format:
+Return only a JSON list with one object per transaction, nothing else:
+[{{"index": <transaction number>, "category": <category or null>, "note": <short note>}}]
+""")
+
+# Single-shot fast mode: one structured call per transaction, validated against the category enum
+CATEGORY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": CATEGORIES},
+        "note": {"type": "string"},
+    },
+    "required": ["category", "note"],
+    "additionalProperties": False,
+}
+
+CATEGORY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "transaction_category", "schema": CATEGORY_SCHEMA, "strict": True},
+}
+
+FAST_INSTRUCTIONS = register_static_prefix(f"""You are a financial analyst categorizing a credit card transaction.
+
+Choose exactly one category from {CATEGORIES} and write a concise note
+describing the charge for future reference. Similar past transactions of this
+user are listed when available; follow them unless the transaction clearly differs.
+
+Output Format:
+Return only a JSON object: {{"category": <category>, "note": <short note>}}
+""")
+
+# Task for the multi-step CodeAgent; the transaction is appended after this static block
+AGENT_INSTRUCTIONS = register_static_prefix(f"""You are a financial analyst assisting in transaction categorization and pattern recognition.
+
+Context:
+Analyze the given transaction based on your understanding and reasoning to categorize it.
+Refer to previous user transactions using the `get_historical_context` tool if relevant.
+Use your knowledge to craft a short note describing the charge type.
+
+Clarification:
+Only ask the user for feedback **if necessary**—specifically, when:
+- No relevant historical data is found.
+- The charge description is unclear.
+- The charge amount is unusual.
+
+Otherwise, categorize the transaction using logical inference.
+
+Output Format:
+Return a Python dictionary in this exact structure:
+
+{{
+    "category": <<One of {CATEGORIES}>>,
+    "note": <<Concise explanation of the transaction for future reference>>
+}}
+""")
+
+_JSON_LIST = re.compile(r'\[.*\]', re.DOTALL)
+
+
+def render_transaction(transaction):
+    """
+    Compact JSON rendering of the fields the LLM needs
+    """
+    fields = {k: transaction.get(k) for k in ('date', 'merchant', 'amount', 'card') if transaction.get(k) is not None}
+    return json.dumps(fields, default=str)
+
+
+def render_row(index, transaction):
+    """
+    One numbered prompt line for a transaction
+    """
+    return f"{index}. {render_transaction(transaction)}"
+
+
+def chunk_rows(rows, token_budget=None, max_rows=None):
+    """
+    Split (index, transaction) pairs into chunks whose rendered size stays under the token budget
+    """
+    token_budget = token_budget or BATCH_TOKEN_BUDGET
+    max_rows = max_rows or BATCH_MAX_ROWS
+    chunks, current, used = [], [], 0
+    for index, transaction in rows:
+        cost = estimate_tokens(render_row(index, transaction))
+        if current and (used + cost > token_budget or len(current) >= max_rows):
+            chunks.append(current)
+            current, used = [], 0
+        current.append((index, transaction))
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def batch_prompt_parts(chunk):
+    """
+    (static prefix, dynamic suffix) of the prompt asking for a category and note for every row of a chunk
+    """
+    lines = "\n".join(render_row(index, transaction) for index, transaction in chunk)
+    return BATCH_INSTRUCTIONS, f"Transactions:\n{lines}"
+
+
+def render_context(neighbours, limit=5):
+    """
+    Compact historical-context block built from similar past transactions
+    """
+    lines = []
+    for neighbour in (neighbours or [])[:limit]:
+        fields = {k: neighbour.get(k) for k in ('merchant', 'amount', 'category', 'note') if neighbour.get(k) is not None}
+        if fields:
+            lines.append(f"- {json.dumps(fields, default=str)}")
+    return "\n".join(lines) if lines else "None found"
+
+
+def fast_prompt_parts(transaction, neighbours=None):
+    """
+    (static prefix, dynamic suffix) of a single structured categorization call with pre-fetched historical context
+    """
+    return FAST_INSTRUCTIONS, (
+        f"Similar past transactions:\n{render_context(neighbours)}\n\n"
+        f"Transaction: {render_transaction(transaction)}"
+    )
+
+
+def build_agent_task(transaction):
+    """
+    CodeAgent task for one transaction: the static instructions, then the transaction
+    """
+    return f"{AGENT_INSTRUCTIONS}\nTransaction: {transaction}"
+
+
+def validate_analysis(analysis):
+    """
+    Return a clean {'category', 'note'} dict, or None if the analysis is unusable
+    """
+    if isinstance(analysis, str):
+        match = re.search(r'\{.*\}', analysis, re.DOTALL)
+        if not match:
+            return None
+        for loads in (json.loads, ast.literal_eval):
+            try:
+                analysis = loads(match.group(0))
+                break
+            except (ValueError, SyntaxError):
+                continue
+    if not isinstance(analysis, dict):
+        return None
+    category = analysis.get('category')
+    if not isinstance(category, str):
+        return None
+    category = _CATEGORY_LOOKUP.get(category.strip().lower())
+    if not category:
+        return None
+    note = analysis.get('note')
+    note = note.strip() if isinstance(note, str) else ''
+    return {'category': category, 'note': note}
+
+
+def parse_batch_response(text, indices):
+    """
+    Parse a batch response into {index: {'category', 'note'}} for the rows that validated
+    """
+    if not isinstance(text, str):
+        text = json.dumps(text, default=str) if isinstance(text, (list, dict)) else str(text)
+    match = _JSON_LIST.search(text)
+    if not match:
+        return {}
+    try:
+        items = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+
+    expected = set(indices)
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get('index'))
+        except (TypeError, ValueError):
+            continue
+        analysis = validate_analysis(item)
+        if index in expected and analysis:
+            results[index] = analysis
+    return results
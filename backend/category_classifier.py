@@ -0,0 +1,275 @@
+"""
+Lightweight first-tier categorizer over transaction embeddings.
+
+A nearest-centroid classifier keeps one running sum of unit-normalized
+embeddings per category. Training is incremental: stored transactions add to
+their category and user corrections move a vector from the old category to
+the new one. Probabilities are a softmax over cosine similarity to each
+centroid, with a temperature calibrated on leave-one-out predictions over a
+window of recent samples. Each category's share is then discounted by how few
+samples it has, so a category seen a handful of times is never a confident
+answer. Inference is a single small matrix product, so the LLM is only called
+when the top probability falls below CLASSIFIER_MIN_CONFIDENCE.
+
+Classifiers are trained and queried on embeddings of the same text, the
+merchant lookup query (knn_categorizer.transaction_query_text).
+"""
+import os
+import threading
+
+import numpy as np
+
+from categorization import CATEGORIES
+
+CLASSIFIER_DIR = os.environ.get("CLASSIFIER_DIR", "model_cache/classifiers")
+CLASSIFIER_MIN_CONFIDENCE = float(os.environ.get("CLASSIFIER_MIN_CONFIDENCE", 0.9))
+CLASSIFIER_MIN_SAMPLES = int(os.environ.get("CLASSIFIER_MIN_SAMPLES", 30))
+# Pseudo-count of the discount: a category with n samples keeps n / (n + prior) of its probability
+CLASSIFIER_PRIOR = float(os.environ.get("CLASSIFIER_PRIOR", 3))
+# Recent samples kept per classifier to recalibrate the temperature after incremental training
+CLASSIFIER_CALIBRATION_SAMPLES = int(os.environ.get("CLASSIFIER_CALIBRATION_SAMPLES", 500))
+
+_TEMPERATURES = np.geomspace(0.005, 1.0, 40)
+
+
+def _normalize(X):
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.where(norms == 0, 1.0, norms)
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class CentroidClassifier:
+    """
+    Incremental nearest-centroid classifier with temperature-calibrated probabilities
+    """
+
+    def __init__(self, categories=None, temperature=0.05, prior=None):
+        self.categories = list(categories or CATEGORIES)
+        self._index = {c: i for i, c in enumerate(self.categories)}
+        self.temperature = temperature
+        self.prior = CLASSIFIER_PRIOR if prior is None else prior
+        self.sums = None
+        self.counts = np.zeros(len(self.categories), dtype=np.float64)
+        # Calibration window: recent samples and their category indexes
+        self.recent = None
+        self.recent_labels = np.zeros(0, dtype=np.int64)
+        self.uncalibrated = 0
+
+    @property
+    def n_samples(self):
+        return int(self.counts.sum())
+
+    def partial_fit(self, X, y, weight=1.0):
+        """
+        Add (or, with a negative weight, remove) labeled embeddings
+        """
+        X = _normalize(X)
+        if self.sums is None:
+            self.sums = np.zeros((len(self.categories), X.shape[1]), dtype=np.float64)
+        added = []
+        for x, label in zip(X, y):
+            i = self._index.get(label)
+            if i is None:
+                continue
+            self.sums[i] += weight * x
+            self.counts[i] = max(self.counts[i] + weight, 0.0)
+            if self.counts[i] == 0:
+                self.sums[i] = 0.0
+            if weight < 0:
+                self._forget(x, i)
+            else:
+                added.append((x, i))
+        if added:
+            added = added[-CLASSIFIER_CALIBRATION_SAMPLES:]
+            recent = np.array([x for x, _ in added])
+            self.recent = recent if self.recent is None else np.vstack([self.recent, recent])
+            self.recent_labels = np.append(self.recent_labels, [i for _, i in added])
+            self.recent = self.recent[-CLASSIFIER_CALIBRATION_SAMPLES:]
+            self.recent_labels = self.recent_labels[-CLASSIFIER_CALIBRATION_SAMPLES:]
+            self.uncalibrated += len(added)
+        return self
+
+    def _forget(self, x, i):
+        """
+        Drop a removed sample from the calibration window
+        """
+        if self.recent is None:
+            return
+        same = np.flatnonzero((self.recent_labels == i) & (self.recent @ x > 1 - 1e-6))
+        if len(same):
+            self.recent = np.delete(self.recent, same[-1], axis=0)
+            self.recent_labels = np.delete(self.recent_labels, same[-1])
+        self.uncalibrated += 1
+
+    def _similarities(self, X):
+        centroids = _normalize(self.sums)
+        sims = X @ centroids.T
+        sims[:, self.counts == 0] = -np.inf
+        return sims
+
+    def predict_proba(self, X):
+        """
+        Calibrated probability of every category for each row of X. Each trained
+        category keeps counts / (counts + prior) of its softmax share; the rest is
+        spread evenly over all categories.
+        """
+        X = _normalize(X)
+        uniform = np.full((X.shape[0], len(self.categories)), 1.0 / len(self.categories))
+        if self.sums is None or not self.counts.any():
+            return uniform
+        proba = _softmax(self._similarities(X) / self.temperature)
+        proba *= self.counts / (self.counts + self.prior)
+        return proba + uniform * (1.0 - proba.sum(axis=1, keepdims=True))
+
+    def predict(self, x):
+        """
+        Return (category, probability) for a single embedding
+        """
+        proba = self.predict_proba(x)[0]
+        i = int(np.argmax(proba))
+        return self.categories[i], float(proba[i])
+
+    def calibrate(self, X=None, y=None):
+        """
+        Fit the softmax temperature by minimizing leave-one-out negative log-likelihood
+        on X and y, by default the calibration window
+        """
+        if X is None:
+            X, labels = self.recent, self.recent_labels
+        else:
+            X = _normalize(X)
+            labels = np.array([self._index.get(label, -1) for label in y])
+            keep = labels >= 0
+            X, labels = X[keep], labels[keep]
+        self.uncalibrated = 0
+        if X is None or len(labels) < 2 or self.sums is None:
+            return self.temperature
+
+        # Similarity to every centroid, with each sample removed from its own class
+        rows = np.arange(len(labels))
+        own = self.sums[labels] - X
+        sims = X @ _normalize(self.sums).T
+        own_norm = np.linalg.norm(own, axis=1)
+        sims[rows, labels] = np.where(own_norm > 0, np.einsum('ij,ij->i', X, own) / np.where(own_norm > 0, own_norm, 1.0), -np.inf)
+        sims[:, self.counts == 0] = -np.inf
+        valid = np.isfinite(sims[rows, labels])
+        if not valid.any():
+            return self.temperature
+        sims, labels, rows = sims[valid], labels[valid], np.arange(valid.sum())
+
+        best, best_nll = self.temperature, np.inf
+        for t in _TEMPERATURES:
+            nll = -np.log(_softmax(sims / t)[rows, labels] + 1e-12).mean()
+            if nll < best_nll:
+                best, best_nll = float(t), nll
+        self.temperature = best
+        return best
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, sums=self.sums if self.sums is not None else np.zeros((0, 0)),
+                 counts=self.counts, temperature=self.temperature, categories=np.array(self.categories),
+                 recent=self.recent if self.recent is not None else np.zeros((0, 0)),
+                 recent_labels=self.recent_labels)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        clf = cls(categories=[str(c) for c in data['categories']], temperature=float(data['temperature']))
+        clf.counts = data['counts']
+        clf.sums = data['sums'] if data['sums'].size else None
+        if 'recent' in data and data['recent'].size:
+            clf.recent = data['recent']
+            clf.recent_labels = data['recent_labels']
+        return clf
+
+
+class ClassifierStore:
+    """
+    Per-user classifiers plus a global one, persisted under CLASSIFIER_DIR
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or CLASSIFIER_DIR
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        # Named after the training text, so models trained on note embeddings are not reused
+        return os.path.join(self.directory, f"{key}.merchant-query.npz")
+
+    def get(self, key):
+        """
+        Classifier for a user id (or 'global'), loaded from disk or empty
+        """
+        with self._lock:
+            clf = self._models.get(key)
+            if clf is None:
+                path = self._path(key)
+                clf = CentroidClassifier.load(path) if os.path.exists(path) else CentroidClassifier()
+                self._models[key] = clf
+            return clf
+
+    def has_model(self, key):
+        return key in self._models or os.path.exists(self._path(key))
+
+    def for_user(self, user_id):
+        """
+        The user's own classifier once it has enough samples, else the global one
+        if that has; None while neither does
+        """
+        for key in (user_id, 'global'):
+            clf = self.get(key)
+            if clf.n_samples >= CLASSIFIER_MIN_SAMPLES:
+                return clf
+        return None
+
+    def learn(self, user_id, embedding, category, weight=1.0):
+        """
+        Add one labeled embedding to the user's and the global classifier
+        """
+        self.learn_batch(user_id, [embedding], [category], weight)
+
+    def learn_batch(self, user_id, embeddings, categories, weight=1.0):
+        """
+        Add labeled embeddings to the user's and the global classifier
+        """
+        for key in (user_id, 'global'):
+            self.get(key).partial_fit(embeddings, categories, weight)
+
+    def correct(self, user_id, embedding, old_category, new_category):
+        """
+        Move a corrected embedding from its old category to the new one
+        """
+        if old_category and old_category != new_category:
+            self.learn(user_id, embedding, old_category, weight=-1.0)
+        self.learn(user_id, embedding, new_category)
+
+    def train(self, key, X, y):
+        """
+        Rebuild a classifier from scratch and calibrate it
+        """
+        clf = CentroidClassifier()
+        if len(y):
+            clf.partial_fit(X, y)
+            clf.calibrate(X, y)
+        with self._lock:
+            self._models[key] = clf
+        return clf
+
+    def save(self, *keys):
+        """
+        Persist classifiers, recalibrating those trained incrementally since their last calibration
+        """
+        for key in keys:
+            clf = self._models.get(key)
+            if clf is not None and clf.sums is not None:
+                if clf.uncalibrated:
+                    clf.calibrate()
+                clf.save(self._path(key))
@@ -0,0 +1,79 @@
+"""
+Per-user merchant -> category memo.
+
+Recurring charges (NYCT PAYGO, CLAUDE.AI SUBSCRIPTION, INSTACART) are already
+answered by the user's own history. The memo table keeps, for every
+(user, merchant_key, category), a weight accumulated from stored transactions
+and user corrections. A merchant is answered from the memo without calling
+the LLM only when it has enough weight and its top category is consistent
+enough.
+"""
+import os
+
+MEMO_MIN_WEIGHT = int(os.environ.get("CATEGORY_MEMO_MIN_WEIGHT", 3))
+MEMO_MIN_AGREEMENT = float(os.environ.get("CATEGORY_MEMO_MIN_AGREEMENT", 0.9))
+USER_EDIT_WEIGHT = int(os.environ.get("CATEGORY_MEMO_USER_EDIT_WEIGHT", 5))
+
+
+class CategoryMemo:
+    """
+    In-memory view of one user's memo rows, with hit accounting for an upload
+    """
+
+    def __init__(self, rows=None):
+        # merchant_key -> {category: [weight, note]}
+        self.entries = {}
+        for row in rows or []:
+            self.add(row.get('merchant_key'), row.get('category'), row.get('note'), row.get('weight', 1))
+        self.lookups = 0
+        self.hits = 0
+
+    def add(self, merchant_key, category, note=None, weight=1):
+        """
+        Count one more observation of `category` for `merchant_key`
+        """
+        if not merchant_key or not category:
+            return
+        entry = self.entries.setdefault(merchant_key, {}).setdefault(category, [0, None])
+        entry[0] += weight
+        if note:
+            entry[1] = note
+
+    def best(self, merchant_key):
+        """
+        Return (category, note, weight, agreement) for the merchant's top category, or None
+        """
+        categories = self.entries.get(merchant_key)
+        if not categories:
+            return None
+        total = sum(weight for weight, _ in categories.values())
+        if total <= 0:
+            return None
+        category, (weight, note) = max(categories.items(), key=lambda item: item[1][0])
+        return category, note, weight, weight / total
+
+    def lookup(self, merchant_key):
+        """
+        Return an analysis for `merchant_key` if the memo is confident and consistent enough, else None
+        """
+        if not merchant_key:
+            return None
+        self.lookups += 1
+        best = self.best(merchant_key)
+        if not best:
+            return None
+        category, note, weight, agreement = best
+        if weight < MEMO_MIN_WEIGHT or agreement < MEMO_MIN_AGREEMENT:
+            return None
+        self.hits += 1
+        return {'category': category, 'note': note or '', 'source': 'memo'}
+
+    def stats(self):
+        """
+        Lookup and hit counts for reporting
+        """
+        return {
+            'memo_lookups': self.lookups,
+            'memo_hits': self.hits,
+            'memo_hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+        }
@@ -3,8 +3,32 @@ import json
 from datetime import datetime
 from supabase import create_client, Client
 from dotenv import load_dotenv
+
+from money import cents_array, sum_cents, group_sum_cents, cents_to_dollars
 load_dotenv()  # Load environment variables from .env file
 
+def summarize_transactions(transactions):
+    """
+    Compute a monthly summary from transaction rows with exact int64 cent arithmetic.
+
+    Expenses are the positive charges and income the negative ones, matching the
+    totals the dashboard computes. Returns the same keys as the monthly_summaries table.
+    """
+    cents = cents_array(t.get('charge', 0) for t in transactions)
+    expense_mask = cents > 0
+    expense_rows = [t for t, is_expense in zip(transactions, expense_mask) if is_expense]
+    expenses = cents[expense_mask]
+
+    by_card = group_sum_cents([t.get('card') or 'UNKNOWN' for t in expense_rows], expenses)
+    by_category = group_sum_cents([t.get('category') or 'Miscellaneous' for t in expense_rows], expenses)
+
+    return {
+        'total_expenses': cents_to_dollars(sum_cents(expenses)),
+        'total_income': cents_to_dollars(sum_cents(cents[cents < 0])),
+        'expenses_by_card': {k: cents_to_dollars(v) for k, v in by_card.items()},
+        'expenses_by_category': {k: cents_to_dollars(v) for k, v in by_category.items()},
+    }
+
 def calculate_monthly_summaries(
     month=None, 
     year=None, 
@@ -1,9 +1,22 @@
 import os
+import json
+import hashlib
+import threading
+import time
 from supabase import create_client, Client
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
+from money import to_cents, format_cents
+from compute_summaries import summarize_transactions
+from merchant_normalizer import normalize_merchant
+from category_memo import USER_EDIT_WEIGHT
+from vector_index import VectorIndexStore, SIMILARITY_MAX_REFERENCES
+from embedding_codec import embedding_codec
+from similarity_cache import similarity_cache, query_signature
+from db_executor import offloaded
+
 load_dotenv()  # Load variables from .env into the environment
 
 # Initialize Supabase client
@@ -11,6 +24,37 @@ supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
 supabase: Client = create_client(supabase_url, supabase_key)
 
+# Per-user similarity search runs on local IVF indexes (see vector_index.py);
+# VECTOR_INDEX=rpc sends it to the find_similar_transactions RPC instead
+VECTOR_INDEX = os.environ.get("VECTOR_INDEX", "local").lower()
+# Dimension of the transaction_embeddings.embedding pgvector column
+PGVECTOR_DIMENSIONS = 1024
+# Compact embeddings (see embedding_codec.py) are stored in the embedding_compact
+# bytea column and indexed locally at their truncated dimension.
+# VECTOR_INDEX_DTYPE=float16 halves index memory; scans cost more CPU to widen rows
+COMPACT_EMBEDDINGS = embedding_codec.format != 'float32' or bool(embedding_codec.dimensions)
+if VECTOR_INDEX == "rpc" and embedding_codec.dimensions:
+    # Truncated vectors are never written to the pgvector column the RPC searches
+    raise ValueError("VECTOR_INDEX=rpc needs full 1024-dimension embeddings; unset EMBEDDING_DIMENSIONS")
+vector_indexes = VectorIndexStore(
+    dim=embedding_codec.dimensions or PGVECTOR_DIMENSIONS,
+    dtype=os.environ.get("VECTOR_INDEX_DTYPE", "float32")
+)
+# Unreferenced embedding vectors are kept this long after their last lookup
+EMBEDDING_PRUNE_GRACE_SECONDS = int(os.environ.get("EMBEDDING_PRUNE_GRACE_SECONDS", 3600))
+# Local indexes catch up with rows written by other processes at most this often
+VECTOR_INDEX_SYNC_SECONDS = float(os.environ.get("VECTOR_INDEX_SYNC_SECONDS", 60))
+# A catch-up re-reads rows updated this long before the last one it saw, because
+# updated_at is stamped when a write starts and rows can commit out of order
+VECTOR_INDEX_SYNC_OVERLAP_SECONDS = float(os.environ.get("VECTOR_INDEX_SYNC_OVERLAP_SECONDS", 300))
+# Per-user locks so an index is built or caught up by one thread at a time
+vector_index_locks = {}
+# A provisional row's claim (see claim_provisional_transactions) lapses after this
+# long, so a sweep can take over a row whose background job was lost
+PROVISIONAL_CLAIM_SECONDS = int(os.environ.get("PROVISIONAL_CLAIM_SECONDS", 900))
+# Rows per request of the bulk write path (store_transactions, store_embeddings)
+DB_WRITE_BATCH_SIZE = int(os.environ.get("DB_WRITE_BATCH_SIZE", 500))
+
 def get_table_name_for_date(date):
     """
     Generate the appropriate table name for a given date
@@ -19,21 +63,51 @@ def get_table_name_for_date(date):
     year = date.year
     return f"transactions_{month:02d}_{year}"
 
-async def store_transaction(user_id, transaction_data):
+def transaction_row(user_id, transaction_data):
     """
-    Store a transaction in the appropriate monthly partition
+    The transactions table row for a parsed transaction
     """
+    # Amounts travel as integer cents and are written as exact decimal strings
+    if 'amount_cents' in transaction_data:
+        amount_cents = int(transaction_data['amount_cents'])
+    else:
+        amount_cents = to_cents(transaction_data.get('amount', 0))
+
     # Prepare transaction data
     transaction = {
         'user_id': user_id,
         'date': transaction_data.get('date').strftime('%Y-%m-%d'),
         'merchant': transaction_data.get('merchant'),
-        'charge': float(transaction_data.get('amount', 0)),
+        'merchant_key': transaction_data.get('merchant_key') or normalize_merchant(transaction_data.get('merchant')),
+        'charge': format_cents(amount_cents),
         'card': transaction_data.get('card', 'UNKNOWN'),
         'category': transaction_data.get('category'),
-        'note': transaction_data.get('note')
+        'note': transaction_data.get('note'),
+        'provisional': bool(transaction_data.get('provisional', False))
     }
-    
+    # A provisional row is claimed by the upload that stores it, for its background job
+    transaction['claimed_at'] = datetime.now(timezone.utc).isoformat() if transaction['provisional'] else None
+    return transaction
+
+def dedupe_key(transaction, ordinal=0):
+    """
+    Natural key of a transactions row: user, date, merchant, charge and card, plus
+    the `ordinal` of identical rows earlier in the same statement (two equal coffees
+    on one day stay two rows, while a retried upload maps onto the same keys)
+    """
+    fields = [transaction.get(name) for name in ('user_id', 'date', 'merchant', 'charge', 'card')]
+    return hashlib.sha256("\x1f".join(str(field) for field in fields + [ordinal]).encode("utf-8")).hexdigest()
+
+def batches(rows, batch_size=None):
+    batch_size = batch_size or DB_WRITE_BATCH_SIZE
+    return [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+
+@offloaded
+def store_transaction(user_id, transaction_data):
+    """
+    Store a transaction in the appropriate monthly partition
+    """
+    transaction = transaction_row(user_id, transaction_data)
     table_name = 'transactions'
     print("Inserting transaction:", transaction_data)
     # Insert transaction into the appropriate table
@@ -48,6 +122,72 @@ async def store_transaction(user_id, transaction_data):
     print("Transaction inserted successfully:", result.data)
     return result.data[0] if result.data else None
 
+@offloaded
+def store_transactions(user_id, transactions, batch_size=None):
+    """
+    Store a statement's transactions in batched inserts that skip rows already
+    stored under the same dedupe_key, so a retried upload neither duplicates rows
+    nor overwrites categories and notes the user has edited since. Returns
+    (stored row or None, whether this call created it) for each input
+    transaction, in input order; existing rows come back as stored.
+    """
+    rows, seen = [], {}
+    for transaction_data in transactions:
+        row = transaction_row(user_id, transaction_data)
+        base = dedupe_key(row)
+        seen[base] = seen.get(base, -1) + 1
+        row['dedupe_key'] = dedupe_key(row, seen[base])
+        rows.append(row)
+
+    stored, created = {}, set()
+    for batch in batches(rows, batch_size):
+        try:
+            # The unique index includes date, the partition key of transactions
+            result = supabase.table("transactions") \
+                .upsert(batch, on_conflict="dedupe_key,date", ignore_duplicates=True) \
+                .execute()
+            stored.update((row['dedupe_key'], row) for row in result.data)
+            created.update(row['dedupe_key'] for row in result.data)
+            existing = [row['dedupe_key'] for row in batch if row['dedupe_key'] not in stored]
+            for keys in batches(existing, 100):
+                result = supabase.table("transactions") \
+                    .select("*") \
+                    .eq("user_id", user_id) \
+                    .in_("dedupe_key", keys) \
+                    .execute()
+                stored.update((row['dedupe_key'], row) for row in result.data)
+        except Exception as e:
+            print(f"Unexpected error storing {len(batch)} transactions: {e}")
+    print(f"Stored {len(created)} new and found {len(stored) - len(created)} existing of {len(rows)} transactions")
+    return [(stored.get(row['dedupe_key']), row['dedupe_key'] in created) for row in rows]
+
+def backfill_merchant_keys(user_id=None, batch_size=500):
+    """
+    Fill merchant_key for stored transactions that predate merchant normalization
+    """
+    updated = 0
+    while True:
+        query = supabase.table("transactions") \
+            .select("id, merchant") \
+            .is_("merchant_key", "null")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        try:
+            result = query.limit(batch_size).execute()
+        except Exception as e:
+            print(f"Unexpected backfill error: {e}")
+            break
+        if not result.data:
+            break
+        for row in result.data:
+            supabase.table("transactions") \
+                .update({'merchant_key': normalize_merchant(row.get('merchant')) or ''}) \
+                .eq("id", row['id']) \
+                .execute()
+        updated += len(result.data)
+    print(f"Backfilled merchant keys for {updated} transactions")
+    return updated
+
 def create_partition_if_needed(month, year):
     """
     Call the database function to create a monthly partition if it doesn't exist
@@ -64,50 +204,247 @@ def create_partition_if_needed(month, year):
     except Exception as e:
         print(f"Unexpected error: {e}")
 
-async def store_embedding(transaction_id, table_name, embedding, metadata=None):
+def embedding_columns(embedding):
+    """
+    Vector columns to write for an embedding: the packed compact column and/or the pgvector column
+    """
+    columns = {}
+    full_size = len(embedding) == PGVECTOR_DIMENSIONS
+    if embedding_codec.format != 'float32' or not full_size:
+        # Packed bytes instead of ~20 KB of JSON floats
+        columns['embedding_compact'] = embedding_codec.to_bytea(embedding)
+    if full_size and (embedding_codec.format == 'float32' or VECTOR_INDEX == "rpc"):
+        # The RPC similarity search needs the pgvector column
+        columns['embedding'] = embedding
+    return columns
+
+def acquire_embedding_vectors(vectors, batch_size=None):
+    """
+    Ids of the shared embedding_vectors rows for a {content_key: embedding} dict.
+    Vectors are only sent for texts that have not been embedded before. Known
+    vectors are stamped as acquired, so prune_embedding_vectors leaves them alone
+    until the rows referencing them are written.
+    """
+    ids = {}
+    keys = list(vectors)
+    try:
+        for batch in batches(keys, batch_size):
+            result = supabase.rpc('acquire_embedding_vectors', {'p_content_hashes': batch}).execute()
+            ids.update((row['content_hash'], row['id']) for row in result.data or [])
+        missing = [{'content_hash': key, 'embedding': None, 'embedding_compact': None, **embedding_columns(vectors[key])}
+                   for key in keys if key not in ids]
+        for batch in batches(missing, batch_size):
+            result = supabase.table("embedding_vectors").upsert(batch, on_conflict="content_hash").execute()
+            ids.update((row['content_hash'], row['id']) for row in result.data)
+    except Exception as e:
+        print(f"Unexpected embedding vector error: {e}")
+    return ids
+
+async def store_embedding(transaction_id, table_name, embedding, metadata=None, content_key=None):
     """
     Store a vector embedding for a transaction
+    With a `content_key` (hash of the model and normalized embedded text), the
+    vector is stored once in embedding_vectors and the transaction references it.
     """
-    # Prepare embedding data
-    embedding_data = {
-        'transaction_table': table_name,
+    stored = await store_embeddings([{
         'transaction_id': transaction_id,
+        'table_name': table_name,
         'embedding': embedding,
-        'metadata': metadata or {}
-    }
-    
-    # Insert embedding
+        'metadata': metadata,
+        'content_key': content_key
+    }])
+    return stored[0]
+
+@offloaded
+def store_embeddings(embeddings, batch_size=None):
+    """
+    Store many transaction embeddings in batched upserts on transaction_id, so a
+    retry does not duplicate rows. `embeddings` holds dicts of store_embedding's
+    arguments. Returns the stored row (or None) for each, in input order.
+    """
+    vector_ids = acquire_embedding_vectors(
+        {item['content_key']: item['embedding'] for item in embeddings if item.get('content_key')}, batch_size
+    )
+    rows = []
+    for item in embeddings:
+        # Every row of a bulk request needs the same columns
+        row = {
+            'transaction_table': item['table_name'],
+            'transaction_id': item['transaction_id'],
+            'metadata': item.get('metadata') or {},
+            'vector_id': vector_ids.get(item.get('content_key')),
+            'embedding': None,
+            'embedding_compact': None
+        }
+        if row['vector_id'] is None:
+            row.update(embedding_columns(item['embedding']))
+        rows.append(row)
+
+    stored = {}
+    for batch in batches(rows, batch_size):
+        try:
+            result = supabase.table("transaction_embeddings").upsert(batch, on_conflict="transaction_id").execute()
+            stored.update((row['transaction_id'], row) for row in result.data)
+        except Exception as e:
+            print(f"Unexpected embdeddings error: {e}")
+
+    # Keep the users' local similarity indexes and cached search results current
+    for user_id in {(item.get('metadata') or {}).get('user_id') for item in embeddings if item['transaction_id'] in stored}:
+        if user_id:
+            similarity_cache.invalidate(user_id)
+    for item in embeddings:
+        user_id = (item.get('metadata') or {}).get('user_id')
+        if item['transaction_id'] in stored and user_id and VECTOR_INDEX == "local":
+            try:
+                local_vector_index(user_id).add(item['transaction_id'], item['embedding'], item.get('metadata'),
+                                                key=item.get('content_key'))
+            except Exception as e:
+                print(f"Error adding to local vector index: {e}")
+    return [stored.get(item['transaction_id']) for item in embeddings]
+
+@offloaded
+def prune_embedding_vectors(grace_seconds=None):
+    """
+    Delete shared embedding vectors no transaction references any more and none
+    acquired within `grace_seconds`; returns how many
+    """
+    grace_seconds = EMBEDDING_PRUNE_GRACE_SECONDS if grace_seconds is None else grace_seconds
     try:
-        result = supabase.table("transaction_embeddings").insert(embedding_data).execute()
-        # print(result.data)
+        pruned = supabase.rpc('prune_embedding_vectors', {'p_grace_seconds': int(grace_seconds)}).execute().data
+        print(f"Pruned {pruned} unreferenced embedding vectors")
+        return pruned
     except Exception as e:
-        print(f"Unexpected embdeddings error: {e}")
-    
-    return result.data[0] if result.data else None
+        print(f"Unexpected embedding vector error: {e}")
+        return 0
+
+def local_vector_index(user_id):
+    """
+    The user's local IVF index, built from their stored embeddings on first use.
+    Searches wait while another thread builds it, and a failed build installs
+    nothing. Every VECTOR_INDEX_SYNC_SECONDS the index picks up rows updated
+    since its last sync: rows written or relabeled by other workers, or while VECTOR_INDEX=rpc.
+    """
+    with vector_index_locks.setdefault(user_id, threading.Lock()):
+        if not vector_indexes.exists(user_id):
+            rows, synced_through = index_rows(user_id)
+            index = vector_indexes.build(user_id, rows, synced_through)
+            print(f"Built local vector index for user {user_id} from {len(rows)} embeddings")
+        else:
+            index = vector_indexes.get(user_id)
+        if time.monotonic() - index.synced_at >= VECTOR_INDEX_SYNC_SECONDS:
+            since = None
+            if index.synced_through:
+                since = datetime.fromisoformat(index.synced_through) - timedelta(seconds=VECTOR_INDEX_SYNC_OVERLAP_SECONDS)
+            rows, synced_through = index_rows(user_id, updated_since=since)
+            changed = [row for row in rows if not index.indexed(row[0], row[2])]
+            for transaction_id, embedding, metadata, content_key in changed:
+                index.add(transaction_id, embedding, metadata, key=content_key)
+            index.set_synced_through(synced_through)
+            index.synced_at = time.monotonic()
+            if changed:
+                similarity_cache.invalidate(user_id)
+                print(f"Caught up local vector index for user {user_id} with {len(changed)} embeddings")
+        return index
 
-def find_similar_transactions(embedding, limit=5):
+def index_rows(user_id, updated_since=None):
+    """
+    A user's stored embeddings updated at or after `updated_since` as
+    (transaction_id, embedding, metadata, content key) rows, and the latest
+    updated_at read as an ISO timestamp. Raises on read errors, so an index is
+    never built from a partial history.
+    """
+    rows, synced_through = [], None
+    for row in iter_embedding_rows(user_id, "transaction_id, updated_at, embedding, metadata",
+                                   updated_since=updated_since, raise_errors=True):
+        updated_at = datetime.fromisoformat(row['updated_at'])
+        synced_through = max(synced_through or updated_at, updated_at)
+        embedding = row_embedding(row)
+        if embedding is not None:
+            content_key = (row.get('embedding_vectors') or {}).get('content_hash')
+            rows.append((row.get('transaction_id'), embedding, row.get('metadata') or {}, content_key))
+    return rows, synced_through and synced_through.isoformat(timespec='microseconds')
+
+def find_similar_transactions(embedding, limit=5, match_threshold=0.8, with_similarity=False, user_id=None,
+                              category=None, card=None, category_probe=None, default=()):
     """
     Find transactions with similar embeddings using vector similarity search
-    Returns the metadata of the most similar transactions
+    Returns the metadata of the most similar transactions, with each match's
+    similarity added under 'similarity' when `with_similarity` is set.
+    With a `user_id`, only that user's transactions are searched, on the local
+    index (or the user-scoped RPC). `category` and `card` restrict the search to
+    those partitions; `category_probe` limits it to the partitions of the query's
+    N closest category centroids. User-scoped searches rank distinct embedded
+    texts and return up to SIMILARITY_MAX_REFERENCES referencing transactions for each.
+    User-scoped results are cached until the user's embeddings change (see similarity_cache.py).
+    A failed search returns `default` if given, else no matches.
+    """
+    search = (embedding, limit, match_threshold, user_id, category, card, category_probe)
+    if user_id:
+        key = ('vector', query_signature(embedding), limit, match_threshold, category, card, category_probe)
+        matches = similarity_cache.get(user_id, key)
+        if matches is None:
+            generation = similarity_cache.generation(user_id)
+            matches = search_similar_transactions(*search)
+            if matches is not None:
+                similarity_cache.put(user_id, key, matches, generation)
+    else:
+        matches = search_similar_transactions(*search)
+    if matches is None and default != ():
+        return default
+    if with_similarity:
+        return [dict(match) for match in matches or []]
+    return [{k: v for k, v in match.items() if k != 'similarity'} for match in matches or []]
+
+def search_similar_transactions(embedding, limit, match_threshold, user_id, category, card, category_probe):
     """
+    Uncached search for find_similar_transactions: matches with their 'similarity', or None on error
+    """
+    if user_id and VECTOR_INDEX == "local":
+        try:
+            local_vector_index(user_id)
+            matches = vector_indexes.search(user_id, embedding, limit, match_threshold, category=category,
+                                            card=card, category_probe=category_probe)
+            print(f"Found {len(matches)} similar transactions")
+            return matches
+        except Exception as e:
+            print(f"Error searching local vector index, falling back to RPC: {e}")
+    params = {
+        'query_embedding': embedding,
+        'match_threshold': match_threshold,
+        'match_count': limit
+    }
+    if user_id:
+        # User-scoped overload from migrations/006_embedding_vectors.sql
+        params.update({
+            'p_user_id': user_id,
+            'p_category': category,
+            'p_card': card,
+            'p_category_probe': category_probe,
+            'p_max_references': SIMILARITY_MAX_REFERENCES
+        })
     try:
-        result = supabase.rpc(
-            'find_similar_transactions',
-            {
-                'query_embedding': embedding,
-                'match_threshold': 0.8,
-                'match_count': limit
-            }
-        ).execute()
+        result = supabase.rpc('find_similar_transactions', params).execute()
         
         print(f"Found {len(result.data)} similar transactions")
-        final_result = [result['metadata'] for result in result.data]  # Extract metadata from results
-        return final_result
+        return [{**(row.get('metadata') or {}), 'similarity': row.get('similarity')} for row in result.data]
     except Exception as e:
         print(f"Error finding similar transactions: {e}")
-        return []
+        return None
+
+@offloaded
+def refresh_category_centroids(user_id):
+    """
+    Recompute the user's per-category embedding centroids used by the RPC's category probing
+    """
+    if VECTOR_INDEX == "local":
+        return  # The local index keeps its centroids current on every insert
+    try:
+        supabase.rpc('refresh_category_centroids', {'p_user_id': user_id}).execute()
+    except Exception as e:
+        print(f"Error refreshing category centroids: {e}")
 
-async def get_monthly_summary(user_id, month, year):
+@offloaded
+def get_monthly_summary(user_id, month, year):
     """
     Get the monthly summary for a user
     """
@@ -129,35 +466,42 @@ async def get_monthly_summary(user_id, month, year):
         else:
             print(f"No summary found for user {user_id}, month {month}, year {year}")
             
-            # If no summary exists, we'll create a placeholder with zero values
+            # If no summary exists, compute one from the month's transactions
             # This is optional but provides a better UX than showing nothing
+            transactions = get_user_transactions.blocking(user_id, month, year)
             return {
                 "user_id": user_id,
                 "month": month,
                 "year": year,
-                "total_expenses": 0,
-                "total_income": 0,
-                "expenses_by_card": {},
-                "expenses_by_category": {}
+                **summarize_transactions(transactions)
             }
             
     except Exception as e:
         print(f"Error getting monthly summary: {e}")
         return None
 
-async def get_user_transactions(user_id, month, year, category=None, card=None):
+def month_range(month, year):
     """
-    Get transactions for a specific user in a given month/year with optional filters
+    Half-open [first day of the month, first day of the next month) as ISO dates
+    """
+    month, year = int(month), int(year)
+    next_month, next_year = (1, year + 1) if month == 12 else (month + 1, year)
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+def user_transactions_query(user_id, month, year, category=None, card=None):
+    """
+    The query behind get_user_transactions, also used by testing/explain_user_transactions.py
     """
     # Query the transactions table directly with date filtering
     query = supabase.table("transactions") \
         .select("*") \
         .eq("user_id", user_id)
     
-    # Filter by month and year using PostgreSQL EXTRACT function on the date column
+    # A plain date range (not EXTRACT on the column) can use the (user_id, date) index
+    start, end = month_range(month, year)
     query = query \
-        .filter("EXTRACT(MONTH FROM date::timestamp)", "eq", month) \
-        .filter("EXTRACT(YEAR FROM date::timestamp)", "eq", year)
+        .gte("date", start) \
+        .lt("date", end)
     
     # Add optional filters
     if category:
@@ -166,9 +510,17 @@ async def get_user_transactions(user_id, month, year, category=None, card=None):
     if card:
         query = query.eq("card", card)
     
+    return query.order("date", desc=True)
+
+@offloaded
+def get_user_transactions(user_id, month, year, category=None, card=None):
+    """
+    Get transactions for a specific user in a given month/year with optional filters
+    """
+    query = user_transactions_query(user_id, month, year, category, card)
     try:
         # Execute the query
-        result = query.order("date", desc=True).execute()
+        result = query.execute()
         print(f"Retrieved {len(result.data)} transactions for user {user_id} in {month}/{year}")
     except Exception as e:
         print(f"Unexpected get transactions error: {e}")
@@ -176,11 +528,13 @@ async def get_user_transactions(user_id, month, year, category=None, card=None):
         
     return result.data
 
-async def update_transaction_category(transaction_id, table_name, category, note=None):
+@offloaded
+def update_transaction_category(transaction_id, table_name, category, note=None):
     """
     Update the category and optionally the note of a transaction
     """
-    update_data = {'category': category}
+    # A user's edit settles a provisional category
+    update_data = {'category': category, 'provisional': False}
     if note is not None:
         update_data['note'] = note
     try:
@@ -192,8 +546,217 @@ async def update_transaction_category(transaction_id, table_name, category, note
     except Exception as e:
         print(f"Unexpected update error: {e}")
     
+    updated = result.data[0] if result.data else None
+    # Keep the label on the transaction's embedding in sync for similarity lookups
+    if updated:
+        update_embedding_category.blocking(transaction_id, category, note)
+    # A user's correction overrides whatever the memo learned for this merchant
+    if updated and updated.get('user_id') and updated.get('merchant_key'):
+        record_category_memo.blocking(
+            updated['user_id'], updated['merchant_key'], category, note,
+            weight=USER_EDIT_WEIGHT, override=True
+        )
+    return updated
+
+@offloaded
+def finalize_provisional_transaction(transaction_id, category, note=None):
+    """
+    Replace a provisional category with the late LLM answer, unless the user already edited it
+    """
+    update_data = {'category': category, 'provisional': False}
+    if note is not None:
+        update_data['note'] = note
+    try:
+        result = supabase.table("transactions") \
+            .update(update_data) \
+            .eq("id", transaction_id) \
+            .eq("provisional", True) \
+            .execute()
+    except Exception as e:
+        print(f"Unexpected finalize error: {e}")
+        return None
     return result.data[0] if result.data else None
 
+@offloaded
+def claim_provisional_transactions(limit=200, stale_seconds=None):
+    """
+    Claim up to `limit` provisional rows of any user, in user order, that no
+    worker has claimed within `stale_seconds` (PROVISIONAL_CLAIM_SECONDS)
+    """
+    stale_seconds = PROVISIONAL_CLAIM_SECONDS if stale_seconds is None else stale_seconds
+    try:
+        result = supabase.rpc('claim_provisional_transactions', {
+            'p_limit': limit,
+            'p_stale_seconds': int(stale_seconds)
+        }).execute()
+    except Exception as e:
+        print(f"Unexpected provisional transactions error: {e}")
+        return []
+    return result.data
+
+@offloaded
+def get_transaction_embedding(transaction_id):
+    """
+    Get the stored embedding row (vector and metadata) for a transaction
+    """
+    try:
+        result = supabase.table("transaction_embeddings") \
+            .select(embedding_select("id, embedding, metadata")) \
+            .eq("transaction_id", transaction_id) \
+            .limit(1) \
+            .execute()
+    except Exception as e:
+        print(f"Unexpected embeddings error: {e}")
+        return None
+    if not result.data:
+        return None
+    row = result.data[0]
+    row['embedding'] = row_embedding(row)
+    return row
+
+@offloaded
+def update_embedding_category(transaction_id, category, note=None):
+    """
+    Update the category (and note) stored in a transaction's embedding metadata
+    """
+    row = get_transaction_embedding.blocking(transaction_id)
+    if not row:
+        return None
+    metadata = {**(row.get('metadata') or {}), 'category': category}
+    if note is not None:
+        metadata['note'] = note
+    try:
+        supabase.table("transaction_embeddings") \
+            .update({'metadata': metadata}) \
+            .eq("id", row['id']) \
+            .execute()
+    except Exception as e:
+        print(f"Unexpected embeddings error: {e}")
+    user_id = metadata.get('user_id')
+    if user_id:
+        similarity_cache.invalidate(user_id)
+    if user_id and VECTOR_INDEX == "local" and vector_indexes.exists(user_id):
+        vector_indexes.get(user_id).update_metadata(transaction_id, metadata)
+    return metadata
+
+def iter_embedding_rows(user_id=None, columns="embedding, metadata", page_size=1000, updated_since=None,
+                        raise_errors=False, vectors=True):
+    """
+    Page through transaction_embeddings in id order, optionally limited to one
+    user's transactions and to rows updated at or after the `updated_since`
+    datetime. A failed page ends the iteration early unless `raise_errors` is set.
+    """
+    if vectors:
+        columns = embedding_select(columns)
+    offset = 0
+    while True:
+        query = supabase.table("transaction_embeddings").select(columns)
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if updated_since:
+            query = query.gte("updated_at", updated_since.isoformat())
+        try:
+            result = query.order("id").range(offset, offset + page_size - 1).execute()
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"Unexpected embeddings error: {e}")
+            return
+        yield from result.data
+        if len(result.data) < page_size:
+            return
+        offset += page_size
+
+def get_labeled_metadata(user_id=None, page_size=1000):
+    """
+    Get the metadata of every categorized row of transaction_embeddings, without
+    the vectors, optionally limited to one user's transactions
+    """
+    labeled = [
+        row['metadata'] for row in iter_embedding_rows(user_id, "metadata", page_size, vectors=False)
+        if (row.get('metadata') or {}).get('category')
+    ]
+    print(f"Loaded {len(labeled)} labeled transactions for {user_id or 'all users'}")
+    return labeled
+
+def parse_embedding(value):
+    """
+    pgvector columns come back as '[0.1,0.2,...]' strings; return a list of floats
+    """
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+def embedding_select(columns):
+    """
+    `columns` of transaction_embeddings plus the configured vector columns, from
+    the row itself and from the shared embedding_vectors row it references
+    """
+    vector_columns = "embedding, embedding_compact" if COMPACT_EMBEDDINGS else "embedding"
+    columns = columns.replace("embedding,", f"{vector_columns},")
+    return f"{columns}, embedding_vectors(content_hash, {vector_columns})"
+
+def row_embedding(row):
+    """
+    A transaction_embeddings row's vector: the packed compact column if set, else the
+    pgvector column truncated to the configured dimensions. Deduplicated rows
+    take it from their embedding_vectors row.
+    """
+    row = row.get('embedding_vectors') or row
+    if row.get('embedding_compact'):
+        return embedding_codec.from_bytea(row['embedding_compact']).tolist()
+    embedding = parse_embedding(row.get('embedding'))
+    if embedding is None or not embedding_codec.dimensions:
+        return embedding
+    return embedding_codec.compact(embedding).tolist()
+
+@offloaded
+def get_category_memo(user_id):
+    """
+    Get all merchant -> category memo rows for a user
+    """
+    try:
+        result = supabase.table("merchant_category_memo") \
+            .select("merchant_key, category, weight, note") \
+            .eq("user_id", user_id) \
+            .execute()
+        return result.data or []
+    except Exception as e:
+        print(f"Unexpected category memo error: {e}")
+        return []
+
+@offloaded
+def record_category_memo(user_id, merchant_key, category, note=None, weight=1, override=False):
+    """
+    Add weight to a (user, merchant, category) memo entry; `override` drops the merchant's other categories
+    """
+    if not merchant_key or not category:
+        return
+    try:
+        supabase.rpc(
+            'record_category_memo',
+            {
+                'p_user_id': user_id,
+                'p_merchant_key': merchant_key,
+                'p_category': category,
+                'p_note': note,
+                'p_weight': weight,
+                'p_override': override
+            }
+        ).execute()
+    except Exception as e:
+        print(f"Unexpected category memo error: {e}")
+
+def rebuild_category_memo(user_id=None):
+    """
+    Rebuild the merchant -> category memo from stored transactions
+    """
+    try:
+        supabase.rpc('rebuild_category_memo', {'p_user_id': user_id}).execute()
+        print(f"Rebuilt category memo for {user_id or 'all users'}")
+    except Exception as e:
+        print(f"Unexpected category memo error: {e}")
+
 def update_monthly_summary(user_id, month, year ):
     """
     Manually triggers an update of the monthly summary for a specific user, month, and year.
@@ -0,0 +1,45 @@
+"""
+Bounded thread pool for the blocking Supabase client.
+
+database.py's functions are awaited by the API, but the supabase-py client is
+synchronous. `offloaded` turns a blocking database function into a coroutine
+function that runs on a shared pool of DB_POOL_SIZE worker threads. A slow
+query then ties up one worker instead of the event loop, and concurrent
+requests overlap their I/O. All workers share the one client in database.py
+and its HTTP connection pool, so at most DB_POOL_SIZE requests to Supabase
+are in flight at a time.
+
+The blocking function stays available as `.blocking`. Code that already runs
+on a worker calls it directly rather than queueing behind itself.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Await func(*args, **kwargs) on the database pool
+    """
+    # Copy the context so run stats and the current user follow the call into the worker
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        db_executor, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+def offloaded(func):
+    """
+    Decorator: an async version of a blocking database function, run on the pool
+    """
+    @functools.wraps(func)
+    async def run(*args, **kwargs):
+        return await run_blocking(func, *args, **kwargs)
+    run.blocking = func
+    return run
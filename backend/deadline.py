@@ -0,0 +1,75 @@
+"""
+Processing deadlines for uploads.
+
+An upload can set a time budget. Once the budget runs out, rows the LLM has
+not categorized yet get a best-effort category from the local tiers and are
+stored as provisional. The LLM work keeps running in the background, and
+its answers replace the provisional categories when they arrive. Rows whose
+background job is lost, e.g. to a restart, are picked up by the periodic
+provisional sweep (pdf_handler.sweep_provisional). Card issuer detection is
+bounded by the same budget and falls back to marker phrases on the first page.
+"""
+import asyncio
+import os
+import time
+
+# Default budget in seconds for a whole /upload request; 0 means no deadline
+UPLOAD_DEADLINE_SECONDS = float(os.environ.get("UPLOAD_DEADLINE_SECONDS", 0))
+# Weakest memo agreement still preferred over the classifier's guess
+PROVISIONAL_MEMO_MIN_AGREEMENT = float(os.environ.get("PROVISIONAL_MEMO_MIN_AGREEMENT", 0.5))
+FALLBACK_CATEGORY = "Miscellaneous"
+
+
+class Deadline:
+    """
+    Time budget measured from construction; `seconds` of None or <= 0 never expires
+    """
+
+    def __init__(self, seconds=None):
+        seconds = UPLOAD_DEADLINE_SECONDS if seconds is None else seconds
+        self.seconds = seconds if seconds and seconds > 0 else None
+        self.started = time.monotonic()
+
+    def remaining(self):
+        """
+        Seconds left, or None without a deadline
+        """
+        if self.seconds is None:
+            return None
+        return max(0.0, self.started + self.seconds - time.monotonic())
+
+    def expired(self):
+        return self.seconds is not None and self.remaining() <= 0
+
+    async def wait(self, task):
+        """
+        Wait for `task` until the deadline without cancelling it; True if it finished in time
+        """
+        done, _ = await asyncio.wait({task}, timeout=self.remaining())
+        return task in done
+
+    def as_dict(self):
+        return {
+            'seconds': self.seconds,
+            'elapsed': round(time.monotonic() - self.started, 3),
+        }
+
+
+def fallback_analysis(memo_best=None, classifier_guess=None, neighbours=None):
+    """
+    Best-effort provisional analysis for a row the LLM did not finish in time:
+    the user's memo if it mostly agrees, else the classifier's top category,
+    else the closest labeled neighbour, else FALLBACK_CATEGORY
+    """
+    if memo_best and memo_best[3] >= PROVISIONAL_MEMO_MIN_AGREEMENT:
+        category, note, _, agreement = memo_best
+        return {'category': category, 'note': note or '', 'source': 'memo', 'confidence': round(agreement, 4), 'provisional': True}
+    if classifier_guess:
+        category, probability = classifier_guess
+        return {'category': category, 'note': '', 'source': 'classifier', 'confidence': round(probability, 4), 'provisional': True}
+    labeled = [n for n in neighbours or [] if n.get('category')]
+    if labeled:
+        closest = max(labeled, key=lambda n: n.get('similarity') or 0)
+        return {'category': closest['category'], 'note': closest.get('note') or '', 'source': 'knn',
+                'confidence': round(closest.get('similarity') or 0, 4), 'provisional': True}
+    return {'category': FALLBACK_CATEGORY, 'note': '', 'source': 'default', 'provisional': True}
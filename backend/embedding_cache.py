@@ -0,0 +1,215 @@
+"""
+Two-tier cache of text embeddings keyed by (model id, normalized text).
+
+Notes, merchant strings and agent paraphrases are embedded again and again,
+and recurring charges produce near-identical text every month. Vectors are
+kept in an in-memory LRU backed by a memory-mapped float16 store on disk:
+
+    <directory>/vectors.f16   (capacity, dim) float16 vectors
+    <directory>/keys.bin      (capacity,) hex sha256 keys, empty = free slot
+    <directory>/used.f64      (capacity,) last-use timestamps for LRU eviction
+
+The disk store holds at most EMBEDDING_CACHE_DISK_ENTRIES vectors. When it is
+full, the least recently used 1/64 of the slots are freed in one pass, so
+eviction costs O(capacity) once per capacity/64 inserts, not on every insert.
+
+The memmaps are not safe to share between processes: each process keeps
+its own key-to-slot map. A store therefore claims its directory with an
+exclusive lock on <directory>/.lock. With several uvicorn workers, the first
+worker takes <directory>, the next <directory>.1, and so on. A restarted
+worker reclaims a released directory and its vectors. Without fcntl (Windows),
+there is no lock, so run a single worker.
+"""
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "model_cache/embeddings")
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", 4096))
+EMBEDDING_CACHE_DISK_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_DISK_ENTRIES", 50000))
+
+
+def normalize_text(text):
+    """
+    Collapse runs of whitespace (keeping line breaks) so trivially different renderings share a cache entry
+    """
+    return "\n".join(" ".join(line.split()) for line in str(text).strip().splitlines())
+
+
+def embedding_key(model_id, text):
+    return hashlib.sha256(f"{model_id}\x1f{normalize_text(text)}".encode("utf-8")).hexdigest().encode("ascii")
+
+
+def claim_directory(directory):
+    """
+    The first of `directory`, `directory`.1, `directory`.2, ... no other process
+    has claimed, and the open lock file holding the claim (None without fcntl)
+    """
+    if fcntl is None:
+        os.makedirs(directory, exist_ok=True)
+        return directory, None
+    for n in itertools.count():
+        path = directory if n == 0 else f"{directory}.{n}"
+        os.makedirs(path, exist_ok=True)
+        lock = open(os.path.join(path, ".lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        return path, lock
+
+
+class DiskVectorStore:
+    """
+    Fixed-capacity memory-mapped float16 vector store with batched LRU eviction,
+    in a directory claimed by this process
+    """
+
+    def __init__(self, directory, dim, capacity):
+        directory, self._claim = claim_directory(directory)
+        self.directory = directory
+        self.dim = dim
+        self.capacity = capacity
+        self.evict_batch = max(1, capacity // 64)
+        layout = {
+            "vectors.f16": (np.float16, (capacity, dim)),
+            "keys.bin": ("S64", (capacity,)),
+            "used.f64": (np.float64, (capacity,)),
+        }
+        # Start over if the files were written with another capacity or dimension
+        reuse = all(
+            os.path.exists(os.path.join(directory, name))
+            and os.path.getsize(os.path.join(directory, name)) == np.dtype(dtype).itemsize * int(np.prod(shape))
+            for name, (dtype, shape) in layout.items()
+        )
+        self.vectors, self.keys, self.used = (
+            np.memmap(os.path.join(directory, name), dtype=dtype, mode="r+" if reuse else "w+", shape=shape)
+            for name, (dtype, shape) in layout.items()
+        )
+        self.slots = {bytes(key): slot for slot, key in enumerate(self.keys) if key}
+        # Free slots, lowest on top
+        self.free = [slot for slot in range(capacity - 1, -1, -1) if not self.keys[slot]]
+        self.evictions = 0
+
+    def get(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        self.used[slot] = time.time()
+        return np.asarray(self.vectors[slot], dtype=np.float32)
+
+    def put(self, key, vector):
+        slot = self.slots.get(key)
+        if slot is None:
+            if not self.free:
+                self._evict()
+            slot = self.free.pop()
+            self.slots[key] = slot
+            self.keys[slot] = key
+        self.vectors[slot] = vector
+        self.used[slot] = time.time()
+
+    def _evict(self):
+        """
+        Free the evict_batch least recently used slots of a full store
+        """
+        victims = np.argpartition(self.used, self.evict_batch - 1)[:self.evict_batch]
+        for slot in victims:
+            del self.slots[bytes(self.keys[slot])]
+            self.keys[slot] = b""
+        self.free.extend(int(slot) for slot in victims[np.argsort(-self.used[victims])])
+        self.evictions += len(victims)
+
+    def flush(self):
+        for array in (self.vectors, self.keys, self.used):
+            array.flush()
+
+
+class EmbeddingCache:
+    """
+    In-memory LRU in front of a DiskVectorStore, for one embedding model
+    """
+
+    def __init__(self, model_id, dim, directory=None, memory_entries=None, disk_entries=None):
+        self.model_id = model_id
+        slug = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_id)
+        self.disk = DiskVectorStore(
+            os.path.join(directory or EMBEDDING_CACHE_DIR, slug), dim,
+            disk_entries or EMBEDDING_CACHE_DISK_ENTRIES
+        )
+        self.memory_entries = memory_entries or EMBEDDING_CACHE_MEMORY_ENTRIES
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, text):
+        key = embedding_key(self.model_id, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+            vector = self.disk.get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+            self.misses += 1
+            return None
+
+    def put(self, text, vector):
+        key = embedding_key(self.model_id, text)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            self.disk.put(key, vector)
+
+    def embed(self, texts, encode):
+        """
+        Embeddings for `texts` in order; only distinct uncached texts are passed to `encode(list)`
+        """
+        texts = list(texts)
+        vectors = [self.get(text) for text in texts]
+        missing = list(dict.fromkeys(normalize_text(t) for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            encoded = dict(zip(missing, encode(missing)))
+            for text, vector in encoded.items():
+                self.put(text, vector)
+            with self._lock:
+                self.disk.flush()
+            vectors = [v if v is not None else np.asarray(encoded[normalize_text(t)], dtype=np.float32)
+                       for t, v in zip(texts, vectors)]
+        if not vectors:
+            return np.zeros((0, self.disk.dim), dtype=np.float32)
+        return np.stack(vectors)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'embedding_cache_memory_hits': self.memory_hits,
+            'embedding_cache_disk_hits': self.disk_hits,
+            'embedding_cache_misses': self.misses,
+            'embedding_cache_hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            'embedding_cache_disk_entries': len(self.disk.slots),
+            'embedding_cache_evictions': self.disk.evictions,
+        }
@@ -0,0 +1,104 @@
+"""
+Compact embedding format: dimension truncation plus float16/int8 quantization.
+
+A float32 1024-dimension e5 vector sent with `.tolist()` is about 20 KB of
+JSON. Two settings shrink it:
+
+    EMBEDDING_DIMENSIONS  keep only the first N dimensions (re-normalized); 0 keeps all
+    EMBEDDING_FORMAT      float32 | float16 | int8 quantization of stored vectors
+
+Truncation is applied where embeddings are created, so queries, indexes and
+classifiers all see the same dimension. Quantization is applied only when a
+vector is serialized. Packed vectors are self-describing:
+
+    format code (u8) | dimensions (u16) | [int8: scale (f32)] | values
+
+A packed vector travels to Postgres as a bytea hex literal. testing/benchmark_embedding_codec.py
+measures the recall lost by each setting on stored embeddings.
+"""
+import os
+import struct
+
+import numpy as np
+
+EMBEDDING_FORMAT = os.environ.get("EMBEDDING_FORMAT", "float32").lower()
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", 0))
+
+FORMATS = {'float32': (0, np.float32), 'float16': (1, np.float16), 'int8': (2, np.int8)}
+FORMAT_NAMES = {code: name for name, (code, _) in FORMATS.items()}
+HEADER = struct.Struct("<BH")
+SCALE = struct.Struct("<f")
+
+
+def _normalize(X):
+    X = np.asarray(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=-1, keepdims=True)
+    return X / np.where(norms == 0, 1.0, norms)
+
+
+class EmbeddingCodec:
+    """
+    Truncates, packs and unpacks embeddings in one configured format
+    """
+
+    def __init__(self, format=None, dimensions=None):
+        self.format = (format or EMBEDDING_FORMAT).lower()
+        if self.format not in FORMATS:
+            raise ValueError(f"Unknown EMBEDDING_FORMAT: {self.format}")
+        self.dimensions = EMBEDDING_DIMENSIONS if dimensions is None else dimensions
+
+    def compact(self, vectors):
+        """
+        Truncate one vector or a (n, dim) batch to the configured dimensions, re-normalized
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not self.dimensions or vectors.shape[-1] <= self.dimensions:
+            return vectors
+        return _normalize(vectors[..., :self.dimensions])
+
+    def pack(self, vector):
+        """
+        Bytes of one compacted and quantized vector
+        """
+        vector = self.compact(vector)
+        code, dtype = FORMATS[self.format]
+        header = HEADER.pack(code, len(vector))
+        if self.format == 'int8':
+            # Symmetric per-vector scale: the largest component maps to +/-127
+            scale = float(np.abs(vector).max()) / 127 or 1.0
+            values = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+            return header + SCALE.pack(scale) + values.tobytes()
+        return header + vector.astype(dtype).tobytes()
+
+    @staticmethod
+    def unpack(data):
+        """
+        float32 vector from bytes written by pack(), whatever format they were written in
+        """
+        code, dimensions = HEADER.unpack_from(data)
+        dtype = FORMATS[FORMAT_NAMES[code]][1]
+        offset = HEADER.size
+        scale = 1.0
+        if dtype is np.int8:
+            scale, = SCALE.unpack_from(data, offset)
+            offset += SCALE.size
+        values = np.frombuffer(data, dtype=dtype, count=dimensions, offset=offset)
+        return values.astype(np.float32) * scale
+
+    def to_bytea(self, vector):
+        """
+        Postgres bytea hex literal of a packed vector, for PostgREST JSON bodies
+        """
+        return "\\x" + self.pack(vector).hex()
+
+    @classmethod
+    def from_bytea(cls, value):
+        """
+        Vector from a bytea value as PostgREST returns it ('\\x...' hex) or raw bytes
+        """
+        if isinstance(value, str):
+            value = bytes.fromhex(value[2:] if value.startswith("\\x") else value)
+        return cls.unpack(value)
+
+
+embedding_codec = EmbeddingCodec()
@@ -0,0 +1,216 @@
+"""
+Deterministic offline stand-in for the LLM provider.
+
+Set LLM_PROVIDER=fake to make the upload pipeline run without network access
+or billing. FakeModel recognizes our prompts (issuer detection, batch, fast
+mode and the categorization agent) and returns schema-valid answers. For
+CodeAgent runs, the answer is wrapped in a final_answer code blob. Latency is
+lognormal around FAKE_LLM_LATENCY seconds. Failures follow FAKE_LLM_ERRORS,
+e.g. "rate_limit:0.02,timeout:0.01,malformed:0.05".
+
+Every random draw is seeded by FAKE_LLM_SEED, the prompt and the attempt
+number. The same run therefore produces the same answers, delays and
+failures however calls are interleaved across threads, and a retried call
+can still succeed. Attempt numbers are kept for the FAKE_LLM_ATTEMPTS_SIZE
+most recently seen prompts, so long runs do not grow memory without bound.
+
+Prompt caching is billed by a PrefixCacheStandIn. Wrap the model in
+CachedModel with prompt_caching=True to add cache breakpoints as for the
+real provider.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from categorization import CATEGORIES, BATCH_INSTRUCTIONS, FAST_INSTRUCTIONS, AGENT_INSTRUCTIONS
+from prompt_caching import PrefixCacheStandIn, StandInResponse, estimate_tokens
+
+FAKE_LLM_LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", 0.5))
+FAKE_LLM_LATENCY_SIGMA = float(os.environ.get("FAKE_LLM_LATENCY_SIGMA", 0.5))
+FAKE_LLM_ERRORS = os.environ.get("FAKE_LLM_ERRORS", "")
+FAKE_LLM_SEED = os.environ.get("FAKE_LLM_SEED", "0")
+FAKE_LLM_ATTEMPTS_SIZE = int(os.environ.get("FAKE_LLM_ATTEMPTS_SIZE", 10000))
+
+ISSUERS = ['AMEX', 'FREEDOM', 'ZOLVE']
+_ISSUER_MARKERS = [
+    ('AMEX', re.compile(r'american\s+express|\bamex\b', re.I)),
+    ('FREEDOM', re.compile(r'freedom|chase', re.I)),
+    ('ZOLVE', re.compile(r'zolve', re.I)),
+]
+_CATEGORY_KEYWORDS = [
+    ('Housing', re.compile(r'\brent\b|apartment|realty|property', re.I)),
+    ('Grocery', re.compile(r'grocer|market|whole\s*foods|costco|instacart|trader\s*joe', re.I)),
+    ('Fun', re.compile(r'netflix|spotify|cinema|theat|bar\b|restaurant|steam', re.I)),
+    ('Investment', re.compile(r'robinhood|vanguard|fidelity|schwab|coinbase', re.I)),
+    ('Utilities', re.compile(r'con\s*ed|comcast|verizon|electric|water|nyct|mta', re.I)),
+    ('Payments', re.compile(r'payment|autopay|thank\s*you', re.I)),
+]
+_BATCH_ROW = re.compile(r'^(\d+)\.\s*(\{.*\})\s*$', re.M)
+
+
+class FakeRateLimitError(Exception):
+    """
+    Simulated provider 429
+    """
+
+
+def parse_error_rates(spec):
+    """
+    "kind:rate,kind:rate" -> {kind: rate}
+    """
+    rates = {}
+    for part in (spec or "").split(","):
+        if ":" in part:
+            kind, rate = part.split(":", 1)
+            rates[kind.strip()] = float(rate)
+    return rates
+
+
+def _text(messages):
+    chunks = []
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", "")
+        if isinstance(content, str):
+            chunks.append(content)
+        else:
+            chunks.extend(block.get("text") or "" for block in content or [] if isinstance(block, dict))
+    return "\n".join(chunks)
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def fake_category(merchant):
+    """
+    Keyword category for a merchant, else a stable hash-picked one
+    """
+    for category, pattern in _CATEGORY_KEYWORDS:
+        if pattern.search(merchant or ""):
+            return category
+    return CATEGORIES[int(_digest(merchant)[:8], 16) % len(CATEGORIES)]
+
+
+def fake_analysis(merchant):
+    return {'category': fake_category(merchant), 'note': f"Charge at {merchant or 'unknown merchant'}"}
+
+
+def fake_issuer(text):
+    page = text.split("First Page Text:", 1)[-1]
+    for issuer, pattern in _ISSUER_MARKERS:
+        if pattern.search(page):
+            return issuer
+    return ISSUERS[int(_digest(page)[:8], 16) % len(ISSUERS)]
+
+
+def _merchant(rendered):
+    """
+    Merchant from a rendered transaction (JSON or a Python dict repr)
+    """
+    match = re.search(r'["\']merchant["\']\s*:\s*["\']([^"\']*)["\']', rendered)
+    return match.group(1) if match else ""
+
+
+class FakeModel:
+    """
+    Offline model answering our prompts with configurable latency and failures
+    """
+
+    def __init__(self, model_id="fake/expensai", latency=None, latency_sigma=None, errors=None, seed=None,
+                 prompt_cache=None):
+        self.model_id = model_id
+        self.prompt_cache = prompt_cache or PrefixCacheStandIn()
+        self.latency = FAKE_LLM_LATENCY if latency is None else latency
+        self.latency_sigma = FAKE_LLM_LATENCY_SIGMA if latency_sigma is None else latency_sigma
+        errors = FAKE_LLM_ERRORS if errors is None else errors
+        self.error_rates = errors if isinstance(errors, dict) else parse_error_rates(errors)
+        self.seed = FAKE_LLM_SEED if seed is None else seed
+        self.last_input_token_count = 0
+        self.last_output_token_count = 0
+        self._attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _rng(self, text):
+        key = _digest(self.seed, text)
+        with self._lock:
+            attempt = self._attempts.pop(key, 0)
+            self._attempts[key] = attempt + 1
+            if len(self._attempts) > FAKE_LLM_ATTEMPTS_SIZE:
+                self._attempts.popitem(last=False)
+        return random.Random(_digest(key, attempt))
+
+    def _delay(self, rng):
+        if self.latency <= 0:
+            return 0.0
+        if self.latency_sigma <= 0:
+            return self.latency
+        mu = math.log(self.latency) - self.latency_sigma ** 2 / 2
+        return rng.lognormvariate(mu, self.latency_sigma)
+
+    def _failure(self, rng):
+        roll = rng.random()
+        for kind, rate in self.error_rates.items():
+            if roll < rate:
+                return kind
+            roll -= rate
+        return None
+
+    def answer(self, text, agent=False):
+        """
+        Schema-valid reply text for a prompt
+        """
+        if BATCH_INSTRUCTIONS in text:
+            rows = [{'index': int(index), **fake_analysis(_merchant(row))} for index, row in _BATCH_ROW.findall(text)]
+            reply = json.dumps(rows)
+        elif FAST_INSTRUCTIONS in text:
+            reply = json.dumps(fake_analysis(_merchant(text.rsplit("Transaction:", 1)[-1])))
+        elif AGENT_INSTRUCTIONS in text:
+            reply = repr(fake_analysis(_merchant(text.rsplit("Transaction:", 1)[-1])))
+        elif "card issuer" in text:
+            reply = repr(fake_issuer(text)) if agent else fake_issuer(text)
+        else:
+            reply = "''" if agent else ""
+        if agent:
+            return f"Thought: Answering directly.\nCode:\n```py\nfinal_answer({reply})\n```<end_code>"
+        return reply
+
+    def generate(self, messages, **kwargs):
+        text = _text(messages)
+        rng = self._rng(text)
+        time.sleep(self._delay(rng))
+
+        failure = self._failure(rng)
+        if failure == "rate_limit":
+            raise FakeRateLimitError("Fake provider rate limit exceeded")
+        if failure == "timeout":
+            raise TimeoutError("Fake provider request timed out")
+
+        # CodeAgent prompts carry smolagents' system prompt, which asks for final_answer
+        content = self.answer(text, agent="final_answer" in text)
+        if failure == "malformed":
+            content = content[:len(content) // 2]
+
+        self.last_input_token_count, cache_read, cache_write = self.prompt_cache.bill(messages)
+        self.last_output_token_count = estimate_tokens(content)
+        return chat_message(content, self.last_input_token_count, self.last_output_token_count, cache_read, cache_write)
+
+    __call__ = generate
+
+
+def chat_message(content, input_tokens, output_tokens, cache_read=0, cache_write=0):
+    """
+    smolagents ChatMessage for a fake reply, or a minimal stand-in on versions without token_usage
+    """
+    response = StandInResponse(content, input_tokens, output_tokens, cache_read, cache_write)
+    try:
+        from smolagents.models import ChatMessage, TokenUsage
+        return ChatMessage(role="assistant", content=content, raw=response.raw,
+                           token_usage=TokenUsage(input_tokens=input_tokens, output_tokens=output_tokens))
+    except (ImportError, TypeError):
+        return response
@@ -0,0 +1,104 @@
+"""
+Nearest-neighbour categorization tier in front of the LLM.
+
+An incoming transaction is embedded and its k nearest labeled transactions
+are retrieved. When enough close neighbours agree on one category, that
+category is assigned directly. Ambiguous transactions escalate to the LLM.
+A random sample of auto-assigned rows is also sent to the LLM so the tier's
+agreement with it can be tracked.
+"""
+import os
+import random
+
+KNN_K = int(os.environ.get("KNN_K", 7))
+KNN_MIN_SIMILARITY = float(os.environ.get("KNN_MIN_SIMILARITY", 0.85))
+KNN_MIN_NEIGHBOURS = int(os.environ.get("KNN_MIN_NEIGHBOURS", 3))
+KNN_MIN_AGREEMENT = float(os.environ.get("KNN_MIN_AGREEMENT", 0.8))
+KNN_AUDIT_RATE = float(os.environ.get("KNN_AUDIT_RATE", 0.1))
+
+
+def transaction_query_text(transaction):
+    """
+    Text embedded to look up a transaction's neighbours
+    """
+    merchant = transaction.get('merchant_key') or transaction.get('merchant') or ''
+    return f"Instruct: Given a credit card merchant, retrieve notes of similar past transactions\nQuery: {merchant}"
+
+
+def vote(neighbours, min_similarity=None, min_neighbours=None, min_agreement=None):
+    """
+    Similarity-weighted category vote over neighbour metadata dicts.
+
+    Returns an analysis taking the note of the closest agreeing neighbour, or
+    None when too few neighbours are close enough or they disagree.
+    """
+    min_similarity = KNN_MIN_SIMILARITY if min_similarity is None else min_similarity
+    min_neighbours = KNN_MIN_NEIGHBOURS if min_neighbours is None else min_neighbours
+    min_agreement = KNN_MIN_AGREEMENT if min_agreement is None else min_agreement
+
+    close = [n for n in neighbours
+             if n.get('category') and (n.get('similarity') or 0) >= min_similarity]
+    if len(close) < min_neighbours:
+        return None
+
+    weights = {}
+    for neighbour in close:
+        weights[neighbour['category']] = weights.get(neighbour['category'], 0.0) + neighbour['similarity']
+    category, weight = max(weights.items(), key=lambda item: item[1])
+    agreement = weight / sum(weights.values())
+    if agreement < min_agreement:
+        return None
+
+    closest = max((n for n in close if n['category'] == category), key=lambda n: n['similarity'])
+    return {
+        'category': category,
+        'note': closest.get('note') or '',
+        'source': 'knn',
+        'confidence': round(agreement, 4),
+    }
+
+
+class KnnTier:
+    """
+    Per-upload bookkeeping for the nearest-neighbour tier
+    """
+
+    def __init__(self, audit_rate=None):
+        self.audit_rate = KNN_AUDIT_RATE if audit_rate is None else audit_rate
+        self.attempts = 0
+        self.assigned = 0
+        self.audited = 0
+        self.agreed = 0
+
+    def categorize(self, neighbours):
+        """
+        Vote over `neighbours`; returns (analysis or None, whether to audit the answer against the LLM)
+        """
+        self.attempts += 1
+        analysis = vote(neighbours)
+        if analysis is None:
+            return None, False
+        self.assigned += 1
+        return analysis, random.random() < self.audit_rate
+
+    def record_audit(self, knn_category, llm_analysis):
+        """
+        Compare an auto-assigned category with the LLM's answer for the same row
+        """
+        if not llm_analysis:
+            return
+        self.audited += 1
+        if llm_analysis.get('category') == knn_category:
+            self.agreed += 1
+
+    def stats(self):
+        """
+        Auto-assign rate and sampled agreement with the LLM
+        """
+        return {
+            'knn_attempts': self.attempts,
+            'knn_assigned': self.assigned,
+            'knn_assign_rate': round(self.assigned / self.attempts, 4) if self.attempts else 0.0,
+            'knn_audited': self.audited,
+            'knn_llm_agreement': round(self.agreed / self.audited, 4) if self.audited else None,
+        }
@@ -0,0 +1,210 @@
+"""
+Disk-backed cache of LLM responses keyed by model id and a canonical prompt hash.
+
+Reprocessing a statement repeats the same issuer-detection and
+categorization prompts, so replays are served from a local SQLite file
+instead of the provider. Entries expire after LLM_CACHE_TTL seconds, and the
+least recently used entries are evicted beyond LLM_CACHE_MAX_ENTRIES.
+Set LLM_CACHE_BYPASS=1 (or pass bypass=True) to always call the model.
+Calls that do reach the provider carry prompt-caching breakpoints on their
+static prefixes (see prompt_caching.py).
+"""
+import dataclasses
+import enum
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from llm_usage import record_call, token_counts, cache_token_counts
+from prompt_caching import PROMPT_CACHING, supports_prompt_caching, with_cache_control
+
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "model_cache/llm_cache.sqlite")
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 20000))
+LLM_CACHE_BYPASS = os.environ.get("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+def _canonical(value):
+    """
+    Reduce messages and call parameters to plain JSON-able data with a stable layout
+    """
+    if isinstance(value, enum.Enum):
+        return _canonical(value.value)
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return _canonical(dataclasses.asdict(value))
+    if hasattr(value, "model_dump"):
+        return _canonical(value.model_dump())
+    if hasattr(value, "name") and hasattr(value, "inputs"):  # smolagents Tool
+        return value.name
+    return str(value)
+
+
+def prompt_key(model_id, messages, **params):
+    """
+    Cache key: model id plus a hash of the canonical messages and call parameters
+    """
+    payload = json.dumps(
+        {'model': model_id, 'messages': _canonical(messages), 'params': _canonical(params)},
+        sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite store of response texts with TTL expiry and LRU size-bounded eviction
+    """
+
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        self.path = path or LLM_CACHE_PATH
+        self.ttl = LLM_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or LLM_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, content TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and (self.ttl <= 0 or now - row[1] <= self.ttl):
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key, model_id, content):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model_id, content, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        if self.ttl > 0:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'llm_cache_hits': self.hits,
+            'llm_cache_misses': self.misses,
+            'llm_cache_hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class CachedModel:
+    """
+    Wraps a smolagents model so identical calls are answered from a ResponseCache.
+    Anything not overridden here is delegated to the wrapped model.
+    `prompt_caching` forces cache breakpoints on or off; by default they are
+    added when the model id names a provider that takes them.
+    """
+
+    def __init__(self, model, cache=None, bypass=None, prompt_caching=None):
+        self.model = model
+        self.cache = cache or ResponseCache()
+        self.bypass = LLM_CACHE_BYPASS if bypass is None else bypass
+        if prompt_caching is None:
+            prompt_caching = supports_prompt_caching(getattr(model, "model_id", None))
+        self.prompt_caching = prompt_caching and PROMPT_CACHING
+        self.last_input_token_count = 0
+        self.last_output_token_count = 0
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def _call_model(self, messages, **kwargs):
+        if self.prompt_caching:
+            messages = with_cache_control(messages)
+        if hasattr(self.model, "generate"):
+            return self.model.generate(messages, **kwargs)
+        return self.model(messages, **kwargs)
+
+    def generate(self, messages, **kwargs):
+        if self.bypass:
+            return self._call_through(messages, **kwargs)
+        model_id = getattr(self.model, "model_id", None)
+        key = prompt_key(model_id, messages, **kwargs)
+        content = self.cache.get(key)
+        if content is not None:
+            self.last_input_token_count = 0
+            self.last_output_token_count = 0
+            record_call(cached=True)
+            from smolagents.models import ChatMessage
+            return ChatMessage(role="assistant", content=content)
+
+        response = self._call_through(messages, **kwargs)
+        if isinstance(getattr(response, "content", None), str) and not getattr(response, "tool_calls", None):
+            self.cache.put(key, model_id, response.content)
+        return response
+
+    def _call_through(self, messages, **kwargs):
+        response = self._call_model(messages, **kwargs)
+        self.last_input_token_count, self.last_output_token_count = token_counts(self.model, response)
+        record_call(self.last_input_token_count, self.last_output_token_count, False, *cache_token_counts(response))
+        return response
+
+    __call__ = generate
+
+
+def cached(model, bypass=None, prompt_caching=None):
+    """
+    Wrap `model` with the shared on-disk response cache
+    """
+    return CachedModel(model, cache=shared_cache(), bypass=bypass, prompt_caching=prompt_caching)
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """
+    The process-wide ResponseCache at LLM_CACHE_PATH
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
@@ -0,0 +1,141 @@
+"""
+Bounded-concurrency, rate-limited execution of blocking LLM calls.
+
+LLM calls (agent runs, direct model calls) are blocking. LLMExecutor runs them
+in worker threads so the event loop stays free. A shared semaphore caps how
+many run at once across all uploads. A token bucket keeps the request rate
+within the provider quota. It is charged per request to the provider: models
+wrapped by rate_limited() take a token on every call, so an agent run of
+several steps pays for each step, and response-cache hits pay nothing. Failed
+calls are retried with jittered exponential backoff, and map() returns
+results in input order.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 4))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", 50))
+LLM_BURST = int(os.environ.get("LLM_BURST", LLM_MAX_CONCURRENCY))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 3))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`.
+    acquire() blocks, so call it from the worker threads that make model calls.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """
+        Wait until `tokens` are available and take them
+        """
+        with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                time.sleep((tokens - self.tokens) / self.rate)
+
+
+class RateLimitedModel:
+    """
+    Wraps a smolagents model so every call takes a token from `limiter` first.
+    Anything not overridden here is delegated to the wrapped model.
+    """
+
+    def __init__(self, model, limiter):
+        self.model = model
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def generate(self, messages, **kwargs):
+        self.limiter.acquire()
+        if hasattr(self.model, "generate"):
+            return self.model.generate(messages, **kwargs)
+        return self.model(messages, **kwargs)
+
+    __call__ = generate
+
+
+def backoff_delay(attempt, base=0.5, cap=20.0):
+    """
+    Full-jitter exponential backoff for the given retry attempt (0-based)
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class LLMExecutor:
+    """
+    Runs blocking LLM calls off the event loop under a concurrency limit and a rate limit
+    """
+
+    def __init__(self, concurrency=None, requests_per_minute=None, burst=None, retries=None):
+        self.concurrency = concurrency or LLM_MAX_CONCURRENCY
+        self.retries = LLM_MAX_RETRIES if retries is None else retries
+        rate = (requests_per_minute or LLM_REQUESTS_PER_MINUTE) / 60.0
+        self.limiter = TokenBucket(rate, burst or LLM_BURST)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def rate_limited(self, model):
+        """
+        `model` charged to this executor's request rate on every call
+        """
+        return RateLimitedModel(model, self.limiter)
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) in a worker thread, retrying failures with backoff.
+        The rate limit is charged by the model calls func makes (see rate_limited).
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._run(func, *args, **kwargs)
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                print(f"LLM call failed (attempt {attempt + 1}/{self.retries + 1}): {e}")
+            await asyncio.sleep(backoff_delay(attempt))
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        One attempt in a worker thread. The concurrency slot is held until the
+        thread returns, even when the awaiting task is cancelled (e.g. by an
+        upload deadline): the thread keeps calling the provider either way.
+        """
+        await self._semaphore.acquire()
+        thread = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        thread.add_done_callback(self._release)
+        return await asyncio.shield(thread)
+
+    def _release(self, thread):
+        self._semaphore.release()
+        if not thread.cancelled():
+            thread.exception()  # Mark retrieved: a cancelled caller's failure is not an unhandled error
+
+    async def map(self, func, items):
+        """
+        Run func(item) for every item concurrently; results (or exceptions) come back in input order
+        """
+        return await asyncio.gather(*(self.call(func, item) for item in items), return_exceptions=True)
+
+
+# Shared by every upload handled by this process
+llm_executor = LLMExecutor()
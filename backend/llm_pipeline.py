@@ -0,0 +1,121 @@
+"""
+LLM categorization of a statement's transactions.
+
+Rows are sent in token-budgeted batches. Rows a batch could not answer are
+retried one by one in fast mode, then with the multi-step agent. Every call
+runs under an LLMExecutor's concurrency limit and retries. The pipeline only
+needs a model, an executor and an optional agent fallback, not the PDF and
+embedding models of pdf_handler, so benchmarks run this same code offline
+against FakeModel.
+"""
+from categorization import (
+    chunk_rows, batch_prompt_parts, parse_batch_response, validate_analysis,
+    fast_prompt_parts, CATEGORY_RESPONSE_FORMAT
+)
+from llm_usage import Usage, track_usage
+from money import format_cents
+from prompt_caching import prompt_messages
+
+
+def transaction_for_prompt(transaction):
+    """
+    Render a transaction for an LLM prompt with its amount in dollars instead of cents
+    """
+    rendered = {k: v for k, v in transaction.items() if k != 'amount_cents'}
+    if 'amount_cents' in transaction:
+        rendered['amount'] = format_cents(transaction['amount_cents'])
+    return rendered
+
+
+def new_mode_usage():
+    """
+    Token and latency accumulators for each categorization mode
+    """
+    return {'batch': Usage(), 'fast': Usage(), 'agent': Usage()}
+
+
+class CategorizationPipeline:
+    """
+    Batch, fast-mode and agent categorization on one model and executor.
+    `agent(transaction)` returns the agent's raw analysis; without it, rows
+    fast mode cannot answer stay uncategorized.
+    """
+
+    def __init__(self, model, executor, agent=None):
+        self.model = model
+        self.executor = executor
+        self.agent = agent
+
+    def complete(self, prefix, suffix, **kwargs):
+        """
+        Single LLM call outside the agent loop, returning the response text.
+        `prefix` is the static, cacheable part of the prompt and `suffix` the per-call part.
+        """
+        response = self.model(prompt_messages(prefix, suffix), **kwargs)
+        return getattr(response, 'content', response)
+
+    def categorize_batch(self, chunk, usage=None):
+        """
+        Categorize a chunk of (index, transaction) pairs with one LLM call.
+        Returns {index: analysis} for the rows that came back valid; LLM errors are raised
+        so the executor can retry them.
+        """
+        prefix, suffix = batch_prompt_parts([(index, transaction_for_prompt(t)) for index, t in chunk])
+        with track_usage(usage or Usage()):
+            response = self.complete(prefix, suffix)
+        return parse_batch_response(response, [index for index, _ in chunk])
+
+    def categorize_fast(self, transaction, neighbours=None):
+        """
+        Fast mode: one structured LLM call with the historical context already in the prompt.
+        Returns a validated analysis, or None if the response does not validate.
+        """
+        prefix, suffix = fast_prompt_parts(transaction_for_prompt(transaction), neighbours)
+        try:
+            response = self.complete(prefix, suffix, response_format=CATEGORY_RESPONSE_FORMAT)
+        except Exception as e:
+            print(f"Error during fast categorization: {e}")
+            return None
+        return validate_analysis(response)
+
+    def categorize_transaction(self, transaction, neighbours=None, usage=None):
+        """
+        Categorize one transaction: fast mode first, the multi-step agent only if fast mode fails validation
+        """
+        usage = usage or new_mode_usage()
+        with track_usage(usage['fast']):
+            analysis = self.categorize_fast(transaction, neighbours)
+        if analysis or self.agent is None:
+            return analysis
+        with track_usage(usage['agent']):
+            return validate_analysis(self.agent(transaction))
+
+    async def categorize_transactions(self, transactions, contexts=None, usage=None):
+        """
+        Get category and note for every transaction of a statement.
+        `contexts` optionally holds the pre-fetched similar transactions for
+        each row. Returns one analysis (or None) per input transaction, in order.
+        """
+        usage = usage or new_mode_usage()
+        contexts = contexts or [None] * len(transactions)
+        analyses = [None] * len(transactions)
+        chunks = chunk_rows(list(enumerate(transactions)))
+        for result in await self.executor.map(lambda chunk: self.categorize_batch(chunk, usage['batch']), chunks):
+            if isinstance(result, Exception):
+                print(f"Error during batch categorization: {result}")
+                continue
+            for index, analysis in result.items():
+                analyses[index] = analysis
+
+        retries = [i for i, analysis in enumerate(analyses) if analysis is None]
+        print(f"Batch categorized {len(transactions) - len(retries)}/{len(transactions)} transactions, retrying {len(retries)} individually")
+        results = await self.executor.map(
+            lambda i: self.categorize_transaction(transactions[i], contexts[i], usage), retries
+        )
+        for index, result in zip(retries, results):
+            if isinstance(result, Exception):
+                print(f"Error categorizing transaction {transactions[index]}: {result}")
+                continue
+            analyses[index] = result
+        print("Categorization usage by mode:", {mode: u.as_dict() for mode, u in usage.items()})
+        return analyses
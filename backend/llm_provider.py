@@ -0,0 +1,36 @@
+"""
+Model construction selected by configuration.
+
+LLM_PROVIDER=litellm (default) talks to the provider configured by
+ANTHROPIC_MODEL / ANTHROPIC_API_KEY. LLM_PROVIDER=fake uses the offline
+FakeModel for benchmarks and load tests. Either way the model is wrapped in
+the shared executor's RateLimitedModel, and that in CachedModel. Every call
+that reaches the provider is therefore charged to the rate limit, while
+cache hits are not, and usage accounting works the same for both providers.
+Fake responses bypass the response cache so that every call pays the
+simulated latency.
+"""
+import os
+
+from llm_cache import cached
+from llm_executor import llm_executor
+
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "litellm").lower()
+
+
+def create_model(model_id=None, api_key=None, provider=None):
+    """
+    The model all agents and direct calls of this process should use
+    """
+    provider = (provider or LLM_PROVIDER).lower()
+    if provider == "fake":
+        from fake_model import FakeModel
+        return cached(llm_executor.rate_limited(FakeModel()), bypass=True, prompt_caching=True)
+    if provider != "litellm":
+        raise ValueError(f"Unknown LLM_PROVIDER: {provider}")
+
+    from smolagents import LiteLLMModel
+    return cached(llm_executor.rate_limited(LiteLLMModel(
+        model_id=model_id or os.environ.get("ANTHROPIC_MODEL"),  # Ensure this is set in your environment
+        api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"),  # Ensure this is set in your environment
+    )))
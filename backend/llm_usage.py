@@ -0,0 +1,184 @@
+"""
+Token and latency accounting for LLM calls.
+
+Models wrapped by llm_cache.CachedModel report every call here. track_usage()
+collects the calls made inside a block, including the calls an agent makes
+during a run. Because the accumulator lives in a context variable, it follows
+work into asyncio.to_thread workers.
+
+RunStats groups accumulators by pipeline stage (issuer_detection,
+categorization, historical_context). stage() attributes a block to the
+active upload's RunStats and to the process-wide totals served by /metrics.
+Stages can nest, and a stage's seconds include the stages nested inside it.
+"""
+import contextvars
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+_current = contextvars.ContextVar("llm_usage", default=())
+_run_stats = contextvars.ContextVar("run_stats", default=None)
+
+
+class Usage:
+    """
+    Thread-safe running totals of LLM calls, tokens and seconds
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.cached_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.steps = 0
+        self.seconds = 0.0
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def add_call(self, input_tokens=0, output_tokens=0, cached=False, cache_read=0, cache_write=0):
+        with self._lock:
+            self.calls += 1
+            self.cached_calls += int(cached)
+            self.input_tokens += int(input_tokens or 0)
+            self.output_tokens += int(output_tokens or 0)
+            self.cache_read_tokens += int(cache_read or 0)
+            self.cache_write_tokens += int(cache_write or 0)
+
+    def add_run(self, seconds):
+        with self._lock:
+            self.runs += 1
+            self.seconds += seconds
+
+    def add_steps(self, steps):
+        with self._lock:
+            self.steps += int(steps or 0)
+
+    def as_dict(self):
+        per_run = self.runs or 1
+        return {
+            'runs': self.runs,
+            'llm_calls': self.calls,
+            'steps': self.steps,
+            'cached_calls': self.cached_calls,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cached_input_tokens': self.cache_read_tokens,
+            'cache_write_input_tokens': self.cache_write_tokens,
+            'uncached_input_tokens': max(0, self.input_tokens - self.cache_read_tokens),
+            'seconds': round(self.seconds, 3),
+            'avg_tokens_per_run': round((self.input_tokens + self.output_tokens) / per_run, 1),
+            'avg_seconds_per_run': round(self.seconds / per_run, 3),
+        }
+
+
+@contextmanager
+def track_usage(usage):
+    """
+    Attribute every LLM call made inside the block (in this context) to `usage`,
+    and count the block as one timed run
+    """
+    token = _current.set(_current.get() + (usage,))
+    start = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        usage.add_run(time.perf_counter() - start)
+        _current.reset(token)
+
+
+def token_counts(model, response):
+    """
+    (input_tokens, output_tokens) of a model response, across smolagents versions
+    """
+    usage = getattr(response, "token_usage", None)
+    if usage is not None:
+        return getattr(usage, "input_tokens", 0) or 0, getattr(usage, "output_tokens", 0) or 0
+    return getattr(model, "last_input_token_count", 0) or 0, getattr(model, "last_output_token_count", 0) or 0
+
+
+def record_steps(steps):
+    """
+    Report the steps of one finished agent run to every accumulator active in the current context
+    """
+    for usage in _current.get():
+        usage.add_steps(steps)
+
+
+class RunStats:
+    """
+    Usage per pipeline stage, for one upload or for the whole process
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def usage(self, name):
+        with self._lock:
+            return self.stages.setdefault(name, Usage())
+
+    def as_dict(self):
+        with self._lock:
+            stages = dict(self.stages)
+        return {name: usage.as_dict() for name, usage in stages.items()}
+
+
+# Totals since the process started, served by the /metrics endpoint
+process_stats = RunStats()
+
+
+@contextmanager
+def collect_stats(stats=None):
+    """
+    Make `stats` the RunStats that stage() blocks in this context report to
+    """
+    stats = stats or RunStats()
+    token = _run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _run_stats.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+    Attribute the LLM calls, steps and time of a block to pipeline stage `name`
+    """
+    with ExitStack() as stack:
+        for stats in (_run_stats.get(), process_stats):
+            if stats is not None:
+                stack.enter_context(track_usage(stats.usage(name)))
+        yield
+
+
+def _field(value, name):
+    return (value.get(name) if isinstance(value, dict) else getattr(value, name, None)) or 0
+
+
+def cache_token_counts(response):
+    """
+    (cache_read, cache_write) input tokens of a LiteLLM response, 0 when the provider reports none
+    """
+    raw = getattr(response, "raw", None)
+    usage = _field(raw, "usage") if raw is not None else None
+    if not usage:
+        return 0, 0
+    cache_read = _field(usage, "cache_read_input_tokens")
+    details = _field(usage, "prompt_tokens_details")
+    if not cache_read and details:  # OpenAI-style automatic prefix caching
+        cache_read = _field(details, "cached_tokens")
+    try:
+        return int(cache_read), int(_field(usage, "cache_creation_input_tokens"))
+    except (TypeError, ValueError):
+        return 0, 0
+
+
+def record_call(input_tokens=0, output_tokens=0, cached=False, cache_read=0, cache_write=0):
+    """
+    Report one LLM call to every accumulator active in the current context
+    """
+    for usage in _current.get():
+        usage.add_call(input_tokens, output_tokens, cached, cache_read, cache_write)
@@ -0,0 +1,149 @@
+"""
+Canonical merchant keys for raw statement descriptors.
+
+Statement merchants carry payment-processor prefixes, phone and store numbers
+and a city/state suffix ("PAYPAL *INSTACART COSTCO 8882467822 CA",
+"BRYANT PARK WINES 650000012563956 NEW YORK NY"). normalize_merchant reduces
+them to a stable key ("INSTACART COSTCO", "BRYANT PARK WINES") so that caches
+and similarity lookups keyed on the merchant actually hit.
+"""
+import re
+from functools import lru_cache
+
+# Payment processors / aggregators that prefix the real merchant name
+PROCESSOR_PREFIXES = [
+    'PAYPAL', 'PP', 'SQ', 'SQU', 'TST', 'IC', 'PAR', 'TIL', 'SP', 'DD', 'PY',
+    'PAYU', 'GOOGLE', 'GOOGLE PAY', 'APPLE PAY', 'BT', 'CKE', 'FSP', 'LS', 'SMK',
+    'IN', 'WPY', 'ZEL', 'EB', 'CHK',
+]
+
+# Billing descriptors that stand in for the merchant's own name
+BILLING_ALIASES = {
+    'AMZN.COM/BILL': 'AMAZON',
+    'AMAZON.COM/BILL': 'AMAZON',
+    'APPLE.COM/BILL': 'APPLE',
+    'GOOGLE.COM/BILL': 'GOOGLE',
+}
+
+# Whole-descriptor rewrites applied after the generic rules
+MERCHANT_ALIASES = [
+    (r'^AMAZON MARKETPLACE\b.*$', 'AMAZON MARKETPLACE'),
+    (r'^AMAZON\.COM\b.*$', 'AMAZON'),
+    (r'^(.+?) VIA INSTA\w*$', r'\1'),
+]
+
+US_STATES = {
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID',
+    'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO',
+    'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA',
+    'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY', 'PR',
+}
+
+# Cities seen in statements plus large US cities; matched as whole trailing words
+CITIES = [
+    'NEW YORK', 'BROOKLYN', 'QUEENS', 'BRONX', 'STATEN ISLAND', 'LONG IS CITY',
+    'LONG ISLAND CITY', 'JERSEY CITY', 'NEWARK', 'HOBOKEN', 'PRINCETON',
+    'SAN FRANCISCO', 'SAN JOSE', 'SAN DIEGO', 'LOS ANGELES', 'OAKLAND',
+    'SEATTLE', 'BELLEVUE', 'BOTHELL', 'REDMOND', 'BOSTON', 'BROOKLINE',
+    'CAMBRIDGE', 'CHICAGO', 'DETROIT', 'ANN ARBOR', 'CANTON', 'ALLEN PARK',
+    'BELLEVILLE', 'PLYMOUTH', 'DUNDEE', 'TOLEDO', 'PERRYSBURG', 'ROSSFORD',
+    'MAUMEE', 'SANDUSKY', 'SIDNEY', 'COLUMBUS', 'CLEVELAND', 'WASHINGTON',
+    'PHILADELPHIA', 'PITTSBURGH', 'BALTIMORE', 'ATLANTA', 'MIAMI',
+    'SOUTH FLORIDA', 'ORLANDO', 'TAMPA', 'DALLAS', 'HOUSTON', 'AUSTIN',
+    'DENVER', 'PHOENIX', 'LAS VEGAS', 'PORTLAND', 'MINNEAPOLIS', 'ST LOUIS',
+    'NASHVILLE', 'CHARLOTTE', 'RALEIGH', 'BANGALORE', 'MUMBAI',
+    'MUMBAI SUBURBAN', 'DELHI', 'NEW DELHI',
+]
+
+_WHITESPACE = re.compile(r'\s+')
+_PREFIX = re.compile(
+    r'^(?:' + '|'.join(sorted((re.escape(p) for p in PROCESSOR_PREFIXES), key=len, reverse=True)) + r')\s*\*\s*'
+)
+# Any short vendor code directly followed by '*' ("OFFTHERECO* ...")
+_GENERIC_PREFIX = re.compile(r'^[A-Z0-9.]{2,12}\*\s*(?=\S)')
+# Phone numbers, store/terminal ids and amounts in foreign currency mark the start of the location
+_LOCATION_START = re.compile(
+    r'(?:^|\s)(?:'
+    r'\d{3}[-.]\d{3}[-.]\d{4}'      # 877-778-2106
+    r'|#?\d{3,}[\d,.]*'             # 8882467822, #548
+    r'|\d{1,3}(?:,\d{3})*\.\d{2}'   # 2,247.00
+    r'|[A-Z]{1,3}\d{3,}\w*'         # OH100202, ST2822
+    r')(?:\s|$)'
+)
+# Store numbers glued to the name ("BP#92600507")
+_GLUED_STORE = re.compile(r'(?<=[A-Z])#(?=\d)')
+_TRAILING_NOISE = re.compile(r'[\s\-*&/#,.]+$')
+_ALIASES = [(re.compile(pattern), repl) for pattern, repl in MERCHANT_ALIASES]
+
+
+def _build_city_trie(cities):
+    """
+    Build a word trie over city names, keyed from the last word backwards
+    """
+    trie = {}
+    for city in cities:
+        node = trie
+        for word in reversed(city.split()):
+            node = node.setdefault(word, {})
+        node[None] = True
+    return trie
+
+
+_CITY_TRIE = _build_city_trie(CITIES)
+
+
+def _strip_city(words):
+    """
+    Drop the longest known city name from the end of `words`, keeping at least one word
+    """
+    node = _CITY_TRIE
+    cut = None
+    for i in range(len(words) - 1, 0, -1):
+        node = node.get(words[i])
+        if node is None:
+            break
+        if None in node:
+            cut = i
+    return words[:cut] if cut is not None else words
+
+
+@lru_cache(maxsize=65536)
+def normalize_merchant(raw):
+    """
+    Return the canonical merchant key for a raw statement descriptor.
+
+    Results are memoized per raw string, so recurring descriptors cost one dict lookup.
+    """
+    if not raw:
+        return ''
+    text = _WHITESPACE.sub(' ', str(raw).upper()).strip()
+    text = _TRAILING_NOISE.sub('', text)
+
+    stripped = _PREFIX.sub('', text)
+    if stripped == text:
+        stripped = _GENERIC_PREFIX.sub('', text)
+    text = stripped or text
+
+    words = text.split(' ')
+    for i, word in enumerate(words):
+        alias = BILLING_ALIASES.get(word)
+        if alias:
+            words = words[:i] if i else [alias]
+            break
+    text = ' '.join(words)
+
+    text = _GLUED_STORE.sub(' #', text)
+    match = _LOCATION_START.search(text)
+    if match and match.start() > 0:
+        text = text[:match.start()]
+    text = _TRAILING_NOISE.sub('', text)
+
+    words = text.split(' ')
+    if len(words) > 1 and words[-1] in US_STATES:
+        words = words[:-1]
+    words = _strip_city(words)
+    text = _TRAILING_NOISE.sub('', ' '.join(words)) or ' '.join(words)
+
+    for pattern, repl in _ALIASES:
+        text = pattern.sub(repl, text)
+    return text
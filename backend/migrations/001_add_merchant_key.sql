@@ -0,0 +1,8 @@
+-- Canonical merchant key (see backend/merchant_normalizer.py) stored alongside
+-- the raw statement descriptor. Existing rows are filled by
+-- database.backfill_merchant_keys().
+ALTER TABLE transactions
+    ADD COLUMN IF NOT EXISTS merchant_key TEXT;
+
+CREATE INDEX IF NOT EXISTS transactions_user_merchant_key_idx
+    ON transactions (user_id, merchant_key);
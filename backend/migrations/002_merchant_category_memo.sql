@@ -0,0 +1,59 @@
+-- Per-user merchant -> category memo consulted before LLM categorization
+-- (see backend/category_memo.py). Each row is the accumulated weight of one
+-- category for one canonical merchant.
+CREATE TABLE IF NOT EXISTS merchant_category_memo (
+    user_id UUID NOT NULL,
+    merchant_key TEXT NOT NULL,
+    category TEXT NOT NULL,
+    weight INTEGER NOT NULL DEFAULT 0,
+    note TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, merchant_key, category)
+);
+
+-- Add weight to one (user, merchant, category). A user correction
+-- (p_override) also drops the merchant's other categories so it wins outright.
+CREATE OR REPLACE FUNCTION record_category_memo(
+    p_user_id UUID,
+    p_merchant_key TEXT,
+    p_category TEXT,
+    p_note TEXT DEFAULT NULL,
+    p_weight INTEGER DEFAULT 1,
+    p_override BOOLEAN DEFAULT FALSE
+) RETURNS VOID AS $$
+BEGIN
+    IF p_override THEN
+        DELETE FROM merchant_category_memo
+        WHERE user_id = p_user_id
+          AND merchant_key = p_merchant_key
+          AND category <> p_category;
+    END IF;
+
+    INSERT INTO merchant_category_memo (user_id, merchant_key, category, weight, note)
+    VALUES (p_user_id, p_merchant_key, p_category, p_weight, p_note)
+    ON CONFLICT (user_id, merchant_key, category) DO UPDATE
+    SET weight = merchant_category_memo.weight + EXCLUDED.weight,
+        note = COALESCE(EXCLUDED.note, merchant_category_memo.note),
+        updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rebuild a user's memo (or everyone's when p_user_id is NULL) from stored transactions
+CREATE OR REPLACE FUNCTION rebuild_category_memo(p_user_id UUID DEFAULT NULL)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM merchant_category_memo
+    WHERE p_user_id IS NULL OR user_id = p_user_id;
+
+    INSERT INTO merchant_category_memo (user_id, merchant_key, category, weight, note)
+    SELECT user_id, merchant_key, category, count(*), max(note)
+    FROM transactions
+    WHERE merchant_key IS NOT NULL
+      AND merchant_key <> ''
+      AND category IS NOT NULL
+      AND (p_user_id IS NULL OR user_id = p_user_id)
+    GROUP BY user_id, merchant_key, category;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_category_memo(NULL);
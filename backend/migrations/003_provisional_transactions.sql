@@ -0,0 +1,9 @@
+-- Rows stored with a best-effort category because the upload's deadline ran
+-- out before the LLM answered (see backend/deadline.py). A background job or
+-- a user edit replaces the category and clears the flag.
+ALTER TABLE transactions
+    ADD COLUMN IF NOT EXISTS provisional BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS transactions_provisional_idx
+    ON transactions (user_id)
+    WHERE provisional;
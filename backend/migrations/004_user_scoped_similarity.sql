@@ -0,0 +1,78 @@
+-- User-scoped similarity search with category/card prefiltering (see
+-- backend/database.py find_similar_transactions). The original RPC scanned
+-- every user's embeddings; lookups now only touch one user's rows, narrowed to
+-- a category, a card, or the categories whose centroid is closest to the query.
+
+-- Filter columns derived from the embedding metadata
+UPDATE transaction_embeddings e
+SET metadata = e.metadata
+    || jsonb_build_object('user_id', t.user_id)
+    || jsonb_build_object('card', t.card)
+FROM transactions t
+WHERE t.id = e.transaction_id
+  AND (e.metadata->>'user_id' IS NULL OR e.metadata->>'card' IS NULL);
+
+ALTER TABLE transaction_embeddings
+    ADD COLUMN IF NOT EXISTS user_id UUID GENERATED ALWAYS AS ((metadata->>'user_id')::uuid) STORED,
+    ADD COLUMN IF NOT EXISTS category TEXT GENERATED ALWAYS AS (metadata->>'category') STORED,
+    ADD COLUMN IF NOT EXISTS card TEXT GENERATED ALWAYS AS (metadata->>'card') STORED;
+
+CREATE INDEX IF NOT EXISTS transaction_embeddings_user_category_idx
+    ON transaction_embeddings (user_id, category);
+
+CREATE INDEX IF NOT EXISTS transaction_embeddings_user_card_idx
+    ON transaction_embeddings (user_id, card);
+
+-- Mean embedding of each (user, category), refreshed after uploads
+CREATE TABLE IF NOT EXISTS embedding_category_centroids (
+    user_id UUID NOT NULL,
+    category TEXT NOT NULL,
+    centroid vector(1024) NOT NULL,
+    n INTEGER NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, category)
+);
+
+CREATE OR REPLACE FUNCTION refresh_category_centroids(p_user_id UUID)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM embedding_category_centroids WHERE user_id = p_user_id;
+    INSERT INTO embedding_category_centroids (user_id, category, centroid, n)
+    SELECT user_id, category, AVG(embedding), COUNT(*)
+    FROM transaction_embeddings
+    WHERE user_id = p_user_id AND category IS NOT NULL
+    GROUP BY user_id, category;
+END;
+$$ LANGUAGE plpgsql;
+
+-- User-scoped overload of find_similar_transactions. A NULL filter matches
+-- everything; p_category_probe keeps only the N categories whose centroid is
+-- closest to the query (ignored when p_category is given).
+CREATE OR REPLACE FUNCTION find_similar_transactions(
+    query_embedding vector(1024),
+    match_threshold FLOAT,
+    match_count INTEGER,
+    p_user_id UUID,
+    p_category TEXT DEFAULT NULL,
+    p_card TEXT DEFAULT NULL,
+    p_category_probe INTEGER DEFAULT NULL
+) RETURNS TABLE (metadata JSONB, similarity FLOAT) AS $$
+    WITH probed AS (
+        SELECT c.category
+        FROM embedding_category_centroids c
+        WHERE c.user_id = p_user_id
+        ORDER BY c.centroid <=> query_embedding
+        LIMIT p_category_probe
+    )
+    SELECT e.metadata, 1 - (e.embedding <=> query_embedding) AS similarity
+    FROM transaction_embeddings e
+    WHERE e.user_id = p_user_id
+      AND (p_category IS NULL OR e.category = p_category)
+      AND (p_card IS NULL OR e.card = p_card)
+      AND (p_category IS NOT NULL OR p_category_probe IS NULL
+           OR NOT EXISTS (SELECT 1 FROM embedding_category_centroids c WHERE c.user_id = p_user_id)
+           OR e.category IN (SELECT category FROM probed))
+      AND 1 - (e.embedding <=> query_embedding) >= match_threshold
+    ORDER BY e.embedding <=> query_embedding
+    LIMIT match_count;
+$$ LANGUAGE sql STABLE;
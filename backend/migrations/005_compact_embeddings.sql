@@ -0,0 +1,9 @@
+-- Compact embedding storage (see backend/embedding_codec.py). With
+-- EMBEDDING_FORMAT=float16|int8 or EMBEDDING_DIMENSIONS set, store_embedding
+-- writes the packed vector to embedding_compact. It fills the 1024-dimension
+-- pgvector column only while the RPC similarity search still needs it.
+ALTER TABLE transaction_embeddings
+    ADD COLUMN IF NOT EXISTS embedding_compact BYTEA;
+
+ALTER TABLE transaction_embeddings
+    ALTER COLUMN embedding DROP NOT NULL;
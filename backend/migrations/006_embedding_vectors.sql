@@ -0,0 +1,145 @@
+-- Content-addressed embeddings (see backend/database.py store_embedding).
+-- Identical note texts (subscriptions, transit fares) used to get one vector
+-- row each. A vector is now stored once per content hash, which covers the
+-- model, its truncated dimensions and the normalized text. Transactions
+-- reference it through vector_id, and ref_count tracks the references so
+-- prune_embedding_vectors() can clean up. Rows written before this migration
+-- keep their own vectors.
+CREATE TABLE IF NOT EXISTS embedding_vectors (
+    id BIGSERIAL PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    embedding vector(1024),
+    embedding_compact BYTEA,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE transaction_embeddings
+    ADD COLUMN IF NOT EXISTS vector_id BIGINT REFERENCES embedding_vectors (id);
+
+CREATE INDEX IF NOT EXISTS transaction_embeddings_vector_id_idx
+    ON transaction_embeddings (vector_id);
+
+CREATE INDEX IF NOT EXISTS embedding_vectors_unreferenced_idx
+    ON embedding_vectors (id)
+    WHERE ref_count = 0;
+
+-- Keep ref_count equal to the number of transaction_embeddings rows pointing at a vector
+CREATE OR REPLACE FUNCTION count_embedding_vector_refs()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.vector_id IS NOT NULL THEN
+        UPDATE embedding_vectors SET ref_count = ref_count - 1 WHERE id = OLD.vector_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.vector_id IS NOT NULL THEN
+        UPDATE embedding_vectors SET ref_count = ref_count + 1 WHERE id = NEW.vector_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transaction_embeddings_vector_refs ON transaction_embeddings;
+CREATE TRIGGER transaction_embeddings_vector_refs
+    AFTER INSERT OR DELETE OR UPDATE OF vector_id ON transaction_embeddings
+    FOR EACH ROW EXECUTE FUNCTION count_embedding_vector_refs();
+
+-- Id of the vector for p_content_hash. It is inserted when vector data is given;
+-- without vector data, NULL is returned for an unknown hash so the caller
+-- only uploads a vector the first time its text is seen.
+CREATE OR REPLACE FUNCTION acquire_embedding_vector(
+    p_content_hash TEXT,
+    p_embedding vector(1024) DEFAULT NULL,
+    p_embedding_compact BYTEA DEFAULT NULL
+) RETURNS BIGINT AS $$
+DECLARE
+    v_id BIGINT;
+BEGIN
+    SELECT id INTO v_id FROM embedding_vectors WHERE content_hash = p_content_hash;
+    IF v_id IS NOT NULL OR (p_embedding IS NULL AND p_embedding_compact IS NULL) THEN
+        RETURN v_id;
+    END IF;
+    INSERT INTO embedding_vectors (content_hash, embedding, embedding_compact)
+    VALUES (p_content_hash, p_embedding, p_embedding_compact)
+    ON CONFLICT (content_hash) DO UPDATE SET content_hash = EXCLUDED.content_hash
+    RETURNING id INTO v_id;
+    RETURN v_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION prune_embedding_vectors()
+RETURNS INTEGER AS $$
+DECLARE
+    v_pruned INTEGER;
+BEGIN
+    DELETE FROM embedding_vectors WHERE ref_count = 0;
+    GET DIAGNOSTICS v_pruned = ROW_COUNT;
+    RETURN v_pruned;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION refresh_category_centroids(p_user_id UUID)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM embedding_category_centroids WHERE user_id = p_user_id;
+    INSERT INTO embedding_category_centroids (user_id, category, centroid, n)
+    SELECT e.user_id, e.category, AVG(COALESCE(v.embedding, e.embedding)), COUNT(*)
+    FROM transaction_embeddings e
+    LEFT JOIN embedding_vectors v ON v.id = e.vector_id
+    WHERE e.user_id = p_user_id AND e.category IS NOT NULL
+      AND COALESCE(v.embedding, e.embedding) IS NOT NULL
+    GROUP BY e.user_id, e.category;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The user-scoped search ranks distinct vectors, then returns up to
+-- p_max_references of the most recent transactions referencing each one
+DROP FUNCTION IF EXISTS find_similar_transactions(vector, FLOAT, INTEGER, UUID, TEXT, TEXT, INTEGER);
+
+CREATE OR REPLACE FUNCTION find_similar_transactions(
+    query_embedding vector(1024),
+    match_threshold FLOAT,
+    match_count INTEGER,
+    p_user_id UUID,
+    p_category TEXT DEFAULT NULL,
+    p_card TEXT DEFAULT NULL,
+    p_category_probe INTEGER DEFAULT NULL,
+    p_max_references INTEGER DEFAULT 3
+) RETURNS TABLE (metadata JSONB, similarity FLOAT) AS $$
+    WITH probed AS (
+        SELECT c.category
+        FROM embedding_category_centroids c
+        WHERE c.user_id = p_user_id
+        ORDER BY c.centroid <=> query_embedding
+        LIMIT p_category_probe
+    ),
+    scoped AS (
+        SELECT e.id, e.metadata,
+               COALESCE(e.vector_id, -e.id) AS vector_key,
+               COALESCE(v.embedding, e.embedding) AS embedding
+        FROM transaction_embeddings e
+        LEFT JOIN embedding_vectors v ON v.id = e.vector_id
+        WHERE e.user_id = p_user_id
+          AND (p_category IS NULL OR e.category = p_category)
+          AND (p_card IS NULL OR e.card = p_card)
+          AND (p_category IS NOT NULL OR p_category_probe IS NULL
+               OR NOT EXISTS (SELECT 1 FROM embedding_category_centroids c WHERE c.user_id = p_user_id)
+               OR e.category IN (SELECT category FROM probed))
+    ),
+    nearest AS (
+        SELECT vector_key, 1 - (embedding <=> query_embedding) AS similarity
+        FROM (SELECT DISTINCT ON (vector_key) vector_key, embedding FROM scoped WHERE embedding IS NOT NULL) d
+        WHERE 1 - (embedding <=> query_embedding) >= match_threshold
+        ORDER BY embedding <=> query_embedding
+        LIMIT match_count
+    ),
+    referencing AS (
+        SELECT s.metadata, n.similarity,
+               ROW_NUMBER() OVER (PARTITION BY s.vector_key ORDER BY s.id DESC) AS recency
+        FROM nearest n
+        JOIN scoped s ON s.vector_key = n.vector_key
+    )
+    SELECT metadata, similarity
+    FROM referencing
+    WHERE recency <= p_max_references
+    ORDER BY similarity DESC, recency;
+$$ LANGUAGE sql STABLE;
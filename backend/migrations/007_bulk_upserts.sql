@@ -0,0 +1,20 @@
+-- Natural keys for the bulk write path (see backend/database.py
+-- store_transactions and store_embeddings). Uploads skip rows already stored
+-- under them, so a retried statement neither inserts its rows again nor
+-- overwrites categories the user has edited since.
+ALTER TABLE transactions
+    ADD COLUMN IF NOT EXISTS dedupe_key TEXT;
+
+-- transactions is partitioned by month (create_monthly_partition), and a unique
+-- index on a partitioned table must contain the partition key
+CREATE UNIQUE INDEX IF NOT EXISTS transactions_dedupe_key_idx
+    ON transactions (dedupe_key, date);
+
+-- One embedding per transaction: drop duplicates left by earlier retries first
+DELETE FROM transaction_embeddings e
+USING transaction_embeddings newer
+WHERE e.transaction_id = newer.transaction_id
+  AND e.id < newer.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS transaction_embeddings_transaction_id_idx
+    ON transaction_embeddings (transaction_id);
@@ -0,0 +1,13 @@
+-- Indexes for get_user_transactions (see backend/database.py). The month is
+-- now a half-open date range, so a user's month is read from the
+-- (user_id, date DESC) index in the order the API returns it, without
+-- scanning every row of the user.
+CREATE INDEX IF NOT EXISTS transactions_user_date_idx
+    ON transactions (user_id, date DESC);
+
+-- Optional: category and card filters over a user's whole history
+CREATE INDEX IF NOT EXISTS transactions_user_category_idx
+    ON transactions (user_id, category);
+
+CREATE INDEX IF NOT EXISTS transactions_user_card_idx
+    ON transactions (user_id, card);
@@ -0,0 +1,34 @@
+-- Safe pruning of shared embedding vectors (see backend/database.py
+-- acquire_embedding_vectors and prune_embedding_vectors). store_embeddings
+-- looks a vector up before it writes the transaction_embeddings row that
+-- references it, and a prune in between broke the vector_id foreign key.
+-- Lookups now stamp acquired_at, and a prune only deletes vectors that are
+-- unreferenced and were not acquired within its grace period.
+DROP FUNCTION IF EXISTS acquire_embedding_vector(TEXT, vector, BYTEA);
+
+ALTER TABLE embedding_vectors
+    ADD COLUMN IF NOT EXISTS acquired_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+-- (content_hash, id) of the known vectors among p_content_hashes, stamped as just acquired
+CREATE OR REPLACE FUNCTION acquire_embedding_vectors(p_content_hashes TEXT[])
+RETURNS TABLE (content_hash TEXT, id BIGINT) AS $$
+    UPDATE embedding_vectors v
+    SET acquired_at = now()
+    WHERE v.content_hash = ANY (p_content_hashes)
+    RETURNING v.content_hash, v.id;
+$$ LANGUAGE sql VOLATILE;
+
+DROP FUNCTION IF EXISTS prune_embedding_vectors();
+
+CREATE OR REPLACE FUNCTION prune_embedding_vectors(p_grace_seconds INTEGER DEFAULT 3600)
+RETURNS INTEGER AS $$
+DECLARE
+    v_pruned INTEGER;
+BEGIN
+    DELETE FROM embedding_vectors
+    WHERE ref_count = 0
+      AND acquired_at < now() - make_interval(secs => p_grace_seconds);
+    GET DIAGNOSTICS v_pruned = ROW_COUNT;
+    RETURN v_pruned;
+END;
+$$ LANGUAGE plpgsql;
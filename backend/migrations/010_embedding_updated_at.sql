@@ -0,0 +1,23 @@
+-- Change tracking for the local vector indexes (see backend/database.py
+-- local_vector_index). Each worker catches its indexes up with the rows
+-- written or relabeled since its last sync. A row id high-water mark missed
+-- update_embedding_category, upserts that keep their id, and rows committed
+-- out of id order. updated_at is set on every insert and update.
+ALTER TABLE transaction_embeddings
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION touch_transaction_embedding()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transaction_embeddings_touch ON transaction_embeddings;
+CREATE TRIGGER transaction_embeddings_touch
+    BEFORE UPDATE ON transaction_embeddings
+    FOR EACH ROW EXECUTE FUNCTION touch_transaction_embedding();
+
+CREATE INDEX IF NOT EXISTS transaction_embeddings_user_updated_idx
+    ON transaction_embeddings (user_id, updated_at);
@@ -0,0 +1,25 @@
+-- Provisional rows are claimed before a worker categorizes them (see
+-- backend/pdf_handler.py sweep_provisional). Every worker sweeps, and sweeps
+-- used to pick up rows another worker's background job was still finishing,
+-- which repeated the LLM work. An upload stamps claimed_at on the provisional
+-- rows it stores. A sweep only takes rows whose claim is older than
+-- p_stale_seconds, i.e. whose job was lost, and claims them in the same statement.
+ALTER TABLE transactions
+    ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ;
+
+CREATE OR REPLACE FUNCTION claim_provisional_transactions(p_limit INTEGER, p_stale_seconds INTEGER)
+RETURNS SETOF transactions AS $$
+    UPDATE transactions t
+    SET claimed_at = now()
+    FROM (
+        SELECT id, date
+        FROM transactions
+        WHERE provisional
+          AND (claimed_at IS NULL OR claimed_at < now() - make_interval(secs => p_stale_seconds))
+        ORDER BY user_id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ) claimable
+    WHERE t.id = claimable.id AND t.date = claimable.date
+    RETURNING t.*;
+$$ LANGUAGE sql VOLATILE;
@@ -0,0 +1,114 @@
+"""
+Exact money handling for transaction amounts.
+
+Amounts are carried as integer cents from extraction through storage so that
+sums never drift. Vectors of amounts are int64 NumPy arrays, which lets the
+summary code aggregate whole statements in one exact reduction.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+# Characters that never change the value of an amount string
+_NOISE = str.maketrans('', '', ' \t\n$,')
+
+
+def parse_cents(value):
+    """
+    Parse an amount into integer cents.
+
+    Accepts strings such as "$1,234.56", "-$620.00", "$-620.00", "(12.00)",
+    "41.61" or "2.9" as well as int, float and Decimal dollar values.
+    Raises ValueError when the value cannot be read as an amount.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Unsupported amount: {value!r}")
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        value = Decimal(repr(value))
+    if isinstance(value, Decimal):
+        return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    if not isinstance(value, str):
+        raise ValueError(f"Unsupported amount: {value!r}")
+
+    text = value.translate(_NOISE)
+    negative = False
+    if text.startswith('(') and text.endswith(')'):
+        negative = True
+        text = text[1:-1]
+    if text.startswith('-'):
+        negative = not negative
+        text = text[1:]
+    elif text.startswith('+'):
+        text = text[1:]
+    elif text.endswith('-'):
+        negative = not negative
+        text = text[:-1]
+
+    whole, _, frac = text.partition('.')
+    if not (whole or frac) or not text.isascii():
+        raise ValueError(f"Unsupported amount: {value!r}")
+    if (whole and not whole.isdigit()) or (frac and not frac.isdigit()):
+        raise ValueError(f"Unsupported amount: {value!r}")
+
+    cents = int(whole or 0) * 100 + int(frac[:2].ljust(2, '0'))
+    if len(frac) > 2 and frac[2] >= '5':
+        cents += 1
+    return -cents if negative else cents
+
+
+def to_cents(value, default=0):
+    """
+    Parse an amount into integer cents, returning `default` when it cannot be parsed
+    """
+    try:
+        return parse_cents(value)
+    except (ValueError, ArithmeticError):
+        return default
+
+
+def format_cents(cents):
+    """
+    Render integer cents as an exact decimal string, e.g. -62000 -> "-620.00"
+    """
+    sign = '-' if cents < 0 else ''
+    whole, frac = divmod(abs(int(cents)), 100)
+    return f"{sign}{whole}.{frac:02d}"
+
+
+def cents_to_dollars(cents):
+    """
+    Convert integer cents to a float dollar value for display and JSON responses
+    """
+    return int(cents) / 100
+
+
+def cents_array(values):
+    """
+    Build an int64 array of cents from amounts in any format `parse_cents` accepts
+    """
+    return np.fromiter((to_cents(v) for v in values), dtype=np.int64)
+
+
+def sum_cents(cents):
+    """
+    Exact sum of an iterable or array of cents
+    """
+    return int(np.asarray(cents, dtype=np.int64).sum())
+
+
+def group_sum_cents(keys, cents):
+    """
+    Exact per-key sums of cents, e.g. expenses by card or by category.
+
+    Returns a dict mapping each distinct key to its total in cents.
+    """
+    cents = np.asarray(cents, dtype=np.int64)
+    if cents.size == 0:
+        return {}
+    labels = np.asarray([str(k) for k in keys])
+    unique, inverse = np.unique(labels, return_inverse=True)
+    totals = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(totals, inverse, cents)
+    return {str(k): int(t) for k, t in zip(unique, totals)}
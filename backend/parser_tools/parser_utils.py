@@ -2,9 +2,10 @@
 
 from typing import TypedDict, List, Optional
 from datetime import datetime
-import re
 import logging
 
+from money import parse_cents, cents_to_dollars
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -12,7 +13,7 @@ class Transaction(TypedDict):
     """Type definition for a parsed transaction."""
     date: str  # YYYY-MM-DD format
     merchant: str
-    amount: float
+    amount_cents: int  # Exact amount in cents, negative for payments
     type: str  # "CHARGE" or "PAYMENT"
     card: str  # Card type e.g., "AMEX", "ZOLVE", etc.
 
@@ -34,6 +35,22 @@ def format_date(date_str: str, input_format: str = "%m/%d/%y") -> str:
         logger.warning(f"Error parsing date {date_str}: {e}")
         return date_str
 
+def clean_amount_cents(amount_str: str) -> int:
+    """
+    Clean and convert amount string to integer cents.
+    
+    Args:
+        amount_str: String representation of amount (e.g., "$123.45", "-$620.00", "1,234.56")
+        
+    Returns:
+        int: Exact amount in cents, 0 if the string is not an amount
+    """
+    try:
+        return parse_cents(amount_str)
+    except ValueError as e:
+        logger.warning(f"Error parsing amount {amount_str}: {e}")
+        return 0
+
 def clean_amount(amount_str: str) -> float:
     """
     Clean and convert amount string to float.
@@ -44,13 +61,7 @@ def clean_amount(amount_str: str) -> float:
     Returns:
         float: Cleaned amount value
     """
-    try:
-        # Remove currency symbols, commas and whitespace
-        cleaned = re.sub(r'[^\d.-]', '', amount_str)
-        return float(cleaned)
-    except ValueError as e:
-        logger.warning(f"Error parsing amount {amount_str}: {e}")
-        return 0.0
+    return cents_to_dollars(clean_amount_cents(amount_str))
 
 def clean_merchant(merchant: str) -> str:
     """
@@ -3,6 +3,7 @@ import re
 from datetime import datetime
 from smolagents import tool
 from bert_model import process_text_with_bert, extract_transactions, load_model
+from money import to_cents, parse_cents
 
 
 
@@ -37,7 +38,7 @@ def parse_amex_statement(pdf_path : str) -> dict:
             postprocessed_transactions.append({
                 'date': t['Date'],
                 'merchant': t['Merchant'],
-                'amount': float(t['Charge'].replace('$', '')),
+                'amount_cents': to_cents(t['Charge']),
                 'type': 'PAYMENT' if '-' in t['Charge'] else 'CHARGE',
                 'card': 'AMEX'
             })
@@ -70,7 +71,7 @@ def parse_zolve_statement(pdf_path : str) -> dict:
             postprocessed_transactions.append({
                 'date': t['Date'],
                 'merchant': t['Merchant'],
-                'amount': float(t['Charge'].replace('$', '')),
+                'amount_cents': to_cents(t['Charge']),
                 'type': 'PAYMENT' if '-' in t['Charge'] else 'CHARGE',
                 'card': 'ZOLVE'
             })
@@ -104,7 +105,7 @@ def parse_freedom_statement(pdf_path: str) -> dict:
             postprocessed_transactions.append({
                 'date': t['Date'],
                 'merchant': t['Merchant'],
-                'amount': float(t['Charge'].replace('$', '')),
+                'amount_cents': to_cents(t['Charge']),
                 'type': 'PAYMENT' if '-' in t['Charge'] else 'CHARGE',
                 'card': 'FREEDOM'
             })
@@ -120,8 +121,8 @@ def parse_checking_statement(pdf_path):
     """
     transactions = []
     account_summary = {
-        'beginning_balance': None,
-        'ending_balance': None
+        'beginning_balance_cents': None,
+        'ending_balance_cents': None
     }
     
     try:
@@ -146,14 +147,12 @@ def parse_checking_statement(pdf_path):
                         try:
                             # Handle Beginning Balance
                             if "Beginning Balance" in line:
-                                balance_str = line.split('$')[-1].replace(',', '')
-                                account_summary['beginning_balance'] = float(balance_str)
+                                account_summary['beginning_balance_cents'] = parse_cents(line.split('$')[-1])
                                 continue
                             
                             # Handle Ending Balance
                             if "Ending Balance" in line:
-                                balance_str = line.split('$')[-1].replace(',', '')
-                                account_summary['ending_balance'] = float(balance_str)
+                                account_summary['ending_balance_cents'] = parse_cents(line.split('$')[-1])
                                 continue
                             
                             # Skip header line
@@ -178,10 +177,8 @@ def parse_checking_statement(pdf_path):
                             # Look for dollar amounts with negative signs and decimal points
                             amounts = re.findall(r'-?\$?[\d,]+\.\d{2}', line)
                             if len(amounts) >= 2:  # We need at least amount and balance
-                                amount_str = amounts[-2].replace('$', '').replace(',', '')
-                                balance_str = amounts[-1].replace('$', '').replace(',', '')
-                                amount = float(amount_str)
-                                balance = float(balance_str)
+                                amount = parse_cents(amounts[-2])
+                                balance = parse_cents(amounts[-1])
                                 
                                 # Extract description (everything between date and amount)
                                 description = ' '.join(parts[1:-2]).strip()
@@ -189,8 +186,8 @@ def parse_checking_statement(pdf_path):
                                 transaction = {
                                     'date': date,
                                     'description': description,
-                                    'amount': amount,
-                                    'balance': balance,
+                                    'amount_cents': amount,
+                                    'balance_cents': balance,
                                 }
                                 
                                 transactions.append(transaction)
@@ -4,9 +4,33 @@ import os
 from fastapi import UploadFile
 from transformers import BertTokenizerFast, BertForTokenClassification
 import torch
-from database import store_transaction, store_embedding
+from database import (
+    store_transactions, store_embeddings, get_category_memo, record_category_memo,
+    find_similar_transactions, get_labeled_metadata, get_transaction_embedding,
+    finalize_provisional_transaction, refresh_category_centroids, claim_provisional_transactions,
+    prune_embedding_vectors
+)
+from money import to_cents, cents_to_dollars
+from merchant_normalizer import normalize_merchant
+from agent_pool import AgentPool
+from llm_executor import llm_executor
+from llm_provider import create_model
+from category_memo import CategoryMemo
+from category_classifier import ClassifierStore, CLASSIFIER_MIN_CONFIDENCE
+from knn_categorizer import KnnTier, KNN_K, KNN_MIN_SIMILARITY, transaction_query_text
+from categorization import build_agent_task
+from llm_pipeline import CategorizationPipeline, transaction_for_prompt, new_mode_usage
+from llm_usage import stage
+from embedding_cache import EmbeddingCache, embedding_key, normalize_text
+from similarity_cache import similarity_cache
+from db_executor import run_blocking
+from embedding_codec import embedding_codec
+from singleflight import SingleFlight, TTLCache, flight_key
+from deadline import Deadline, fallback_analysis
+import asyncio
+import contextvars
 from sentence_transformers import SentenceTransformer
-from smolagents import CodeAgent, LiteLLMModel, tool
+from smolagents import CodeAgent, tool
 import numpy as np
 import time
 import requests
@@ -21,13 +45,16 @@ tokenizer = BertTokenizerFast.from_pretrained(model_path)
 # Load model (automatically detects .safetensors)
 model = BertForTokenClassification.from_pretrained(model_path)
 
-agent_model = LiteLLMModel(
-            model_id=os.environ.get("ANTHROPIC_MODEL"),  # Ensure this is set in your environment
-            api_key=os.environ.get("ANTHROPIC_API_KEY"),  # Ensure this is set in your environment
-        )
+# Responses are cached on disk by prompt hash (see llm_cache.py; LLM_CACHE_BYPASS=1 disables).
+# LLM_PROVIDER=fake swaps in the offline stand-in (see fake_model.py)
+agent_model = create_model()
 
 # Load sentence transformer for embeddings
-embedding_model = SentenceTransformer("intfloat/multilingual-e5-large-instruct")
+EMBEDDING_MODEL_ID = "intfloat/multilingual-e5-large-instruct"
+embedding_model = SentenceTransformer(EMBEDDING_MODEL_ID)
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+# Memory LRU + memory-mapped float16 disk store of embeddings by (model, text)
+embedding_cache = EmbeddingCache(EMBEDDING_MODEL_ID, embedding_model.get_sentence_embedding_dimension())
 
 def extract_transactions(text_list : list, tokenizer=tokenizer, model=model):
     """
@@ -155,6 +182,11 @@ def process_entities_into_transaction(model, tokenizer, text):
 
     return transactions
 
+# User whose upload is being processed; propagates into LLM worker threads with the context
+current_user = contextvars.ContextVar("current_user", default=None)
+# Historical-context lookups only scan the partitions of this many closest categories
+SIMILARITY_CATEGORY_PROBE = int(os.environ.get("SIMILARITY_CATEGORY_PROBE", 3))
+
 @tool
 def get_historical_context(note_to_search : str) -> dict:
     """
@@ -166,14 +198,27 @@ def get_historical_context(note_to_search : str) -> dict:
     """
     # Use the vector similarity search capability of Supabase
     from database import find_similar_transactions
-    try:
-        note_embedding = create_embedding(note_to_search)
-    except Exception as e:
-        print(f"Error creating embedding for note: {e}")
-        return "Error creating embedding for note"
-
-    # Find similar transactions based on the note embedding
-    result = find_similar_transactions(note_embedding.tolist(), limit=5)
+    user_id = current_user.get()
+    # A repeated paraphrase is answered without embedding it again
+    text_key = ('text', normalize_text(note_to_search), SIMILARITY_CATEGORY_PROBE)
+    result = similarity_cache.get(user_id, text_key) if user_id else None
+    if result is None:
+        generation = similarity_cache.generation(user_id)
+        with stage('historical_context'):
+            try:
+                note_embedding = create_embedding(note_to_search)
+            except Exception as e:
+                print(f"Error creating embedding for note: {e}")
+                return "Error creating embedding for note"
+
+            # Find similar transactions based on the note embedding
+            result = find_similar_transactions(note_embedding.tolist(), limit=5, user_id=user_id,
+                                               category_probe=SIMILARITY_CATEGORY_PROBE, default=None)
+        if result is None:
+            # Not cached, so the next call searches again
+            return "Error searching similar transactions"
+        if user_id:
+            similarity_cache.put(user_id, text_key, result, generation)
     if not result:
         print("No similar transactions found")
         return "No similar transactions found"
@@ -294,57 +339,345 @@ card_issuers = {    'AMEX': parse_amex_transaction,
                     'ZOLVE': 'ZOLVE' # TODO: Implement ZOLVE transaction parsing
                 }
 
+# First-page phrases that identify an issuer when the LLM misses the deadline or fails
+issuer_markers = {
+    'AMEX': ('american express', 'americanexpress.com'),
+    'FREEDOM': ('chase freedom', 'freedom unlimited', 'freedom flex'),
+    'ZOLVE': ('zolve',),
+}
+
+def detect_issuer_locally(first_page_text):
+    """
+    The issuer whose marker phrase appears on the first page, or None
+    """
+    text = (first_page_text or '').lower()
+    for issuer, markers in issuer_markers.items():
+        if any(marker in text for marker in markers):
+            return issuer
+    return None
+
+# Agents are built once per process and reused across transactions and uploads
+categorization_agents = AgentPool(lambda: CodeAgent(
+    tools=[get_historical_context, get_human_feedback],
+    model=agent_model,
+    # add_base_tools=True,
+    additional_authorized_imports=["pandas", "datetime", "numpy"]
+))
+
+issuer_agents = AgentPool(lambda: CodeAgent(
+    model=agent_model,
+    tools=[],
+    add_base_tools=False
+))
+
 def get_category_and_note(transaction):
     """
     Get category and note for a transaction
     """
-    analysis_agent = CodeAgent(
-        tools=[get_historical_context, get_human_feedback],
-        model=agent_model,
-        # add_base_tools=True,
-        additional_authorized_imports=["pandas", "datetime", "numpy"] 
-    )
+    try:
+        # Static instructions first so the provider can cache them across transactions
+        analysis_prompt = build_agent_task(transaction_for_prompt(transaction))
 
+        transaction_analysis = categorization_agents.run(analysis_prompt)
 
-    try:
-        analysis_prompt = f"""You are a financial analyst assisting in transaction categorization and pattern recognition.  
+        return transaction_analysis
 
-        Context:  
-        Analyze the given transaction based on your understanding and reasoning to categorize it.  
-        Refer to previous user transactions using the `get_historical_context` tool if relevant.  
-        Use your knowledge to craft a short note describing the charge type.  
+    except Exception as e:
+        print(f"Error during transaction analysis: {e}")
+        raise Exception(f"Error during transaction analysis: {e}")
 
-        Clarification:  
-        Only ask the user for feedback **if necessary**—specifically, when:  
-        - No relevant historical data is found.  
-        - The charge description is unclear.  
-        - The charge amount is unusual.  
+# Batch, fast-mode and agent categorization on the shared model and executor
+categorization_pipeline = CategorizationPipeline(agent_model, llm_executor, get_category_and_note)
+categorize_transactions = categorization_pipeline.categorize_transactions
 
-        Otherwise, categorize the transaction using logical inference.  
+# Nearest-centroid classifiers over transaction embeddings, per user and global
+classifiers = ClassifierStore()
 
-        Output Format:  
-        Return a Python dictionary in this exact structure:  
+def classifier_embeddings(transactions):
+    """
+    What the classifiers learn from and are queried with: embeddings of each
+    transaction's merchant lookup query, the same text at training and inference
+    """
+    return create_embeddings([transaction_query_text(transaction) for transaction in transactions])
 
-        {{  
-            "category": <<One of ['Housing', 'Grocery', 'Fun', 'Investment', 'Utilities', 'Payments', 'Miscellaneous']>>,  
-            "note": <<Concise explanation of the transaction for future reference>>  
-        }}  
+def get_classifier(user_id):
+    """
+    The classifier to use for a user, trained from stored labels on first use;
+    None while there are too few samples
+    """
+    for key in (user_id, 'global'):
+        if not classifiers.has_model(key):
+            labeled = get_labeled_metadata(None if key == 'global' else user_id)
+            X = classifier_embeddings(labeled) if labeled else []
+            classifiers.train(key, X, [metadata['category'] for metadata in labeled])
+            classifiers.save(key)
+    return classifiers.for_user(user_id)
+
+def correct_classifiers(user_id, metadata, category):
+    """
+    Move a transaction from its old category to the user's correction in the
+    user's and global classifiers, and save both
+    """
+    embedding = classifier_embeddings([metadata])[0]
+    classifiers.correct(user_id, embedding, metadata.get('category'), category)
+    classifiers.save(user_id, 'global')
 
-        Transaction: {transaction}"""
-            
-        transaction_analysis = analysis_agent.run(analysis_prompt)
+async def learn_category_correction(user_id, previous, category):
+    """
+    Teach the classifiers a user's category correction. `previous` is the
+    transaction's embedding row read before the label changed. Meant to run
+    as a background job after the update, so failures are logged, not raised.
+    """
+    if not previous or not previous.get('metadata'):
+        return
+    try:
+        await run_blocking(correct_classifiers, user_id, previous['metadata'], category)
+    except Exception as e:
+        print(f"Error learning category correction: {e}")
 
-        return transaction_analysis
+def find_neighbours(embedding, user_id, k=KNN_K):
+    """
+    Nearest labeled past transactions of a user for a query embedding, with their similarity
+    """
+    with stage('historical_context'):
+        return find_similar_transactions(embedding.tolist(), limit=k, match_threshold=KNN_MIN_SIMILARITY,
+                                         with_similarity=True, user_id=user_id)
+
+# Finished categorizations by user, merchant and amount bucket, and the ones still in flight
+categorization_cache = TTLCache()
+inflight_categorizations = SingleFlight(cache=categorization_cache)
+
+async def categorize_coalesced(user_id, transactions, contexts=None, usage=None, stats=None):
+    """
+    categorize_transactions without duplicate LLM work: a user's rows sharing a
+    merchant and amount bucket are categorized once, recent results come from the
+    categorization cache, and keys another upload of the same user is already
+    categorizing are awaited instead of requested again. Returns one analysis
+    (or None) per row.
+    """
+    contexts = contexts or [None] * len(transactions)
+    stats = stats if stats is not None else {}
+    analyses = [None] * len(transactions)
+
+    groups = {}
+    for i, transaction in enumerate(transactions):
+        groups.setdefault(flight_key(user_id, transaction), []).append(i)
+
+    leaders, followers = [], []
+    for key, rows in groups.items():
+        cached_analysis = categorization_cache.get(key)
+        if cached_analysis is not None:
+            for i in rows:
+                analyses[i] = cached_analysis
+            stats['cache_hits'] = stats.get('cache_hits', 0) + len(rows)
+            continue
+        future, leader = inflight_categorizations.claim(key)
+        (leaders if leader else followers).append((key, rows, future))
+
+    results = [None] * len(leaders)
+    try:
+        results = await categorize_transactions(
+            [transactions[rows[0]] for _, rows, _ in leaders],
+            [contexts[rows[0]] for _, rows, _ in leaders],
+            usage
+        )
+    finally:
+        # Always release waiters, even if this upload failed or was cancelled
+        for (key, rows, _), analysis in zip(leaders, results):
+            inflight_categorizations.resolve(key, analysis)
+            for i in rows:
+                analyses[i] = analysis
+
+    for key, rows, future in followers:
+        analysis = await future
+        for i in rows:
+            analyses[i] = analysis
+
+    stats['llm_requests'] = len(leaders)
+    stats['coalesced_rows'] = len(transactions) - len(leaders) - stats.get('cache_hits', 0)
+    stats['inflight_waits'] = len(followers)
+    return analyses
+
+def embedding_note(transaction, db_transaction):
+    """
+    Text embedded for a stored transaction: its note, or merchant and charge without one
+    """
+    return db_transaction.get('note') or f"{transaction.get('Merchant')} {transaction.get('Charge')}"
 
+async def index_stored_transactions(user_id, rows):
+    """
+    Make stored, non-provisional transactions visible to the memo, similarity search
+    and classifiers. `rows` holds (stored row, transaction, db_transaction); their
+    notes are embedded together in one batch and stored in bulk.
+    """
+    if not rows:
+        return
+    # Create every embedding of the statement, notes and classifier queries, in one call
+    notes = [embedding_note(transaction, db_transaction) for _, transaction, db_transaction in rows]
+    queries = [transaction_query_text(db_transaction) for _, _, db_transaction in rows]
+    try:
+        embeddings = create_embeddings(notes + queries)
+        embeddings, query_embeddings = embeddings[:len(notes)], embeddings[len(notes):]
     except Exception as e:
-        print(f"Error during transaction analysis: {e}")
-        raise Exception(f"Error during transaction analysis: {e}")
+        print(f"Error creating embeddings for {len(rows)} stored transactions: {e}")
+        return
+    # One memo write per (merchant, category) rather than per row. Only LLM answers
+    # add weight: memo, classifier and kNN answers would reinforce themselves, and
+    # user corrections update the memo when they are made.
+    memo_weights = {}
+    for _, _, db_transaction in rows:
+        if db_transaction.get('source') != 'llm':
+            continue
+        key = (db_transaction.get('merchant_key'), db_transaction.get('category'))
+        weight, _ = memo_weights.get(key, (0, None))
+        memo_weights[key] = (weight + 1, db_transaction.get('note'))
+    for (merchant_key, category), (weight, note) in memo_weights.items():
+        await record_category_memo(user_id, merchant_key, category, note, weight=weight)
+
+    await store_embeddings([{
+        'transaction_id': stored['id'],
+        'table_name': f"{db_transaction.get('category')}_transactions",
+        'embedding': embedding.tolist(),
+        'metadata': {
+            'user_id': user_id,
+            'merchant': db_transaction.get('merchant'),
+            'merchant_key': db_transaction.get('merchant_key'),
+            'amount': cents_to_dollars(db_transaction['amount_cents']),
+            'category': db_transaction.get('category'),
+            'card': db_transaction.get('card'),
+            'note': db_transaction.get('note')
+        },
+        'content_key': embedding_content_key(note)
+    } for (stored, _, db_transaction), note, embedding in zip(rows, notes, embeddings)])
+    labeled = [i for i, (_, _, db_transaction) in enumerate(rows) if db_transaction.get('category')]
+    try:
+        classifiers.learn_batch(user_id, query_embeddings[labeled], [rows[i][2]['category'] for i in labeled])
+    except Exception as e:
+        print(f"Error training classifiers on {len(labeled)} transactions: {e}")
+    await refresh_category_centroids(user_id)
+
+# Background jobs finishing provisional rows; held here so they are not garbage collected
+background_jobs = set()
+# Ids of provisional rows a background job of this process is finishing; the sweeper skips them
+provisional_in_flight = set()
+# Seconds between sweeps for provisional rows whose background job was lost; 0 disables the sweeper
+PROVISIONAL_SWEEP_SECONDS = float(os.environ.get("PROVISIONAL_SWEEP_SECONDS", 600))
+PROVISIONAL_SWEEP_BATCH = int(os.environ.get("PROVISIONAL_SWEEP_BATCH", 200))
+
+async def finish_provisional(user_id, llm_task, rows):
+    """
+    Wait for the LLM categorization an upload stopped waiting for, then replace
+    the provisional categories of its stored rows. `rows` holds
+    (position in the task's results, stored row, transaction, db_transaction).
+    Returns how many rows were finalized.
+    """
+    try:
+        try:
+            analyses = await llm_task
+        except Exception as e:
+            print(f"Background categorization failed, rows stay provisional: {e}")
+            return 0
+        finalized = []
+        for position, stored, transaction, db_transaction in rows:
+            analysis = analyses[position]
+            if not analysis:
+                continue
+            try:
+                if not await finalize_provisional_transaction(stored['id'], analysis['category'], analysis['note']):
+                    continue  # Edited by the user in the meantime
+                db_transaction['category'] = analysis['category']
+                db_transaction['note'] = analysis['note']
+                db_transaction['source'] = analysis.get('source', 'llm')
+                finalized.append((stored, transaction, db_transaction))
+            except Exception as e:
+                print(f"Error finalizing provisional transaction {stored.get('id')}: {e}")
+        await index_stored_transactions(user_id, finalized)
+        classifiers.save(user_id, 'global')
+        print(f"Finalized {len(finalized)}/{len(rows)} provisional transactions")
+        return len(finalized)
+    finally:
+        provisional_in_flight.difference_update(stored['id'] for _, stored, _, _ in rows)
+
+async def sweep_provisional(limit=None):
+    """
+    Categorize provisional rows whose background job was lost, such as to a
+    restart. Returns how many were finalized. Workers sweep independently and
+    only take rows no job has claimed within PROVISIONAL_CLAIM_SECONDS, claiming
+    them as they read them; finalizing only rows still provisional keeps a row
+    swept twice from being written twice.
+    """
+    rows = [row for row in await claim_provisional_transactions(limit or PROVISIONAL_SWEEP_BATCH)
+            if row['id'] not in provisional_in_flight]
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row['user_id'], []).append(row)
+    finalized = 0
+    for user_id, user_rows in by_user.items():
+        current_user.set(user_id)
+        provisional_in_flight.update(row['id'] for row in user_rows)
+        db_transactions = [{
+            'date': row.get('date'),
+            'merchant': row.get('merchant'),
+            'merchant_key': row.get('merchant_key') or normalize_merchant(row.get('merchant')),
+            'amount_cents': to_cents(row.get('charge') or 0),
+            'card': row.get('card'),
+        } for row in user_rows]
+        llm_task = asyncio.create_task(categorize_transactions(db_transactions))
+        finalized += await finish_provisional(user_id, llm_task, [
+            (position, row, {'Merchant': row.get('merchant'), 'Charge': row.get('charge')}, db_transaction)
+            for position, (row, db_transaction) in enumerate(zip(user_rows, db_transactions))
+        ])
+    return finalized
+
+# Seconds between prunes of unreferenced embedding vectors; 0 disables them
+EMBEDDING_PRUNE_SECONDS = float(os.environ.get("EMBEDDING_PRUNE_SECONDS", 3600))
+
+async def prune_embedding_vectors_periodically():
+    """
+    Delete unreferenced shared embedding vectors every EMBEDDING_PRUNE_SECONDS
+    """
+    while EMBEDDING_PRUNE_SECONDS > 0:
+        await asyncio.sleep(EMBEDDING_PRUNE_SECONDS)
+        await prune_embedding_vectors()
 
+async def sweep_provisional_periodically():
+    """
+    Run sweep_provisional at startup and then every PROVISIONAL_SWEEP_SECONDS
+    """
+    while PROVISIONAL_SWEEP_SECONDS > 0:
+        try:
+            swept = await sweep_provisional()
+            if swept:
+                print(f"Provisional sweep finalized {swept} transactions")
+        except Exception as e:
+            print(f"Error sweeping provisional transactions: {e}")
+        await asyncio.sleep(PROVISIONAL_SWEEP_SECONDS)
 
-async def process_pdf_and_store(file: UploadFile, user_id: str):
+def start_background_job(coroutine):
+    job = asyncio.create_task(coroutine)
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+    return job
+
+async def settle(task):
     """
-    Process a PDF file, extract transactions, and store them in the database
+    Await a task its upload stopped waiting for. Its answers still reach other
+    uploads coalesced onto it and the categorization cache, and a failure is logged
     """
+    try:
+        await task
+    except Exception as e:
+        print(f"Background task failed: {e}")
+
+async def process_pdf_and_store(file: UploadFile, user_id: str, deadline: Deadline = None):
+    """
+    Process a PDF file, extract transactions, and store them in the database.
+    Rows the LLM has not categorized by `deadline` are stored with a provisional
+    best-effort category and finished in the background.
+    """
+    deadline = deadline or Deadline()
+    # Lets agent tools (get_historical_context) search this user's history only
+    current_user.set(user_id)
     # Create a temporary file
     with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
         # Write the uploaded file content to the temporary file
@@ -357,14 +690,11 @@ async def process_pdf_and_store(file: UploadFile, user_id: str):
         for page in pdf.pages:
             first_page_text = page.extract_text()
             break  # Only need the first page for card issuer detection
+    local_issuer = detect_issuer_locally(first_page_text)
+    # The LLM categorization task, until it is finished or handed to a background job
+    llm_task = None
     
     try:
-        extraction_agent = CodeAgent(
-            model=agent_model,
-            tools=[],
-            add_base_tools=False
-        )
-
         extractor_text =f"""You are an information extractor specialized in identifying financial institutions.  
 
                         Context:  
@@ -376,15 +706,27 @@ async def process_pdf_and_store(file: UploadFile, user_id: str):
                         Output Format:  
                         Return only the card issuer name from the given list—nothing else."""
 
-        card_issuer_response = extraction_agent.run(extractor_text)
+        # Issuer detection counts against the upload's deadline too
+        with stage('issuer_detection'):
+            issuer_task = asyncio.create_task(llm_executor.call(issuer_agents.run, extractor_text))
+            if await deadline.wait(issuer_task):
+                card_issuer_response = issuer_task.result()
+            else:
+                issuer_task.cancel()
+                print(f"Deadline reached during card issuer detection, using {local_issuer}")
+                card_issuer_response = local_issuer or ''
     except Exception as e:
         print(f"Error during card issuer detection: {e}")
-        return {
-            'success': False,
-            'error': str(e)
-        }
-    
-    postprocessing_function = card_issuers.get(card_issuer_response.strip(), None)
+        if not local_issuer:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        card_issuer_response = local_issuer
+
+    if str(card_issuer_response).strip() not in card_issuers and local_issuer:
+        card_issuer_response = local_issuer
+    postprocessing_function = card_issuers.get(str(card_issuer_response).strip(), None)
     if not postprocessing_function:
         return {
             'success': False,
@@ -405,8 +747,8 @@ async def process_pdf_and_store(file: UploadFile, user_id: str):
         transactions = extract_transactions(text_list)
         print("Length of transactions:", len(transactions))
         
-        # Store each transaction
-        stored_transactions = []
+        # Build database rows for every usable transaction
+        pending = []
         for extracted_transaction in transactions:
             try:
                 transaction = postprocessing_function(extracted_transaction)
@@ -419,52 +761,137 @@ async def process_pdf_and_store(file: UploadFile, user_id: str):
                 db_transaction = {
                     'date': transaction.get('Date'),
                     'merchant': transaction.get('Merchant'),
-                    'amount': parse_amount(transaction.get('Charge', '0')),
+                    'merchant_key': normalize_merchant(transaction.get('Merchant')),
+                    'amount_cents': parse_amount(transaction.get('Charge', '0')),
                     'card': transaction.get('Card', 'UNKNOWN'),
                     # Category and note will be filled later by LLM
                 }
-                if db_transaction['amount'] == 0:
+                if db_transaction['amount_cents'] == 0:
                     print(f"Skipping transaction with zero amount: {db_transaction}")
                     continue
-                
-                print(f"Processing transaction: {db_transaction}")
-                analysis = get_category_and_note(db_transaction)
-                print("Analysis result:", analysis)
-                if analysis and 'category' in analysis and 'note' in analysis:
-                    db_transaction['category'] = analysis['category']
-                    db_transaction['note'] = analysis['note']
-
-            
-                # Store in database
-                result = await store_transaction(user_id, db_transaction)
-                if result:
-                    stored_transactions.append(result)
-                    
-                    # Generate note for the transaction (will be updated later by LLM)
-                    if not db_transaction.get('note'):
-                        note = f"{transaction.get('Merchant')} {transaction.get('Charge')}"
-                    else:
-                        note = db_transaction['note']
-                    
-                    # Create and store embedding
-                    print(f"Creating embedding for note: {note}")
-                    embedding = create_embedding(note)
-                    table_name = f'{db_transaction['category']}_transactions' 
-                    print("Storing embedding now ...")
-                    await store_embedding(result['id'], table_name, embedding.tolist(), {
-                        'merchant': db_transaction.get('merchant'),
-                        'amount': db_transaction.get('amount'),
-                        'category': db_transaction.get('category'),
-                        'note': db_transaction.get('note')
-                    })
+                pending.append((transaction, db_transaction))
             except Exception as e:
-                print(f"Error processing transaction {transaction}: {e}")
+                print(f"Error processing transaction {extracted_transaction}: {e}")
                 continue
-        
+
+        # Answer recurring merchants from the user's own history first
+        memo = CategoryMemo(await get_category_memo(user_id))
+        analyses = [memo.lookup(db_transaction.get('merchant_key')) for _, db_transaction in pending]
+        print(f"Category memo answered {memo.hits}/{memo.lookups} transactions")
+
+        # Local classifier first, then nearest labeled neighbours, before any LLM call
+        # First use pages the user's stored embeddings; keep that off the event loop
+        classifier = await run_blocking(get_classifier, user_id)
+        classifier_hits = 0
+        classifier_guesses = {}
+        knn = KnnTier()
+        audits = []
+        contexts = {}
+        lookups = [i for i, analysis in enumerate(analyses) if analysis is None]
+        try:
+            query_embeddings = create_embeddings([transaction_query_text(pending[i][1]) for i in lookups])
+        except Exception as e:
+            print(f"Error creating embeddings for transaction lookup: {e}")
+            lookups, query_embeddings = [], []
+        for i, query_embedding in zip(lookups, query_embeddings):
+            if classifier:
+                category, probability = classifier.predict(query_embedding)
+                classifier_guesses[i] = (category, probability)
+                if probability >= CLASSIFIER_MIN_CONFIDENCE:
+                    analyses[i] = {'category': category, 'note': '', 'source': 'classifier', 'confidence': round(probability, 4)}
+                    classifier_hits += 1
+                    continue
+            neighbours = await run_blocking(find_neighbours, query_embedding, user_id)
+            contexts[i] = neighbours
+            analyses[i], audit = knn.categorize(neighbours)
+            if audit:
+                audits.append(i)
+        print(f"Classifier answered {classifier_hits} transactions")
+
+        # Categorize the rest of the statement with the LLM, one request per distinct merchant,
+        # for as long as the deadline allows
+        with stage('categorization'):
+            misses = [i for i, analysis in enumerate(analyses) if analysis is None]
+            mode_usage = new_mode_usage()
+            coalescing = {}
+            llm_task = asyncio.create_task(categorize_coalesced(
+                user_id, [pending[i][1] for i in misses], [contexts.get(i) for i in misses], mode_usage, coalescing
+            ))
+            provisional = {}
+            if await deadline.wait(llm_task):
+                for i, analysis in zip(misses, llm_task.result()):
+                    analyses[i] = analysis
+                print(f"Coalesced LLM categorization: {coalescing}")
+            else:
+                # Out of time: best effort from the local tiers now, the LLM's answer later
+                for position, i in enumerate(misses):
+                    analyses[i] = fallback_analysis(
+                        memo.best(pending[i][1].get('merchant_key')), classifier_guesses.get(i), contexts.get(i)
+                    )
+                    provisional[i] = position
+                print(f"Deadline reached, storing {len(provisional)} transactions as provisional")
+
+            # Check a sample of kNN answers against the LLM, only while there is time left
+            if audits and not deadline.expired():
+                audit_task = asyncio.create_task(categorize_transactions(
+                    [pending[i][1] for i in audits], [contexts.get(i) for i in audits], mode_usage
+                ))
+                if await deadline.wait(audit_task):
+                    for i, analysis in zip(audits, audit_task.result()):
+                        knn.record_audit(analyses[i]['category'], analysis)
+                else:
+                    audit_task.cancel()
+        print(f"kNN tier: {knn.stats()}")
+
+        # Store the statement's transactions in a few bulk upserts
+        for i, ((transaction, db_transaction), analysis) in enumerate(zip(pending, analyses)):
+            print("Analysis result:", analysis)
+            if analysis:
+                db_transaction['category'] = analysis['category']
+                db_transaction['note'] = analysis['note']
+                db_transaction['source'] = analysis.get('source', 'llm')
+            db_transaction['provisional'] = i in provisional
+        results = await store_transactions(user_id, [db_transaction for _, db_transaction in pending])
+
+        stored_transactions = []
+        indexed_rows = []
+        provisional_rows = []
+        for i, ((transaction, db_transaction), (result, created)) in enumerate(zip(pending, results)):
+            if not result:
+                continue
+            stored_transactions.append(result)
+            if not created:
+                # Stored and indexed by an earlier upload of this statement
+                continue
+            if i in provisional:
+                # Indexed once the background job settles the category
+                provisional_in_flight.add(result['id'])
+                provisional_rows.append((provisional[i], result, transaction, db_transaction))
+            else:
+                indexed_rows.append((result, transaction, db_transaction))
+        await index_stored_transactions(user_id, indexed_rows)
+        classifiers.save(user_id, 'global')
+        if provisional_rows:
+            start_background_job(finish_provisional(user_id, llm_task, provisional_rows))
+            llm_task = None
+
         return {
             'success': True,
             'transactions_count': len(stored_transactions),
-            'transactions': stored_transactions
+            'transactions': stored_transactions,
+            'provisional_count': len(provisional_rows),
+            'deadline': {**deadline.as_dict(), 'met': not provisional},
+            'categorization': {
+                **memo.stats(),
+                'classifier_hits': classifier_hits,
+                **knn.stats(),
+                'coalescing': coalescing,
+                'modes': {mode: u.as_dict() for mode, u in mode_usage.items()},
+                'prompt_cache': {
+                    'cached_input_tokens': sum(u.cache_read_tokens for u in mode_usage.values()),
+                    'uncached_input_tokens': sum(max(0, u.input_tokens - u.cache_read_tokens) for u in mode_usage.values()),
+                }
+            }
         }
     
     except Exception as e:
@@ -473,28 +900,55 @@ async def process_pdf_and_store(file: UploadFile, user_id: str):
             'error': str(e)
         }
     finally:
+        # No stored row waits for a late answer, but the LLM work keeps an owner
+        if llm_task is not None:
+            start_background_job(settle(llm_task))
         # Clean up the temporary file
         os.unlink(temp_file_path)
 
 def parse_amount(amount_str):
     """
-    Parse amount string to float
+    Parse amount string to integer cents (0 if it cannot be parsed)
+    """
+    return to_cents(amount_str)
+
+def create_embeddings(texts, batch_size=None):
+    """
+    Create unit-normalized vector embeddings for many texts, from the embedding
+    cache where possible and with a single encode call for the rest. They are
+    truncated to EMBEDDING_DIMENSIONS when that is set.
+    """
+    return embedding_codec.compact(embedding_cache.embed(texts, lambda missing: encode_texts(missing, batch_size)))
+
+def encode_texts(texts, batch_size=None):
+    """
+    Encode texts with the sentence transformer in one batched call
     """
-    # Remove $ and commas, then convert to float
-    cleaned = amount_str.replace(" ","").replace('$', '').replace(',', '')
     try:
-        return float(cleaned)
-    except ValueError:
-        return 0.0
+        # Use sentence transformer to create embeddings
+        embeddings = embedding_model.encode(
+            texts,
+            batch_size=batch_size or EMBEDDING_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        print(f"Embeddings created for {len(texts)} texts")
+    except Exception as e:
+        print(f"Error creating embeddings: {e}")
+        raise
+    return embeddings
+
+def embedding_content_key(text):
+    """
+    Content address of the stored embedding of `text`: the model, the dimensions
+    it is truncated to and the normalized text
+    """
+    model = f"{EMBEDDING_MODEL_ID}/{embedding_codec.dimensions or 'full'}"
+    return embedding_key(model, text).decode("ascii")
 
 def create_embedding(text):
     """
     Create vector embedding from text
     """
-    try:
-        # Use sentence transformer to create embedding
-        embedding = embedding_model.encode([text])
-        print(f"Embedding created for text: {text}")
-    except Exception as e:
-        print(f"Error creating embedding: {e}")
-    return embedding[0]
\ No newline at end of file
+    return create_embeddings([text])[0]
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Provider prompt caching for the long, static parts of our prompts.
+
+Categorization prompts are a long instruction block followed by a small
+per-transaction suffix. with_cache_control() ends every static prefix with an
+Anthropic-style ephemeral cache_control breakpoint. LiteLLM passes the
+breakpoint through to the provider, so repeated prefixes are billed as cache
+reads. A breakpoint is placed after the system message, and inside user
+messages after any registered static instruction block. That covers
+CodeAgent tasks, where smolagents puts our instructions in a user message
+after its own system prompt.
+
+Anthropic only caches a prefix of at least MIN_CACHEABLE_TOKENS tokens
+(1024 for Sonnet and Opus, 2048 for Haiku); a breakpoint on a shorter prefix
+is silently ignored. Our batch, fast-mode and agent instructions are all
+shorter than that today, so their breakpoints only pay off once the
+instructions grow past it, or with a provider that caches shorter prefixes.
+PrefixCacheStandIn simulates provider caching, minimum included, so the
+prefix/suffix split can be tested offline. FakeModel bills its calls through it.
+"""
+import dataclasses
+import hashlib
+import os
+import threading
+
+PROMPT_CACHING = os.environ.get("LLM_PROMPT_CACHING", "1").lower() in ("1", "true", "yes")
+# Anthropic accepts at most four cache breakpoints per request
+MAX_BREAKPOINTS = 4
+# Shortest prefix the provider caches; shorter breakpoints are billed as plain input
+MIN_CACHEABLE_TOKENS = int(os.environ.get("LLM_MIN_CACHEABLE_TOKENS", 1024))
+EPHEMERAL = {"type": "ephemeral"}
+
+_static_prefixes = []
+
+
+def register_static_prefix(text):
+    """
+    Declare `text` as a static instruction block worth caching wherever it starts a prompt
+    """
+    if text and text not in _static_prefixes:
+        _static_prefixes.append(text)
+    return text
+
+
+def supports_prompt_caching(model_id):
+    """
+    Whether the provider behind a LiteLLM model id takes explicit cache_control breakpoints
+    """
+    model_id = (model_id or "").lower()
+    return PROMPT_CACHING and ("claude" in model_id or "anthropic" in model_id)
+
+
+def _as_dict(message):
+    if isinstance(message, dict):
+        return dict(message)
+    if hasattr(message, "dict"):  # smolagents ChatMessage
+        return message.dict()
+    if dataclasses.is_dataclass(message):
+        return dataclasses.asdict(message)
+    return {"role": getattr(message, "role", "user"), "content": getattr(message, "content", "")}
+
+
+def _blocks(content):
+    if content is None:
+        return []
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return [dict(block) for block in content]
+
+
+def _role(message):
+    role = message.get("role")
+    return str(getattr(role, "value", role))
+
+
+def _prefix_end(text, prefixes):
+    """
+    End offset of the longest registered prefix found in `text`, or None
+    """
+    best = None
+    for prefix in prefixes:
+        start = text.find(prefix)
+        if start >= 0 and (best is None or start + len(prefix) > best):
+            best = start + len(prefix)
+    return best
+
+
+def with_cache_control(messages, prefixes=None):
+    """
+    Copy of `messages` with cache breakpoints at the end of the system message
+    and of every registered static prefix in user text blocks
+    """
+    prefixes = _static_prefixes if prefixes is None else prefixes
+    marked, breakpoints = [], 0
+    for message in messages:
+        message = _as_dict(message)
+        blocks = _blocks(message.get("content"))
+        role = _role(message)
+        if role == "system" and blocks and breakpoints < MAX_BREAKPOINTS:
+            blocks[-1] = {**blocks[-1], "cache_control": EPHEMERAL}
+            breakpoints += 1
+        elif role == "user":
+            split = []
+            for block in blocks:
+                text = block.get("text") if block.get("type") == "text" else None
+                end = _prefix_end(text, prefixes) if text and breakpoints < MAX_BREAKPOINTS else None
+                if not end or "cache_control" in block:
+                    split.append(block)
+                    continue
+                split.append({"type": "text", "text": text[:end], "cache_control": EPHEMERAL})
+                if text[end:]:
+                    split.append({"type": "text", "text": text[end:]})
+                breakpoints += 1
+            blocks = split
+        marked.append({**message, "content": blocks})
+    return marked
+
+
+def prompt_messages(prefix, suffix):
+    """
+    Chat messages for a prompt split into a static prefix (system) and a dynamic suffix (user)
+    """
+    return [
+        {"role": "system", "content": [{"type": "text", "text": prefix}]},
+        {"role": "user", "content": [{"type": "text", "text": suffix}]},
+    ]
+
+
+def estimate_tokens(text):
+    """
+    Rough token count for budgeting (about four characters per token)
+    """
+    return len(text) // 4 + 1
+
+
+@dataclasses.dataclass
+class TokenCounts:
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class StandInResponse:
+    """
+    Minimal stand-in for a smolagents ChatMessage with LiteLLM usage attached
+    """
+
+    def __init__(self, content, input_tokens, output_tokens, cache_read=0, cache_write=0):
+        self.role = "assistant"
+        self.content = content
+        self.tool_calls = None
+        self.token_usage = TokenCounts(input_tokens, output_tokens)
+        self.raw = {"usage": {
+            "prompt_tokens": input_tokens,
+            "completion_tokens": output_tokens,
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_write,
+        }}
+
+
+class PrefixCacheStandIn:
+    """
+    Offline model that bills prompts the way a caching provider would: the
+    longest breakpoint prefix seen before is a cache read, new breakpoint
+    prefixes are cache writes, and prefixes under `min_tokens` are not cached
+    at all. `respond(messages)` produces the reply text.
+    """
+
+    def __init__(self, respond=None, model_id="local/prefix-cache-stand-in", min_tokens=None):
+        self.model_id = model_id
+        self.respond = respond or (lambda messages: "")
+        self.min_tokens = MIN_CACHEABLE_TOKENS if min_tokens is None else min_tokens
+        self.cached_prefixes = set()
+        self._lock = threading.Lock()
+        self.calls = []
+
+    def bill(self, messages):
+        """
+        (input tokens, cache_read, cache_write) of a prompt, remembering its cacheable prefixes
+        """
+        # Hash of the prompt up to each breakpoint long enough to be cached, with its token count
+        text, breakpoints = "", []
+        for message in messages:
+            for block in _blocks(_as_dict(message).get("content")):
+                text += block.get("text") or ""
+                if "cache_control" in block and estimate_tokens(text) >= self.min_tokens:
+                    breakpoints.append((hashlib.sha256(text.encode("utf-8")).hexdigest(), estimate_tokens(text)))
+
+        with self._lock:
+            hits = [tokens for key, tokens in breakpoints if key in self.cached_prefixes]
+            cache_read = max(hits, default=0)
+            misses = [tokens for key, tokens in breakpoints if key not in self.cached_prefixes and tokens > cache_read]
+            cache_write = max(misses, default=cache_read) - cache_read
+            self.cached_prefixes.update(key for key, _ in breakpoints)
+        return estimate_tokens(text), cache_read, cache_write
+
+    def generate(self, messages, **kwargs):
+        messages = [_as_dict(m) for m in messages]
+        input_tokens, cache_read, cache_write = self.bill(messages)
+        content = self.respond(messages)
+        self.calls.append({"messages": messages, "kwargs": kwargs, "cache_read": cache_read, "cache_write": cache_write})
+        return StandInResponse(content, input_tokens, estimate_tokens(content), cache_read, cache_write)
+
+    __call__ = generate
@@ -0,0 +1,110 @@
+"""
+Per-user cache of similarity search results.
+
+A statement repeats merchants, and the categorization agent can call
+get_historical_context more than once with the same note. Results are
+cached under two kinds of key:
+
+    ('text', normalized note text, ...)     checked before the note is embedded
+    ('vector', quantized signature, ...)    checked before the index or RPC search
+
+The text key only matches notes that are equal up to whitespace. The
+signature rounds the unit query vector to SIMILARITY_CACHE_RESOLUTION, so it
+matches the same text embedded again or vectors within float noise of each
+other. Paraphrases embed to different vectors and are separate entries.
+Failed searches are not cached. store_embedding and category updates
+invalidate all of a user's entries. A generation counter
+keeps a search that raced with an invalidation from caching its stale result.
+Entries also expire after SIMILARITY_CACHE_TTL seconds, to pick up writes made
+by other processes.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SIMILARITY_CACHE_TTL = int(os.environ.get("SIMILARITY_CACHE_TTL", 600))
+SIMILARITY_CACHE_SIZE = int(os.environ.get("SIMILARITY_CACHE_SIZE", 1000))
+SIMILARITY_CACHE_RESOLUTION = float(os.environ.get("SIMILARITY_CACHE_RESOLUTION", 1 / 64))
+
+
+def query_signature(embedding, resolution=None):
+    """
+    Hash of the unit query vector rounded to a grid of `resolution`
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector = vector / (np.linalg.norm(vector) or 1.0)
+    levels = np.rint(vector / (resolution or SIMILARITY_CACHE_RESOLUTION)).astype(np.int16)
+    return hashlib.sha256(levels.tobytes()).hexdigest()
+
+
+class SimilarityCache:
+    """
+    LRU of search results per user, with TTL expiry and per-user invalidation
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = SIMILARITY_CACHE_TTL if ttl is None else ttl
+        self.max_size = max_size or SIMILARITY_CACHE_SIZE
+        self._users = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def generation(self, user_id):
+        """
+        Pass to put(): results computed before a later invalidation are not stored
+        """
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, user_id, key):
+        with self._lock:
+            entries = self._users.get(user_id)
+            entry = entries.get(key) if entries else None
+            if entry and time.monotonic() - entry[1] <= self.ttl:
+                entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generations.get(user_id, 0):
+                return
+            entries = self._users.setdefault(user_id, OrderedDict())
+            entries[key] = (value, time.monotonic())
+            entries.move_to_end(key)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """
+        Drop every cached result of a user whose history changed
+        """
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            if self._users.pop(user_id, None):
+                self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'similarity_cache_hits': self.hits,
+            'similarity_cache_misses': self.misses,
+            'similarity_cache_hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'similarity_cache_invalidations': self.invalidations,
+            'similarity_cache_users': len(self._users),
+            'similarity_cache_entries': sum(len(entries) for entries in self._users.values()),
+        }
+
+
+similarity_cache = SimilarityCache()
@@ -0,0 +1,103 @@
+"""
+Singleflight coalescing of identical in-flight categorization requests.
+
+Rows of one user that share a canonical merchant and amount bucket (many
+NYCT PAYGO rows, or the same merchant in two of the user's uploads at once)
+only need one LLM categorization. Keys include the user because the answer
+is built from that user's history (kNN context and get_historical_context),
+so it must never be written onto another user's rows. The first caller for
+a key becomes its leader and does the work. Concurrent callers await the
+leader's future. A finished result is stored in a short-lived in-memory
+cache so later rows are answered directly.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CATEGORIZATION_CACHE_TTL = int(os.environ.get("CATEGORIZATION_CACHE_TTL", 3600))
+CATEGORIZATION_CACHE_SIZE = int(os.environ.get("CATEGORIZATION_CACHE_SIZE", 10000))
+
+
+def amount_bucket(cents):
+    """
+    Power-of-two amount band, signed: 200 and 250 cents share a bucket (128-255), 290 does not
+    """
+    cents = int(cents or 0)
+    if cents == 0:
+        return 0
+    band = abs(cents).bit_length()
+    return band if cents > 0 else -band
+
+
+def flight_key(user_id, transaction):
+    """
+    Coalescing key for a user's transaction: user, canonical merchant and amount bucket
+    """
+    merchant = transaction.get('merchant_key') or transaction.get('merchant') or ''
+    return f"{user_id}|{merchant}|{amount_bucket(transaction.get('amount_cents'))}"
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries expire after `ttl` seconds
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = CATEGORIZATION_CACHE_TTL if ttl is None else ttl
+        self.max_size = max_size or CATEGORIZATION_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class SingleFlight:
+    """
+    Map of in-flight keys to the future their leader will resolve
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self._inflight = {}
+
+    def claim(self, key):
+        """
+        Return (future, is_leader). The leader must later call resolve(key, ...)
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            return future, False
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future, True
+
+    def resolve(self, key, value):
+        """
+        Hand the leader's result to every waiter and, if usable, to the cache
+        """
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+        if value is not None and self.cache is not None:
+            self.cache.put(key, value)
@@ -0,0 +1,86 @@
+"""
+Size, recall and search time of compact embedding formats (see embedding_codec.py).
+
+Each float32/float16/int8 format and truncated dimension is compared with the
+full float32 vectors. The stored vectors are round-tripped through
+pack/unpack, and queries are truncated as create_embeddings does. The script
+reports bytes per vector on the wire (JSON list vs bytea hex literal), the
+top-k recall against exact float32 search, and the in-memory index size and
+search time. Run from backend/ on a user's stored embeddings (these must
+still have been written as float32, 1024-dimension vectors), or on synthetic
+clustered vectors. Synthetic vectors spread their energy evenly over all
+dimensions, so their truncation recall is a lower bound:
+
+    python testing/benchmark_embedding_codec.py [user_id]
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_codec import EmbeddingCodec
+from benchmark_vector_index import clustered_vectors, percentile_ms
+
+
+def load_vectors(user_id=None, n=5000, dim=1024):
+    if user_id is None:
+        return clustered_vectors(n, dim, clusters=max(8, n // 50))
+    from database import iter_embedding_rows, parse_embedding
+    # The full pgvector column, whatever EMBEDDING_FORMAT/EMBEDDING_DIMENSIONS are set to
+    embeddings = (parse_embedding((row.get('embedding_vectors') or row).get('embedding'))
+                  for row in iter_embedding_rows(user_id, raise_errors=True))
+    return np.asarray([embedding for embedding in embeddings if embedding is not None], dtype=np.float32)
+
+
+def top_k(data, queries, k):
+    sims = queries @ data.T
+    return [set(np.argpartition(-row, k - 1)[:k].tolist()) for row in sims]
+
+
+def run(vectors, k=5, query_fraction=0.1, formats=('float32', 'float16', 'int8'), dimensions=(0, 768, 512, 256)):
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    n_queries = max(1, int(len(vectors) * query_fraction))
+    queries, data = vectors[order[:n_queries]], vectors[order[n_queries:]]
+    truth = top_k(data, queries, k)
+
+    report = {'vectors': len(data), 'queries': n_queries, 'dim': vectors.shape[1], 'k': k,
+              'json_bytes_per_vector': int(np.mean([len(json.dumps(v.tolist())) for v in data[:100]])),
+              'formats': {}}
+    for format in formats:
+        for dims in dimensions:
+            if dims and dims >= vectors.shape[1]:
+                continue
+            codec = EmbeddingCodec(format, dims)
+            packed = [codec.pack(v) for v in data]
+            stored = np.stack([codec.unpack(p) for p in packed])
+            # As a VECTOR_INDEX_DTYPE=float16 local index would hold the quantized vectors
+            stored = stored.astype(np.float32 if format == 'float32' else np.float16)
+            compact_queries = codec.compact(queries)
+
+            times, found = [], []
+            for query in compact_queries:
+                t = time.perf_counter()
+                # As IVFIndex.search does: widen the scanned rows to float32 (numpy has no fast float16 matmul)
+                sims = np.asarray(stored, dtype=np.float32) @ query
+                found.append(set(np.argpartition(-sims, k - 1)[:k].tolist()))
+                times.append(time.perf_counter() - t)
+            recall = sum(len(f & t) for f, t in zip(found, truth)) / (k * n_queries)
+            report['formats'][f"{format}/{dims or vectors.shape[1]}"] = {
+                'packed_bytes_per_vector': len(packed[0]),
+                'bytea_hex_bytes_per_vector': len(codec.to_bytea(data[0])),
+                'index_mb': round(stored.nbytes / 2 ** 20, 2),
+                'recall_at_k': round(recall, 4),
+                'search_p50_ms': percentile_ms(times, 50),
+            }
+    return report
+
+
+if __name__ == "__main__":
+    user_id = sys.argv[1] if len(sys.argv) > 1 else None
+    print(json.dumps(run(load_vectors(user_id)), indent=2))
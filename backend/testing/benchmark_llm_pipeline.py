@@ -0,0 +1,77 @@
+"""
+Benchmark the LLM categorization path against the offline FakeModel.
+
+Runs a synthetic statement through CategorizationPipeline, the code
+pdf_handler uses: batched categorization, then fast-mode retries for the
+rows a batch did not answer, all on an LLMExecutor with the rate-limited
+model. There is no agent fallback, since the agent needs the full smolagents
+stack. It reports wall time, our own CPU time and per-mode usage, so prompt
+building, response parsing and scheduling overhead can be measured without
+network access. Run from backend/:
+
+    python testing/benchmark_llm_pipeline.py 500
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_model import FakeModel
+from llm_cache import CachedModel, ResponseCache
+from llm_executor import LLMExecutor
+from llm_pipeline import CategorizationPipeline, new_mode_usage
+
+MERCHANTS = [
+    'NYCT PAYGO', 'INSTACART COSTCO', 'NETFLIX.COM', 'CON ED OF NY', 'WHOLE FOODS MARKET',
+    'ROBINHOOD', 'SPOTIFY USA', 'AUTOPAY PAYMENT - THANK YOU', 'SHELL OIL', 'AMAZON MKTPLACE',
+]
+
+
+def synthetic_statement(rows, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'date': f"2025-01-{rng.randint(1, 28):02d}",
+        'merchant': f"{rng.choice(MERCHANTS)} #{rng.randint(100, 999)}",
+        'amount': f"{rng.uniform(1, 300):.2f}",
+        'card': 'AMEX',
+    } for _ in range(rows)]
+
+
+async def run(rows, latency, errors, concurrency):
+    executor = LLMExecutor(concurrency=concurrency, requests_per_minute=60 * 1000, burst=concurrency)
+    model = CachedModel(
+        executor.rate_limited(FakeModel(latency=latency, errors=errors)),
+        cache=ResponseCache(path=":memory:"), bypass=True, prompt_caching=True
+    )
+    pipeline = CategorizationPipeline(model, executor)
+    usage = new_mode_usage()
+
+    transactions = synthetic_statement(rows)
+    wall, cpu = time.perf_counter(), time.process_time()
+    analyses = await pipeline.categorize_transactions(transactions, usage=usage)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    return {
+        'rows': rows,
+        'categorized': sum(a is not None for a in analyses),
+        'retried_individually': usage['fast'].runs,
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(cpu, 3),
+        'llm_call_seconds': round(sum(u.seconds for u in usage.values()), 3),
+        'usage': {mode: u.as_dict() for mode, u in usage.items()},
+    }
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    result = asyncio.run(run(
+        rows,
+        latency=float(os.environ.get("FAKE_LLM_LATENCY", 0.2)),
+        errors=os.environ.get("FAKE_LLM_ERRORS", "rate_limit:0.02,malformed:0.05"),
+        concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 4)),
+    ))
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,80 @@
+"""
+Recall and latency of the local IVF vector index against exact brute-force search.
+
+Builds an index from synthetic clustered unit vectors (transactions of one
+merchant embed close together), inserting them one at a time as
+store_embedding does. It then compares top-k results and query latency with
+IVFIndex.search_exact. Run from backend/:
+
+    python testing/benchmark_vector_index.py 20000
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import IVFIndex
+
+
+def clustered_vectors(n, dim, clusters, spread=0.8, seed=0):
+    """
+    Unit vectors around cluster centers that share a common direction, like
+    sentence embeddings (whose pairwise cosine similarity is rarely near 0)
+    """
+    rng = np.random.default_rng(seed)
+    unit = lambda A: A / np.linalg.norm(A, axis=-1, keepdims=True)
+    common = unit(rng.standard_normal(dim).astype(np.float32))
+    centers = unit(common + 0.6 * unit(rng.standard_normal((clusters, dim)).astype(np.float32)))
+    noise = unit(rng.standard_normal((n, dim)).astype(np.float32))
+    return unit(centers[rng.integers(clusters, size=n)] + spread * noise)
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def run(n, dim=1024, queries=200, k=5, n_probes=(1, 4, 8, 16)):
+    X = clustered_vectors(n + queries, dim, clusters=max(8, n // 50))
+    data, Q = X[:n], X[n:]
+    index = IVFIndex(tempfile.mkdtemp(), dim)
+    start = time.perf_counter()
+    for row, vector in enumerate(data):
+        index.add(row, vector, {'row': row})
+    build_seconds = time.perf_counter() - start
+
+    exact, exact_times = [], []
+    for q in Q:
+        t = time.perf_counter()
+        exact.append({row for row, _ in index.search_exact(q, k)})
+        exact_times.append(time.perf_counter() - t)
+
+    report = {
+        'vectors': n, 'dim': dim, 'k': k,
+        'lists': 0 if index.centroids is None else len(index.centroids),
+        'build_seconds': round(build_seconds, 3),
+        'exact': {'p50_ms': percentile_ms(exact_times, 50), 'p99_ms': percentile_ms(exact_times, 99)},
+        'ivf': {},
+    }
+    for n_probe in n_probes:
+        hits, times = 0, []
+        for q, truth in zip(Q, exact):
+            t = time.perf_counter()
+            found = {row for row, _ in index.search(q, k, n_probe=n_probe)}
+            times.append(time.perf_counter() - t)
+            hits += len(found & truth)
+        report['ivf'][f"nprobe={n_probe}"] = {
+            'recall_at_k': round(hits / (k * len(Q)), 4),
+            'p50_ms': percentile_ms(times, 50),
+            'p99_ms': percentile_ms(times, 99),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(json.dumps(run(n), indent=2))
@@ -0,0 +1,60 @@
+"""
+EXPLAIN check that get_user_transactions is served by the (user_id, date) index.
+
+Builds the exact query get_user_transactions runs and asks PostgREST for its
+plan with .explain(). This needs plans to be enabled for the API role
+(ALTER ROLE authenticator SET pgrst.db_plan_enabled TO true; NOTIFY pgrst,
+'reload config'). Prints the plan's node types and indexes, and exits
+non-zero when transactions is read by a sequential scan. Postgres may still
+prefer a sequential scan on a tiny table, so check against realistic data.
+Run from backend/:
+
+    python testing/explain_user_transactions.py <user_id> <month> <year> [category] [card]
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import user_transactions_query
+
+EXPECTED_INDEXES = {'transactions_user_date_idx', 'transactions_user_category_idx', 'transactions_user_card_idx'}
+
+
+def plan_nodes(plan):
+    """
+    Every node of a JSON EXPLAIN plan, depth first
+    """
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def check(user_id, month, year, category=None, card=None):
+    result = user_transactions_query(user_id, month, year, category, card) \
+        .explain(analyze=True, format="json") \
+        .execute()
+    plan = result.data if isinstance(result.data, list) else json.loads(result.data)
+    nodes = [
+        {'node': node.get('Node Type'), 'relation': node.get('Relation Name'), 'index': node.get('Index Name')}
+        for node in plan_nodes(plan[0]['Plan'])
+    ]
+    seq_scan = any(n['node'] == 'Seq Scan' and n['relation'] == 'transactions' for n in nodes)
+    indexed = any(n['index'] in EXPECTED_INDEXES for n in nodes)
+    return {
+        'nodes': nodes,
+        'execution_ms': plan[0].get('Execution Time'),
+        'uses_index': indexed,
+        'seq_scan': seq_scan,
+        'ok': indexed and not seq_scan,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(2)
+    report = check(*sys.argv[1:6])
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report['ok'] else 1)
@@ -0,0 +1,44 @@
+import ast
+import glob
+import importlib.util
+import os
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = sorted(glob.glob(os.path.join(BACKEND, "testing", "benchmark_*.py")))
+
+
+def module_names(path):
+    """
+    Top-level names a module defines or imports
+    """
+    names = set()
+    for node in ast.parse(open(path).read()).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names.update(n.id for target in targets for n in ast.walk(target) if isinstance(n, ast.Name))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+    return names
+
+
+@pytest.mark.parametrize("path", BENCHMARKS, ids=os.path.basename)
+def test_benchmark_imports(path):
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+
+
+@pytest.mark.parametrize("path", BENCHMARKS, ids=os.path.basename)
+def test_benchmark_backend_helpers_exist(path):
+    # Also covers imports inside functions, whose modules (database) need services to import
+    for node in ast.walk(ast.parse(open(path).read())):
+        if not isinstance(node, ast.ImportFrom):
+            continue
+        for directory in (BACKEND, os.path.dirname(path)):
+            source = os.path.join(directory, f"{node.module}.py")
+            if os.path.exists(source):
+                missing = {alias.name for alias in node.names} - module_names(source)
+                assert not missing, f"{node.module} has no {', '.join(sorted(missing))}"
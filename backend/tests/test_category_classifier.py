@@ -0,0 +1,70 @@
+import numpy as np
+
+import category_classifier
+from category_classifier import CentroidClassifier, ClassifierStore
+
+
+def clusters(n, dim=16, seed=0, noise=0.05):
+    """
+    n noisy samples around each of two orthogonal directions, labeled Grocery and Fun
+    """
+    rng = np.random.default_rng(seed)
+    centers = np.eye(dim)[:2]
+    X = np.vstack([center + noise * rng.standard_normal((n, dim)) for center in centers])
+    return X, ['Grocery'] * n + ['Fun'] * n
+
+
+def test_sparse_category_is_not_confident():
+    clf = CentroidClassifier(categories=['Grocery', 'Fun', 'Housing'])
+    X, y = clusters(1)
+    clf.partial_fit(X[:1], y[:1])
+    category, probability = clf.predict(X[0])
+    assert category == 'Grocery'
+    assert probability <= 0.5
+
+
+def test_well_sampled_category_is_confident():
+    clf = CentroidClassifier(categories=['Grocery', 'Fun', 'Housing'])
+    X, y = clusters(100)
+    clf.partial_fit(X, y)
+    clf.calibrate(X, y)
+    category, probability = clf.predict(X[0])
+    assert category == 'Grocery'
+    assert probability > 0.9
+    assert np.allclose(clf.predict_proba(X).sum(axis=1), 1.0)
+
+
+def test_incremental_learning_is_recalibrated(tmp_path):
+    store = ClassifierStore(directory=str(tmp_path))
+    X, y = clusters(40)
+    store.learn_batch('user', X, y)
+    clf = store.get('user')
+    assert clf.uncalibrated == len(y)
+    store.save('user')
+    assert clf.uncalibrated == 0
+    reference = CentroidClassifier().partial_fit(X, y)
+    assert clf.temperature == reference.calibrate(X, y)
+    loaded = CentroidClassifier.load(store._path('user'))
+    assert len(loaded.recent_labels) == len(y)
+
+
+def test_correction_moves_sample_out_of_calibration_window():
+    clf = CentroidClassifier(categories=['Grocery', 'Fun'])
+    X, y = clusters(3)
+    clf.partial_fit(X, y)
+    clf.partial_fit(X[:1], ['Grocery'], weight=-1.0)
+    clf.partial_fit(X[:1], ['Fun'])
+    assert list(clf.counts) == [2, 4]
+    assert list(clf.recent_labels).count(0) == 2
+
+
+def test_for_user_requires_min_samples(tmp_path, monkeypatch):
+    monkeypatch.setattr(category_classifier, 'CLASSIFIER_MIN_SAMPLES', 10)
+    store = ClassifierStore(directory=str(tmp_path))
+    X, y = clusters(2)
+    store.learn_batch('user', X, y)
+    assert store.for_user('user') is None
+    store.learn_batch('other', *clusters(4, seed=1))
+    assert store.for_user('user') is store.get('global')
+    store.learn_batch('user', *clusters(3, seed=2))
+    assert store.for_user('user') is store.get('user')
@@ -0,0 +1,31 @@
+import numpy as np
+
+from embedding_cache import DiskVectorStore
+
+
+def key(i):
+    return f"{i:064d}".encode()
+
+
+def test_full_store_evicts_least_recently_used_in_batches(tmp_path, monkeypatch):
+    import embedding_cache
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr(embedding_cache.time, 'time', lambda: float(next(clock)))
+    store = DiskVectorStore(str(tmp_path / "model"), 4, 128)
+    for i in range(128):
+        store.put(key(i), np.full(4, i))
+    store.get(key(0))
+    store.put(key(128), np.full(4, 128))
+    assert store.evictions == store.evict_batch == 2
+    assert store.get(key(0)) is not None and store.get(key(128)) is not None
+    assert store.get(key(1)) is None and store.get(key(2)) is None
+    assert len(store.slots) == 127
+
+
+def test_concurrent_stores_claim_separate_directories(tmp_path):
+    first = DiskVectorStore(str(tmp_path / "model"), 4, 8)
+    second = DiskVectorStore(str(tmp_path / "model"), 4, 8)
+    assert first.directory != second.directory
+    first.put(key(1), np.ones(4))
+    first.flush()
+    assert second.get(key(1)) is None
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+from llm_executor import LLMExecutor
+
+
+class CountingModel:
+    model_id = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, messages, **kwargs):
+        self.calls += 1
+        return "ok"
+
+
+def test_rate_limit_is_charged_per_model_call():
+    executor = LLMExecutor(concurrency=2, requests_per_minute=60, burst=3)
+    model = executor.rate_limited(CountingModel())
+
+    def agent_run(steps):
+        for _ in range(steps):
+            model([])
+        return steps
+
+    assert asyncio.run(executor.call(agent_run, 3)) == 3
+    assert model.calls == 3
+    assert executor.limiter.tokens < 1
+
+
+def test_cancelled_call_holds_its_slot_until_the_thread_returns():
+    executor = LLMExecutor(concurrency=1, requests_per_minute=60, burst=1, retries=0)
+    started, release = threading.Event(), threading.Event()
+
+    def provider_call():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    async def scenario():
+        task = asyncio.create_task(executor.call(provider_call))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        held = executor._semaphore.locked()
+        release.set()
+        while executor._semaphore.locked():
+            await asyncio.sleep(0.01)
+        return held
+
+    assert asyncio.run(scenario())
@@ -0,0 +1,28 @@
+import pytest
+
+from money import parse_cents, to_cents
+
+
+@pytest.mark.parametrize("value, cents", [
+    ("$1,234.56", 123456),
+    ("(12.00)", -1200),
+    ("-0.5", -50),
+    ("-$620.00", -62000),
+    ("620.00-", -62000),
+    ("2.9", 290),
+    ("2.995", 300),
+    ("2.994", 299),
+    (0.125, 13),
+    (41, 4100),
+])
+def test_parse_cents(value, cents):
+    assert parse_cents(value) == cents
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize("value", ["", None, "abc", "$", "1.2.3", True])
+def test_unparseable_amounts(value):
+    with pytest.raises(ValueError):
+        parse_cents(value)
+    assert to_cents(value) == 0
+    assert to_cents(value, default=None) is None
@@ -0,0 +1,50 @@
+from categorization import BATCH_INSTRUCTIONS, batch_prompt_parts, fast_prompt_parts
+from fake_model import FakeModel
+from llm_cache import CachedModel, ResponseCache
+from llm_usage import cache_token_counts
+from prompt_caching import (
+    MIN_CACHEABLE_TOKENS, PrefixCacheStandIn, estimate_tokens, prompt_messages, with_cache_control
+)
+
+TRANSACTION = {'date': '2025-01-02', 'merchant': 'NETFLIX.COM', 'amount': '15.49', 'card': 'AMEX'}
+
+
+def test_short_static_prefixes_are_not_cached():
+    model = CachedModel(FakeModel(latency=0), cache=ResponseCache(path=":memory:"), bypass=True, prompt_caching=True)
+    for index in range(2):
+        response = model(prompt_messages(*batch_prompt_parts([(index, TRANSACTION)])))
+    assert estimate_tokens(BATCH_INSTRUCTIONS) < MIN_CACHEABLE_TOKENS
+    assert cache_token_counts(response) == (0, 0)
+
+
+def test_stand_in_ignores_prefixes_below_the_minimum():
+    model = PrefixCacheStandIn(min_tokens=1024)
+    messages = with_cache_control(prompt_messages("Short instructions.", "Transaction: 1"), prefixes=[])
+    model(messages)
+    model(messages)
+    assert [(call['cache_read'], call['cache_write']) for call in model.calls] == [(0, 0), (0, 0)]
+
+
+def test_stand_in_reads_a_long_prefix_back():
+    model = PrefixCacheStandIn(min_tokens=64)
+    prefix, _ = fast_prompt_parts(TRANSACTION)
+    for suffix in ("Transaction: 1", "Transaction: 2"):
+        model(with_cache_control(prompt_messages(prefix, suffix), prefixes=[]))
+    first, second = model.calls
+    assert first['cache_read'] == 0 and first['cache_write'] >= 64
+    assert second['cache_read'] == first['cache_write'] and second['cache_write'] == 0
+
+
+def test_fake_model_bills_batch_prompts_as_cached():
+    fake = FakeModel(latency=0, prompt_cache=PrefixCacheStandIn(min_tokens=64))
+    model = CachedModel(fake, cache=ResponseCache(path=":memory:"), bypass=True, prompt_caching=True)
+    responses = [model(prompt_messages(*batch_prompt_parts([(index, TRANSACTION)]))) for index in range(2)]
+    (_, written), (read, _) = (cache_token_counts(response) for response in responses)
+    assert written >= 64
+    assert read == written
+
+
+def test_breakpoints_follow_the_model_id_by_default():
+    cache = ResponseCache(path=":memory:")
+    assert not CachedModel(FakeModel(), cache=cache).prompt_caching
+    assert CachedModel(PrefixCacheStandIn(model_id="anthropic/claude-sonnet"), cache=cache).prompt_caching
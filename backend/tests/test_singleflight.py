@@ -0,0 +1,48 @@
+import asyncio
+
+from singleflight import SingleFlight, TTLCache, amount_bucket, flight_key
+
+
+def test_amount_bucket_bands():
+    assert amount_bucket(200) == amount_bucket(250) == 8
+    assert amount_bucket(290) == 9
+    assert amount_bucket(0) == 0
+    assert amount_bucket(-250) == -8
+
+
+def test_flight_key_is_per_user():
+    transaction = {'merchant_key': 'NYCT PAYGO', 'amount_cents': 290}
+    assert flight_key('alice', transaction) != flight_key('bob', transaction)
+    assert flight_key('alice', transaction) == flight_key('alice', {**transaction, 'amount_cents': 300})
+
+
+def test_ttl_cache_expires_and_evicts(monkeypatch):
+    import singleflight
+    clock = [100.0]
+    monkeypatch.setattr(singleflight.time, 'monotonic', lambda: clock[0])
+    cache = TTLCache(ttl=10, max_size=2)
+    cache.put('a', 1)
+    clock[0] += 11
+    assert cache.get('a') is None
+    cache = TTLCache(ttl=60, max_size=2)
+    for key in 'abc':
+        cache.put(key, key)
+    assert cache.get('a') is None
+    assert cache.get('c') == 'c'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_single_flight_followers_get_leaders_result():
+    async def run():
+        flight = SingleFlight(cache=TTLCache(ttl=60))
+        future, leader = flight.claim('k')
+        follower_future, follower_leader = flight.claim('k')
+        assert leader and not follower_leader and follower_future is future
+        flight.resolve('k', {'category': 'Transport'})
+        assert await follower_future == {'category': 'Transport'}
+        assert flight.cache.get('k') == {'category': 'Transport'}
+        # A failed leader releases waiters with None and caches nothing
+        future, _ = flight.claim('x')
+        flight.resolve('x', None)
+        assert await future is None and flight.cache.get('x') is None
+    asyncio.run(run())
@@ -0,0 +1,29 @@
+import numpy as np
+
+from vector_index import IVFIndex, VectorIndexStore
+
+
+def test_each_store_claims_its_own_directory(tmp_path):
+    first = VectorIndexStore(directory=str(tmp_path), dim=4)
+    second = VectorIndexStore(directory=str(tmp_path), dim=4)
+    assert first.directory != second.directory
+    first.build('user', [('t1', np.eye(4)[0], {'category': 'Fun'}, None)])
+    assert first.exists('user') and not second.exists('user')
+
+
+def test_sync_position_only_moves_forward(tmp_path):
+    store = VectorIndexStore(directory=str(tmp_path), dim=4)
+    index = store.build('user', [('t1', np.eye(4)[0], {'category': 'Fun'}, None)],
+                        '2025-01-02T00:00:00.000000+00:00')
+    index.set_synced_through('2025-01-01T00:00:00.000000+00:00')
+    index.set_synced_through(None)
+    assert IVFIndex(index.directory, 4).synced_through == '2025-01-02T00:00:00.000000+00:00'
+
+
+def test_relabeled_row_is_not_indexed_until_applied(tmp_path):
+    index = IVFIndex(str(tmp_path), 4)
+    index.add('t1', np.eye(4)[0], {'category': 'Fun'})
+    assert index.indexed('t1', {'category': 'Fun'})
+    assert not index.indexed('t1', {'category': 'Grocery'})
+    index.add('t1', np.eye(4)[0], {'category': 'Grocery'})
+    assert index.search(np.eye(4)[0], category='Grocery')[0][0] == 0
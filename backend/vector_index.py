@@ -0,0 +1,436 @@
+"""
+Local per-user approximate nearest-neighbour index over transaction embeddings.
+
+Historical-context lookups used to send a 1024-dimension vector to a Supabase
+RPC that searched every user's transactions. Each user now gets an IVF
+(inverted file) index on local disk instead:
+
+    <directory>/<user_id>/vectors.f32     memory-mapped unit vectors, grown by doubling
+                                          (vectors.f16 when stored as float16)
+    <directory>/<user_id>/lists.i32       memory-mapped inverted-list id of every vector
+    <directory>/<user_id>/centroids.npy   inverted-list centroids (spherical k-means)
+    <directory>/<user_id>/metadata.jsonl  append-only log of {row, transaction_id, metadata, key}
+    <directory>/<user_id>/sync.json       latest transaction_embeddings updated_at the index has seen
+
+A search scores the query against the centroids, then scans only the vectors
+of the IVF_NPROBE closest lists. Indexes smaller than IVF_MIN_TRAIN vectors
+are scanned exhaustively. Inserts are incremental. New vectors join their
+nearest list, and the centroids are retrained whenever the index has doubled
+since the last training.
+
+Rows are also partitioned by their metadata category and card. A category or
+card filter is applied before any scoring, and only the matching partition is
+scanned. Running per-category sums give category centroids. With
+`category_probe`, an unfiltered query is narrowed to the partitions of its
+closest categories.
+
+Vectors are content-addressed. Transactions whose embedded text has the same
+content key (see database.store_embedding) share one row and are kept as
+that row's references. The search space therefore only grows with distinct
+notes, and a match returns its most recent SIMILARITY_MAX_REFERENCES
+referencing transactions.
+
+The memmaps and metadata logs are written by one process only. Like the
+embedding cache, a store claims its directory with claim_directory, so each
+uvicorn worker keeps its own indexes and catches them up from the database.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+
+from embedding_cache import claim_directory
+
+VECTOR_INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR", "model_cache/vector_index")
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", 8))
+IVF_MIN_TRAIN = int(os.environ.get("IVF_MIN_TRAIN", 1024))
+IVF_KMEANS_ITERATIONS = 10
+SIMILARITY_MAX_REFERENCES = int(os.environ.get("SIMILARITY_MAX_REFERENCES", 3))
+PARTITION_FIELDS = ('category', 'card')
+
+
+def _normalize(X):
+    X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.where(norms == 0, 1.0, norms)
+
+
+def spherical_kmeans(X, n_lists, iterations=IVF_KMEANS_ITERATIONS, seed=0):
+    """
+    Unit-norm centroids of X (rows already normalized) by cosine k-means
+    """
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(X @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, X)
+        empty = ~np.bincount(labels, minlength=n_lists).astype(bool)
+        # Re-seed empty lists with random points so every list stays in use
+        sums[empty] = X[rng.choice(len(X), size=int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    One user's IVF index, persisted under `directory`, storing vectors as `dtype`
+    """
+
+    def __init__(self, directory, dim, dtype=np.float32):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.vectors_file = "vectors.f16" if self.dtype == np.float16 else "vectors.f32"
+        self.count = 0
+        # Per row: metadata of its latest reference, content key and {transaction_id: metadata}
+        self.metadata = []
+        self.keys = []
+        self.references = []
+        self.rows = {}
+        self.key_rows = {}
+        self.centroids = None
+        self.trained_count = 0
+        self._lists = {}
+        self._list_arrays = {}
+        # (field, value) -> rows, and per-category vector sums for category centroids
+        self._partitions = {}
+        self._category_sums = {}
+        # Latest database updated_at reflected here, and when this process last caught up
+        self.synced_through = None
+        self.synced_at = 0.0
+        self._lock = threading.RLock()
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _map(self, capacity, mode):
+        self.capacity = capacity
+        self.vectors = np.memmap(self._path(self.vectors_file), dtype=self.dtype, mode=mode, shape=(capacity, self.dim))
+        self.assignments = np.memmap(self._path("lists.i32"), dtype=np.int32, mode=mode, shape=(capacity,))
+
+    def _load(self):
+        log = self._path("metadata.jsonl")
+        if os.path.exists(log):
+            with open(log) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # Torn final write
+                    row, key = record['row'], record.get('key')
+                    if row == len(self.metadata):
+                        self.metadata.append(None)
+                        self.keys.append(key)
+                        self.references.append({})
+                        if key is not None:
+                            self.key_rows[key] = row
+                    self.metadata[row] = record['metadata']
+                    self.references[row][record.get('transaction_id')] = record['metadata']
+                    self.rows[record.get('transaction_id')] = row
+        self.count = len(self.metadata)
+        vectors = self._path(self.vectors_file)
+        if os.path.exists(vectors):
+            self._map(os.path.getsize(vectors) // (self.dtype.itemsize * self.dim), "r+")
+        else:
+            self._map(1024, "w+")
+        if os.path.exists(self._path("centroids.npy")):
+            self.centroids = np.load(self._path("centroids.npy"))
+            self.trained_count = self.count
+            for row in range(self.count):
+                self._lists.setdefault(int(self.assignments[row]), []).append(row)
+        for row in range(self.count):
+            self._partition(row, None, self.metadata[row])
+        if os.path.exists(self._path("sync.json")):
+            with open(self._path("sync.json")) as f:
+                self.synced_through = json.load(f).get('synced_through')
+
+    def set_synced_through(self, synced_through):
+        """
+        Record the latest database updated_at (an ISO timestamp) reflected in the index
+        """
+        with self._lock:
+            if synced_through and (self.synced_through is None or synced_through > self.synced_through):
+                self.synced_through = synced_through
+            self.vectors.flush()
+            with open(self._path("sync.json"), "w") as f:
+                json.dump({'synced_through': self.synced_through}, f)
+
+    def _grow(self):
+        self.vectors.flush()
+        self.assignments.flush()
+        capacity = self.capacity * 2
+        for name, itemsize in ((self.vectors_file, self.dtype.itemsize * self.dim), ("lists.i32", 4)):
+            with open(self._path(name), "r+b") as f:
+                f.truncate(capacity * itemsize)
+        self._map(capacity, "r+")
+
+    def _log(self, row, transaction_id, metadata, key=None):
+        record = {'row': row, 'transaction_id': transaction_id, 'metadata': metadata}
+        if key is not None:
+            record['key'] = key
+        with open(self._path("metadata.jsonl"), "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+    def add(self, transaction_id, embedding, metadata, key=None):
+        """
+        Insert one vector, or add the transaction as another reference of the row
+        with the same content `key`, or replace the metadata of an already indexed transaction
+        """
+        with self._lock:
+            if transaction_id is not None and transaction_id in self.rows:
+                return self.update_metadata(transaction_id, metadata)
+            if key is not None and key in self.key_rows:
+                row = self.key_rows[key]
+                self.rows[transaction_id] = row
+                return self.update_metadata(transaction_id, metadata)
+            if self.count == self.capacity:
+                self._grow()
+            row = self.count
+            vector = _normalize(embedding)[0]
+            self.vectors[row] = vector
+            if self.centroids is not None:
+                self._assign(row, int(np.argmax(self.centroids @ vector)))
+            self.vectors.flush()
+            self._log(row, transaction_id, metadata, key)
+            self.metadata.append(metadata)
+            self.keys.append(key)
+            self.references.append({transaction_id: metadata})
+            self.rows[transaction_id] = row
+            if key is not None:
+                self.key_rows[key] = row
+            self.count += 1
+            self._partition(row, None, metadata)
+            if self.count >= max(IVF_MIN_TRAIN, 2 * self.trained_count):
+                self.train()
+            return row
+
+    def indexed(self, transaction_id, metadata):
+        """
+        Whether the transaction is already indexed with this metadata
+        """
+        with self._lock:
+            row = self.rows.get(transaction_id)
+            return row is not None and self.references[row].get(transaction_id) == metadata
+
+    def update_metadata(self, transaction_id, metadata):
+        with self._lock:
+            row = self.rows.get(transaction_id)
+            if row is None:
+                return None
+            if self.references[row].get(transaction_id) == metadata:
+                return row  # Already indexed as is, e.g. seen again while catching up
+            self._partition(row, self.metadata[row], metadata)
+            self.metadata[row] = metadata
+            self.references[row][transaction_id] = metadata
+            self._log(row, transaction_id, metadata)
+            return row
+
+    def referencing(self, row, limit=None):
+        """
+        Metadata of the transactions referencing a row, most recent first
+        """
+        references = list(self.references[row].values())[::-1]
+        return references[:limit] if limit else references
+
+    def _partition(self, row, old, new):
+        """
+        Move a row between metadata partitions when its category or card changes
+        """
+        old, new = old or {}, new or {}
+        for field in PARTITION_FIELDS:
+            before, after = old.get(field), new.get(field)
+            if before == after and old:
+                continue
+            if before is not None:
+                self._partitions.get((field, before), set()).discard(row)
+            if after is not None:
+                self._partitions.setdefault((field, after), set()).add(row)
+            if field == 'category':
+                vector = np.asarray(self.vectors[row], dtype=np.float64)
+                if before is not None and before in self._category_sums:
+                    self._category_sums[before] -= vector
+                if after is not None:
+                    self._category_sums[after] = self._category_sums.get(after, 0.0) + vector
+
+    def nearest_categories(self, embedding, n):
+        """
+        The `n` categories whose centroids are most similar to `embedding`
+        """
+        with self._lock:
+            categories = [c for c in self._category_sums if self._partitions.get(('category', c))]
+            if not categories:
+                return []
+            centroids = _normalize(np.stack([self._category_sums[c] for c in categories]))
+            order = np.argsort(-(centroids @ _normalize(embedding)[0]))
+            return [categories[i] for i in order[:n]]
+
+    def _allowed_rows(self, query, category=None, card=None, category_probe=None):
+        """
+        Rows a filtered or category-probed search may return, or None for no restriction
+        """
+        allowed = []
+        if category is not None:
+            allowed.append(self._partitions.get(('category', category), set()))
+        elif category_probe:
+            categories = self.nearest_categories(query, category_probe)
+            probed = set().union(*(self._partitions[('category', c)] for c in categories))
+            if len(probed) < self.count:
+                allowed.append(probed)
+        if card is not None:
+            allowed.append(self._partitions.get(('card', card), set()))
+        return set.intersection(*allowed) if allowed else None
+
+    def _assign(self, row, list_id):
+        self.assignments[row] = list_id
+        self._lists.setdefault(list_id, []).append(row)
+        self._list_arrays.pop(list_id, None)
+
+    def train(self):
+        """
+        Recompute the centroids (about sqrt(n) lists) and reassign every vector
+        """
+        with self._lock:
+            if self.count < IVF_MIN_TRAIN:
+                return
+            X = np.asarray(self.vectors[:self.count], dtype=np.float32)
+            n_lists = max(1, int(np.sqrt(self.count)))
+            rng = np.random.default_rng(0)
+            sample = X[rng.choice(self.count, size=min(self.count, 64 * n_lists), replace=False)]
+            self.centroids = spherical_kmeans(sample, n_lists)
+            labels = np.concatenate([
+                np.argmax(X[start:start + 4096] @ self.centroids.T, axis=1) for start in range(0, self.count, 4096)
+            ])
+            self.assignments[:self.count] = labels
+            self.assignments.flush()
+            self._lists = {}
+            self._list_arrays = {}
+            for list_id in range(n_lists):
+                self._lists[list_id] = np.flatnonzero(labels == list_id).tolist()
+            np.save(self._path("centroids.npy"), self.centroids)
+            self.trained_count = self.count
+
+    def _list_rows(self, list_id):
+        rows = self._list_arrays.get(list_id)
+        if rows is None:
+            rows = np.asarray(self._lists.get(list_id, []), dtype=np.int64)
+            self._list_arrays[list_id] = rows
+        return rows
+
+    def search(self, embedding, k=5, threshold=None, n_probe=None, category=None, card=None, category_probe=None):
+        """
+        Approximate top-k (row, similarity) pairs at or above `threshold`,
+        optionally restricted to a category and/or card partition
+        """
+        with self._lock:
+            if self.count == 0:
+                return []
+            query = _normalize(embedding)[0]
+            allowed = self._allowed_rows(query, category, card, category_probe)
+            if allowed is not None:
+                # Partitions are small: scan the matching rows exactly
+                candidates = np.fromiter(allowed, dtype=np.int64, count=len(allowed))
+            elif self.centroids is None:
+                candidates = np.arange(self.count)
+            else:
+                probe = np.argsort(-(self.centroids @ query))[:n_probe or IVF_NPROBE]
+                candidates = np.concatenate([self._list_rows(int(list_id)) for list_id in probe])
+            return self._top_k(candidates, np.asarray(self.vectors[candidates], dtype=np.float32) @ query, k, threshold)
+
+    def search_exact(self, embedding, k=5, threshold=None):
+        """
+        Brute-force top-k over every vector, the reference for recall
+        """
+        with self._lock:
+            if self.count == 0:
+                return []
+            query = _normalize(embedding)[0]
+            return self._top_k(np.arange(self.count), np.asarray(self.vectors[:self.count], dtype=np.float32) @ query,
+                               k, threshold)
+
+    @staticmethod
+    def _top_k(candidates, sims, k, threshold):
+        if len(candidates) == 0:
+            return []
+        top = np.argpartition(-sims, min(k, len(sims)) - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(int(candidates[i]), float(sims[i])) for i in top
+                if threshold is None or sims[i] >= threshold]
+
+
+class VectorIndexStore:
+    """
+    Lazily opened IVF indexes, one per user, under VECTOR_INDEX_DIR/<dim>-<dtype>
+    (or the next free <dim>-<dtype>.N another process has not claimed)
+    """
+
+    def __init__(self, directory=None, dim=1024, dtype=np.float32):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        # One directory per layout, so changing the embedding format rebuilds rather than misreads
+        self.directory, self._claim = claim_directory(
+            os.path.join(directory or VECTOR_INDEX_DIR, f"{dim}-{self.dtype.name}")
+        )
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _user_dir(self, user_id):
+        return os.path.join(self.directory, str(user_id))
+
+    def exists(self, user_id):
+        return user_id in self._indexes or os.path.isdir(self._user_dir(user_id))
+
+    def build(self, user_id, rows, synced_through=None):
+        """
+        Build a user's index from (transaction_id, embedding, metadata, key) rows in a
+        staging directory and move it into place only once it is complete, so a
+        failed or concurrent build never leaves a partial index behind
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{user_id}-", dir=self.directory)
+        try:
+            index = IVFIndex(staging, self.dim, self.dtype)
+            for transaction_id, embedding, metadata, key in rows:
+                index.add(transaction_id, embedding, metadata, key=key)
+            index.train()
+            index.set_synced_through(synced_through)
+            del index
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        final = self._user_dir(user_id)
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            if os.path.isdir(final):
+                retired = f"{final}.retired-{uuid.uuid4().hex}"
+                os.rename(final, retired)
+                shutil.rmtree(retired, ignore_errors=True)
+            os.rename(staging, final)
+            index = IVFIndex(final, self.dim, self.dtype)
+            self._indexes[user_id] = index
+            return index
+
+    def get(self, user_id):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = IVFIndex(self._user_dir(user_id), self.dim, self.dtype)
+                self._indexes[user_id] = index
+            return index
+
+    def search(self, user_id, embedding, limit=5, match_threshold=None, max_references=None, **filters):
+        """
+        Metadata of the transactions referencing the user's `limit` most similar
+        distinct vectors, each with its 'similarity'. `filters` are category, card
+        and category_probe (see IVFIndex.search).
+        """
+        index = self.get(user_id)
+        return [{**(metadata or {}), 'similarity': similarity}
+                for row, similarity in index.search(embedding, k=limit, threshold=match_threshold, **filters)
+                for metadata in index.referencing(row, max_references or SIMILARITY_MAX_REFERENCES)]